@@ -0,0 +1,198 @@
+"""
+Time and peak memory of changelog.diff_files on millions of rows, and a check that its delta is right.
+
+Needs Linux, for the peak memory of each run (/proc/self/status).
+
+A synthetic cleaned table (film names with commas, so some lines are
+quoted, and keys with several rows at different temperatures) is the old
+file. The new file drops some rows, changes a field or two in others,
+adds rows (new keys and extra rows under existing ones) and moves a
+block of rows, as a rescrape in another order would. Then, each in a
+fresh process that reports its own peak RSS:
+
+- changelog: changelog.diff_files on the two files
+- pandas: both files read into DataFrames and joined on every column
+  with an outer merge, which finds the lines that are only in one file
+  (a modified row is one line removed and one added) but not which of
+  them are modifications
+
+The delta is checked by applying it to the old rows: the result must be
+the new rows exactly (as a multiset, since the order may change).
+
+Run from the repository root (the default 2M rows needs about 2 GB of
+free memory for the pandas comparison and the check):
+
+    python -m benchmarks.changelog --rows 2000000 --change-rate 0.01
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import changelog
+from benchmarks.corpus import DEVELOPERS, DILUTIONS, FILM_MAKERS, FILM_NAMES
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+report = {}
+if sys.argv[1] == 'changelog':
+    import changelog
+    report['summary'] = changelog.diff_files(sys.argv[2], sys.argv[3], sys.argv[4])
+else:
+    import pandas as pd
+    old = pd.read_csv(sys.argv[2], dtype=str, keep_default_na=False)
+    new = pd.read_csv(sys.argv[3], dtype=str, keep_default_na=False)
+    # Number repeated lines, so each copy needs its own partner as in the changelog
+    for df in (old, new):
+        df['n'] = df.groupby(list(df.columns), sort=False).cumcount()
+    merged = old.merge(new, how='outer', indicator=True)
+    report['summary'] = {'removed': int((merged['_merge'] == 'left_only').sum()),
+                         'added': int((merged['_merge'] == 'right_only').sum())}
+report['seconds'] = time.perf_counter() - start
+# VmHWM rather than ru_maxrss, which keeps the parent's peak across fork and exec
+with open('/proc/self/status') as f:
+    report['peak_mb'] = next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) / 1024
+print(json.dumps(report))
+'''
+
+TIMES = ['4', '5.5', '6', '6.5', '7', '7.5', '8', '9', '10', '11', '12.5', '14']
+ISOS = ['25', '50', '100', '200', '400', '800', '1600', '3200']
+TEMPERATURES = ['18.0', '20.0', '21.0', '24.0']
+
+def make_valid_table(rows, rng):
+    """A DataFrame shaped like valid_all-film-all-developer.csv, with cells as strings"""
+    films = np.array([f"{maker} {name} {i}" for i, (maker, name) in
+                      enumerate((m, n) for m in FILM_MAKERS for n in FILM_NAMES)]
+                     + [f"{FILM_MAKERS[0]} {name}, Rollfilm" for name in FILM_NAMES[:3]], dtype=object)
+    times = rng.choice(np.array(TIMES, dtype=object), rows)
+    first = np.where(rng.random(rows) < 0.05, rng.choice(np.array(TIMES, dtype=object), rows), '')
+    return pd.DataFrame({
+        'Film': rng.choice(films, rows),
+        'Developer': rng.choice(np.array(DEVELOPERS, dtype=object), rows),
+        'Dilution': rng.choice(np.array(DILUTIONS, dtype=object), rows),
+        'ASA/ISO': rng.choice(np.array(ISOS, dtype=object), rows),
+        'is_two_stage_developer': np.where(first != '', 'True', 'False'),
+        'dev_total_time': times,
+        'dev_first_stage': first,
+        'dev_second_stage': np.where(first != '', times, ''),
+        'Temperature_C': rng.choice(np.array(TEMPERATURES, dtype=object), rows)
+    })
+
+def make_new_table(old, change_rate, rng):
+    """The next version of a table: rows removed, modified and added, and a block moved; returns (new, counts)"""
+    rows = len(old)
+    changes = int(rows * change_rate)
+    picks = rng.permutation(rows)
+    removed, modified = picks[:changes], picks[changes:2 * changes]
+    new = old.copy()
+    new.loc[modified, 'dev_total_time'] = rng.choice(np.array(TIMES, dtype=object), changes)
+    # Some modified rows change temperature as well
+    both = modified[:changes // 4]
+    new.loc[both, 'Temperature_C'] = rng.choice(np.array(TEMPERATURES, dtype=object), len(both))
+    new = new.drop(index=removed)
+    # Half the added rows reuse keys that already have rows, at another temperature
+    added = make_valid_table(changes, rng)
+    existing = old.iloc[rng.integers(0, rows, changes // 2)]
+    for column in changelog.KEY_COLUMNS:
+        added.loc[:changes // 2 - 1, column] = existing[column].to_numpy()
+    new = pd.concat([new, added], ignore_index=True)
+    # Move a block of rows to the end, as a rescrape that visited pages in another order would
+    block = slice(len(new) // 3, len(new) // 2)
+    new = pd.concat([new.drop(index=new.index[block]), new.iloc[block]], ignore_index=True)
+    return new, {'removed': len(removed), 'modified': len(modified), 'added': len(added)}
+
+def read_rows(filename):
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        return next(reader), [tuple(row) for row in reader]
+
+def apply_changes(columns, rows, changes_file):
+    """Apply a delta to rows (tuples of cells), returning the resulting rows as a Counter"""
+    result = Counter(rows)
+    key_indices = [columns.index(column) for column in changelog.KEY_COLUMNS]
+    by_key = {}
+    for row in rows:
+        by_key.setdefault(tuple(row[i] for i in key_indices), []).append(row)
+
+    def values(cells):
+        return tuple(cells[column] or '' for column in columns)
+
+    with open(changes_file, 'r', encoding='utf-8') as f:
+        summary = json.loads(next(f))
+        for line in f:
+            change = json.loads(line)
+            if change['op'] == 'add':
+                result[values(change['row'])] += 1
+                continue
+            if change['op'] == 'remove':
+                old = values(change['row'])
+            elif 'old' in change:
+                old = values(change['old'])
+            else:
+                key = tuple(change['key'][column] or '' for column in changelog.KEY_COLUMNS)
+                [old] = by_key[key]
+            if result[old] < 1:
+                raise SystemExit(f"the delta changes a row that isn't there: {change}")
+            result[old] -= 1
+            if change['op'] == 'modify':
+                new = list(old)
+                for column, (before, after) in change['changes'].items():
+                    new[columns.index(column)] = after or ''
+                result[tuple(new)] += 1
+    return summary, +result
+
+def measure(target, old_file, new_file, changes_file):
+    """Run one diff in a child process, returning its report"""
+    result = subprocess.run([sys.executable, '-c', CHILD, target, old_file, new_file, changes_file],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"{target} failed (exit {result.returncode}): {result.stderr.strip()[-500:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the changelog of the cleaned data on a large table")
+    parser.add_argument('--rows', type=int, default=2000000, help="rows in the old table")
+    parser.add_argument('--change-rate', type=float, default=0.01,
+                        help="share of rows removed, and again modified, and again added")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        old_file = os.path.join(tmp, 'old.csv')
+        new_file = os.path.join(tmp, 'new.csv')
+        changes_file = os.path.join(tmp, 'changes.jsonl')
+        old = make_valid_table(args.rows, rng)
+        new, made = make_new_table(old, args.change_rate, rng)
+        old.to_csv(old_file, index=False)
+        new.to_csv(new_file, index=False)
+        del old, new
+
+        reports = {target: measure(target, old_file, new_file, changes_file) for target in ['pandas', 'changelog']}
+        columns, old_rows = read_rows(old_file)
+        _, new_rows = read_rows(new_file)
+        summary, applied = apply_changes(columns, old_rows, changes_file)
+        changes_mb = os.path.getsize(changes_file) / 2 ** 20
+        new_mb = os.path.getsize(new_file) / 2 ** 20
+
+    print(f"{args.rows} rows, {len(new_rows)} after the changes; made {made['removed']} removed, "
+          f"{made['modified']} modified, {made['added']} added")
+    for target, report in reports.items():
+        found = ', '.join(f"{count} {name}" for name, count in report['summary'].items()
+                          if name in ('added', 'removed', 'modified'))
+        print(f"{target:>10}: {report['seconds']:6.2f}s  peak {report['peak_mb']:7.0f} MB  ({found})")
+    print(f"delta: {changes_mb:.1f} MB against {new_mb:.1f} MB for the whole new file")
+    if applied != Counter(new_rows):
+        raise SystemExit("applying the delta to the old rows doesn't give the new rows")
+    print("applying the delta to the old rows gives the new rows")
+
+if __name__ == "__main__":
+    main()
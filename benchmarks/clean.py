@@ -0,0 +1,98 @@
+"""
+Time clean_data.clean_film_data against the original row-wise version
+and check both write the same files.
+
+The raw table mimics parse_tables output: mostly realistic chart values
+plus a share of edge cases for the time, temperature and ASA/ISO
+parsers (extra stages, signs, exponents, Unicode digits and spaces,
+mixed C/F readings).
+
+Run from the repository root:
+
+    python -m benchmarks.clean --rows 200000
+"""
+import argparse
+import filecmp
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import clean_data
+from benchmarks import clean_reference
+from benchmarks.corpus import DEVELOPERS, DILUTIONS, FILM_MAKERS, FILM_NAMES
+
+TIMES = ['7', '7.5', '8.25', '10', '10-11', '4-6', '5+5', '3+4.5', '12', '']
+TIME_EDGES = [' 5 + 5 ', '5+5+5', '1-2-3', '-5', '1e1', 'nan', 'inf', '٥', '6 1/2', '+5', '5+', '10 -11', '\xa07',
+              '5\x1c', '?', '*see notes*', '.5', '5.', '1_0', '7-', '1.2.3']
+TEMPS = ['20C', '20C', '24C', '68F', '75F', '21C', '18C']
+TEMP_EDGES = ['20.5C', '20C (68F)', 'room temp', '٢٠C', 'ﬀ20C', '20c', '20 C', '18-20C', '*see notes*', '']
+ISOS = ['25', '50', '100', '200', '400', '800', '1600', '3200', '200-400', '(400)', '?']
+ISO_EDGES = [' 200-400 ', '200 - 400', '1.5', '.5', '1-2-3', '1e3', '٣٢٠٠', '\xa0400', '100-١٢', '400.5-800']
+
+def make_raw_table(rows, seed=0, edge_rate=0.05):
+    """Build a DataFrame shaped like all-film-all-developer.csv"""
+    rng = np.random.default_rng(seed)
+
+    def column(common, edges):
+        values = rng.choice(np.array(common, dtype=object), rows)
+        picks = rng.random(rows) < edge_rate
+        values[picks] = rng.choice(np.array(edges, dtype=object), int(picks.sum()))
+        return values
+
+    films = np.array([f"{maker} {name} {i}" for i, (maker, name) in
+                      enumerate((m, n) for m in FILM_MAKERS for n in FILM_NAMES)], dtype=object)
+    film = rng.choice(films, rows)
+    film[rng.random(rows) < 0.02] = '*see notes*'
+    times = column(TIMES, TIME_EDGES)
+    # Most rows repeat the same time for every format, some differ or leave formats out
+    time_120 = np.where(rng.random(rows) < 0.8, times, column(TIMES, TIME_EDGES))
+    sheet = np.where(rng.random(rows) < 0.6, times, column(TIMES, TIME_EDGES))
+    return pd.DataFrame({
+        'Film': film,
+        'Developer': rng.choice(np.array(DEVELOPERS, dtype=object), rows),
+        'Dilution': rng.choice(np.array(DILUTIONS, dtype=object), rows),
+        'ASA/ISO': column(ISOS, ISO_EDGES),
+        '35mm': times,
+        '120': time_120,
+        'Sheet': sheet,
+        'Temp': column(TEMPS, TEMP_EDGES),
+        'Notes': '',
+        'Source URL': rng.choice(np.array(['https://www.digitaltruth.com/devchart.php?Film=a&mdc=Search',
+                                           'https://www.digitaltruth.com/devchart.php?Developer=b&mdc=Search'],
+                                          dtype=object), rows)
+    })
+
+def run(module, input_file, tmp, label):
+    """Clean input_file with one implementation, returning (seconds, output paths)"""
+    outputs = (os.path.join(tmp, f"{label}_valid.csv"), os.path.join(tmp, f"{label}_invalid.csv"))
+    start = time.perf_counter()
+    module.clean_film_data(input_file, *outputs)
+    return time.perf_counter() - start, outputs
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare clean_film_data with the original row-wise version")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-reference', action='store_true', help="only time the current version")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, 'raw.csv')
+        make_raw_table(args.rows, args.seed).to_csv(input_file, index=False)
+
+        elapsed, outputs = run(clean_data, input_file, tmp, 'new')
+        print(f"{args.rows} rows: clean_data {elapsed:.2f}s")
+        if args.skip_reference:
+            return
+        reference_elapsed, reference_outputs = run(clean_reference, input_file, tmp, 'reference')
+        identical = all(filecmp.cmp(a, b, shallow=False) for a, b in zip(outputs, reference_outputs))
+        print(f"{args.rows} rows: original {reference_elapsed:.2f}s ({reference_elapsed / elapsed:.1f}x), "
+              f"output {'identical' if identical else 'DIFFERS'}")
+        if not identical:
+            raise SystemExit("clean_data output differs from the original")
+
+if __name__ == "__main__":
+    main()
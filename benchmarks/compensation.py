@@ -0,0 +1,128 @@
+"""
+Batch development times from compensation.py against answering one query at a time.
+
+A synthetic raw table is cleaned, the curves are fitted, and a batch of
+(film, developer, dilution, ISO, temperature) queries (charted ISOs,
+pushes, pulls, other temperatures and a few unknown combinations) is
+answered in one CompensationTables.times() call. The per-query way lab
+software does it scans the cleaned table for the combination's rows and
+works the answer out from them; a sample of queries is answered that
+way too, and both must agree.
+
+Run from the repository root:
+
+    python -m benchmarks.compensation --rows 300000 --queries 10000
+"""
+import argparse
+import math
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import clean_data
+import compensation
+from benchmarks.clean import make_raw_table
+from chart_store import TEMPERATURE_COEFFICIENT
+
+def scan_time(df, tables, film, developer, dilution, iso, temperature):
+    """One query the slow way: select the combination's rows from the whole table and fit them on the spot"""
+    rows = df[(df['Film'] == film) & (df['Developer'] == developer) & (df['Dilution'] == dilution)]
+    points = compensation.chart_points(rows)
+    if points.empty:
+        return math.nan
+    # Temperature coefficient from ISOs charted at more than one temperature
+    xy = xx = 0.0
+    for _, group in points.groupby('stops'):
+        d_temp = group['temperature'] - group['temperature'].mean()
+        xy += float((d_temp * (group['log_time'] - group['log_time'].mean())).sum())
+        xx += float((d_temp * d_temp).sum())
+    k = -xy / xx if xx > 0 else math.nan
+    if not compensation.COEFFICIENT_RANGE[0] <= k <= compensation.COEFFICIENT_RANGE[1]:
+        k = TEMPERATURE_COEFFICIENT
+    at_20 = points['log_time'] - k * (compensation.REFERENCE_TEMPERATURE - points['temperature'])
+    curve = at_20.groupby(points['stops']).mean().sort_index()
+    x, y = curve.index.to_numpy(), curve.to_numpy()
+    slope = np.polyfit(x, y, 1)[0] if len(x) > 1 else math.nan
+    if not slope > 0:
+        # The median over every combination, which one table scan can't work out
+        slope = tables.slopes[tables.keys([film], [developer], [dilution])[0]]
+    stops = math.log2(iso)
+    if x[0] <= stops <= x[-1]:
+        log_time = np.interp(stops, x, y)
+    elif stops < x[0]:
+        log_time = y[0] + slope * (stops - x[0])
+    else:
+        log_time = y[-1] + slope * (stops - x[-1])
+    return math.exp(log_time - k * (temperature - compensation.REFERENCE_TEMPERATURE))
+
+def make_queries(df, count, seed):
+    """Queries for charted combinations at random ISOs and temperatures, plus about 2% unknown films"""
+    rng = random.Random(seed)
+    combos = list(df[['Film', 'Developer', 'Dilution']].drop_duplicates().itertuples(index=False, name=None))
+    queries = []
+    for _ in range(count):
+        film, developer, dilution = rng.choice(combos)
+        if rng.random() < 0.02:
+            film = f"Unknown {film}"
+        queries.append((film, developer, dilution, rng.choice([12, 25, 50, 100, 160, 400, 640, 1600, 6400]),
+                        rng.choice([18.0, 20.0, 21.5, 24.0, 27.0])))
+    return pd.DataFrame(queries, columns=['film', 'developer', 'dilution', 'iso', 'temperature'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch compensation lookups against per-query scans")
+    parser.add_argument('--rows', type=int, default=300000, help="raw rows to clean into the test data")
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--scan-queries', type=int, default=200, help="queries also answered by scanning the table")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_file = os.path.join(tmp, 'raw.csv')
+        valid_file = os.path.join(tmp, 'valid.csv')
+        tables_file = os.path.join(tmp, 'compensation.npz')
+        make_raw_table(args.rows, args.seed).to_csv(raw_file, index=False)
+        clean_data.clean_film_data(raw_file, valid_file, os.path.join(tmp, 'invalid.csv'))
+
+        start = time.perf_counter()
+        keys = compensation.build_tables(valid_file, tables_file)
+        print(f"Fitted {keys} combinations in {time.perf_counter() - start:.2f}s "
+              f"({os.path.getsize(tables_file) / 1e6:.1f} MB)")
+
+        start = time.perf_counter()
+        tables = compensation.CompensationTables(tables_file)
+        load_seconds = time.perf_counter() - start
+        df = pd.read_csv(valid_file)
+        queries = make_queries(df, args.queries, args.seed)
+
+        start = time.perf_counter()
+        times = tables.times(queries['film'].to_numpy(), queries['developer'].to_numpy(), queries['iso'].to_numpy(),
+                             queries['temperature'].to_numpy(), queries['dilution'].to_numpy())
+        batch_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        answers = tables.recommend(queries)
+        recommend_seconds = time.perf_counter() - start
+
+        sample = queries.head(args.scan_queries)
+        start = time.perf_counter()
+        scanned = np.array([scan_time(df, tables, *query) for query in sample.itertuples(index=False, name=None)])
+        scan_seconds = time.perf_counter() - start
+
+        print(f"Loaded tables in {load_seconds * 1e3:.1f}ms")
+        print(f"{'batch times()':>16}: {batch_seconds * 1e3:8.1f}ms for {len(queries)} queries "
+              f"({batch_seconds / len(queries) * 1e6:.2f}us each)")
+        print(f"{'recommend()':>16}: {recommend_seconds * 1e3:8.1f}ms, methods: "
+              f"{answers['method'].value_counts().to_dict()}")
+        print(f"{'per-query scan':>16}: {scan_seconds * 1e3:8.1f}ms for {len(sample)} queries "
+              f"({scan_seconds / len(sample) * 1e3:.2f}ms each, "
+              f"{scan_seconds / len(sample) / (batch_seconds / len(queries)):.0f}x slower per query)")
+        same = np.allclose(times[:len(sample)], scanned, rtol=1e-9, equal_nan=True)
+        print(f"Batch and scanned times {'match' if same else 'DIFFER'}")
+        if not same:
+            raise SystemExit("batch times differ from the per-query scan")
+
+if __name__ == "__main__":
+    main()
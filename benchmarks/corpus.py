@@ -0,0 +1,126 @@
+"""
+Synthetic Massive Dev Chart pages for offline benchmarks.
+
+Records are generated once and then published twice, on a film page and
+on a developer page, the same way the real site is crawled. Pages mix
+the layouts parse_table has to cope with: missing </tr> tags, tables
+with and without <tbody>, [notes] links, time ranges, two-stage times,
+Fahrenheit temperatures and the invalid values clean_data rejects.
+"""
+import random
+
+BASE_URL = "https://www.digitaltruth.com"
+HEADERS = ['Film', 'Developer', 'Dilution', 'ASA/ISO', '35mm', '120', 'Sheet', 'Temp', 'Notes']
+
+FILM_MAKERS = ['Kodak', 'Ilford', 'Fomapan', 'Adox', 'Rollei', 'Fuji', 'Bergger', 'Kentmere', 'Agfa', 'Efke']
+FILM_NAMES = ['Tri-X', 'HP5+', 'FP4+', 'Delta', 'T-Max', 'Pan F+', 'CHS', 'Retro', 'Acros', 'Pancro', 'Classic', 'Ortho']
+DEVELOPERS = ['D-76', 'ID-11', 'HC-110', 'Rodinal', 'XTOL', 'DD-X', 'Microphen', 'Perceptol', 'Pyrocat-HD',
+              'Diafine', 'Ilfotec DD-X', 'FX-39', 'Barry Thornton 2-bath', 'Caffenol-C', 'TD-3']
+DILUTIONS = ['stock', '1+1', '1+3', '1+9', '1+25', '1+31', '1+50', '1+63', '1+100', 'B', 'H']
+
+def make_records(n_records, seed=0):
+    """Generate chart records as lists in HEADERS order (without the Notes column)"""
+    rng = random.Random(seed)
+    n_films = max(1, n_records // 20)
+    films = [f"{rng.choice(FILM_MAKERS)} {rng.choice(FILM_NAMES)} {rng.choice([50, 100, 125, 200, 320, 400, 3200])}"
+             f"{'' if i < 10 else ' ' + str(i)}" for i in range(n_films)]
+    records = []
+    for _ in range(n_records):
+        film = rng.choice(films)
+        developer = rng.choice(DEVELOPERS)
+        dilution = rng.choice(DILUTIONS)
+        iso = rng.choice(['25', '50', '100', '200', '400', '800', '1600', '3200', '200-400', '(400)', '?'])
+
+        kind = rng.random()
+        if kind < 0.1:
+            # Two-stage developer
+            time = f"{rng.randint(2, 6)}+{rng.randint(2, 6)}"
+        elif kind < 0.25:
+            low = rng.randint(4, 15)
+            time = f"{low}-{low + rng.randint(1, 3)}"
+        else:
+            time = f"{rng.randint(3, 20)}{rng.choice(['', '', '.5', '.25'])}"
+        times = [time, time, time]
+        if rng.random() < 0.2:
+            times[1] = f"{rng.randint(3, 20)}"
+        if rng.random() < 0.3:
+            times[2] = ''
+        if rng.random() < 0.02:
+            times = ['', '', '']
+
+        temp = rng.choice(['20C', '20C', '20C', '24C', '68F', '75F', '21C', '18C', ''])
+        if rng.random() < 0.02:
+            film = '*see notes*'
+        records.append([film, developer, dilution, iso] + times + [temp])
+    return records
+
+def make_row(record, rng, notes_href):
+    """Render one table row, sometimes leaving out the closing </tr>"""
+    cells = ''.join(f"<td>{value}</td>" for value in record)
+    if notes_href:
+        cells += f"<td><a href=\"{notes_href}\">[notes]</a></td>"
+    else:
+        cells += "<td></td>"
+    close = '' if rng.random() < 0.3 else '</tr>'
+    return f"<tr>{cells}{close}\n"
+
+def make_page(title, records, rng):
+    """Render a chart page in one of the layouts the site uses"""
+    header = ''.join(f"<th>{name}</th>" for name in HEADERS)
+    rows = []
+    for record in records:
+        notes_href = None
+        if rng.random() < 0.2:
+            notes_href = rng.choice([
+                f"/cgi-bin/notes.php?Film={record[0]}&Developer={record[1]}",
+                f"notes.php?Film={record[0]}&Developer={record[1]}",
+                f"{BASE_URL}/devchart.php?Film={record[0]}&Developer={record[1]}",
+            ])
+        rows.append(make_row(record, rng, notes_href))
+    if rng.random() < 0.5:
+        table = (f"<table class=\"mdctable sortable\">\n<thead><tr>{header}</tr></thead>\n"
+                 f"<tbody>\n{''.join(rows)}</tbody>\n</table>")
+    else:
+        # No thead/tbody: the first row is the header
+        table = f"<table class=\"mdctable\">\n<tr>{header}</tr>\n{''.join(rows)}</table>"
+    return (
+        "<!DOCTYPE html>\n<html><head><title>Massive Dev Chart</title>\n"
+        "<script>var q = '<tr>';</script></head>\n"
+        f"<body><div id=\"main\"><h2>{title}</h2>\n<p>Search results for {title}<br>\n"
+        f"{table}\n<p>&copy; Digital Truth Photo</p></div></body></html>\n"
+    )
+
+def make_corpus(n_records, seed=0):
+    """
+    Build a synthetic site as {url: html}.
+
+    Every record appears on its film's page and its developer's page, so
+    the parsed output carries the same 2x duplication as a real crawl.
+    """
+    rng = random.Random(seed)
+    records = make_records(n_records, seed)
+    by_film = {}
+    by_developer = {}
+    for record in records:
+        by_film.setdefault(record[0], []).append(record)
+        by_developer.setdefault(record[1], []).append(record)
+
+    pages = {}
+    for film, film_records in by_film.items():
+        url = f"{BASE_URL}/devchart.php?Film={film.replace(' ', '+')}&mdc=Search"
+        pages[url] = make_page(film, film_records, rng)
+    for developer, developer_records in by_developer.items():
+        url = f"{BASE_URL}/devchart.php?Developer={developer.replace(' ', '+')}&mdc=Search"
+        pages[url] = make_page(developer, developer_records, rng)
+    # A few pages without a chart at all
+    for i in range(max(1, len(pages) // 50)):
+        pages[f"{BASE_URL}/devchart.php?Film=Missing+{i}&mdc=Search"] = (
+            "<html><body><p>No results found</p></body></html>"
+        )
+    return pages
+
+def fill_cache(cache, pages):
+    """Store a corpus in a page cache"""
+    for url, html in pages.items():
+        cache.put(url, html)
+    cache.save()
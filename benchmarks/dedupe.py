@@ -0,0 +1,94 @@
+"""
+Row counts and stage timings with and without parse-time deduplication.
+
+A synthetic corpus (every record on a film page and a developer page)
+is parsed twice, once keeping every row and once dropping repeats into
+a sources table, and each output is cleaned. The cleaned valid rows
+must be identical, and the sources table must list every page each
+row was found on. Copies of every parsed row with other spacing and
+case, from another page, must all be dropped as duplicates.
+
+Run from the repository root:
+
+    python -m benchmarks.dedupe --records 50000
+"""
+import argparse
+import contextlib
+import csv
+import filecmp
+import io
+import os
+import tempfile
+import time
+
+import clean_data
+import parse_tables
+from benchmarks.corpus import fill_cache, make_corpus
+from page_cache import open_cache
+
+def timed(function, *args, **kwargs):
+    """Call function quietly, returning (seconds, result)"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def sources_by_fingerprint(rows):
+    """{fingerprint: set of Source URLs} for parsed rows"""
+    sources = {}
+    for row in rows:
+        sources.setdefault(parse_tables.row_fingerprint(row), set()).add(row[-1])
+    return sources
+
+def near_duplicates(rows):
+    """Each row again in upper case with extra spaces, as found on another page"""
+    return [[f" {'  '.join(cell.upper().split())} " for cell in row[:-1]] + [row[-1] + '&copy=1'] for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse-time deduplication")
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    pages = make_corpus(args.records, args.seed)
+    links = sorted(pages)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'cache')
+        cache = open_cache(cache_path)
+        fill_cache(cache, pages)
+        cache.close()
+        print(f"{len(links)} pages, {args.records} records")
+
+        valid_files = {}
+        for label, sources_file in [('all rows', None), ('deduplicated', os.path.join(tmp, 'sources.csv'))]:
+            name = label.replace(' ', '_')
+            raw_file = os.path.join(tmp, f"{name}.csv")
+            parse_seconds, _ = timed(parse_tables.parse_all, links, cache_path, raw_file, sources_file=sources_file)
+            valid_files[label] = os.path.join(tmp, f"{name}_valid.csv")
+            clean_seconds, stats = timed(clean_data.clean_film_data, raw_file, valid_files[label],
+                                         os.path.join(tmp, f"{name}_invalid.csv"))
+            print(f"{label:>12}: {stats['original_rows']:8} raw rows  {stats['invalid_rows']:7} invalid  "
+                  f"{stats['duplicates_removed']:7} dropped in cleaning  "
+                  f"parse {parse_seconds:6.2f}s  clean {clean_seconds:6.2f}s")
+
+        identical = filecmp.cmp(valid_files['all rows'], valid_files['deduplicated'], shallow=False)
+        print(f"Cleaned valid rows {'identical' if identical else 'DIFFER'}")
+
+        with open(os.path.join(tmp, 'all_rows.csv'), newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))[1:]
+        expected = sources_by_fingerprint(rows)
+        with open(os.path.join(tmp, 'sources.csv'), newline='', encoding='utf-8') as f:
+            recorded = {}
+            for fingerprint, url in list(csv.reader(f))[1:]:
+                recorded.setdefault(fingerprint, set()).add(url)
+        print(f"Sources table {'complete' if recorded == expected else 'INCOMPLETE'}: "
+              f"{sum(len(urls) for urls in recorded.values())} (row, page) pairs")
+
+        kept = parse_tables.DuplicateFilter().filter(rows + near_duplicates(rows))
+        print(f"Near duplicates (other spacing and case) {'dropped' if len(kept) == len(expected) else 'KEPT'}: "
+              f"{len(kept)} of {2 * len(rows)} rows kept, {len(expected)} distinct")
+        if len(kept) != len(expected):
+            raise SystemExit("rows differing only in spacing or case weren't taken as duplicates")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measure download throughput against a local stand-in server.
+
+Run from the repository root:
+
+    python -m benchmarks.download --pages 200 --latency 0.1
+"""
+import argparse
+import tempfile
+import time
+
+import download_tables
+from benchmarks.server import serve
+from page_cache import PageCache
+
+def run_serial(links, cache_dir):
+    """Time the original one-at-a-time loop, minus its politeness sleeps"""
+    cache = PageCache(cache_dir)
+    start = time.perf_counter()
+    for url in links:
+        download_tables.refresh_page(url, cache)
+    return time.perf_counter() - start
+
+def run_concurrent(links, cache_dir, workers, rate, max_age_days=download_tables.MAX_AGE_DAYS):
+    """Time download_all with the given pool size and rate cap"""
+    cache = PageCache(cache_dir)
+    start = time.perf_counter()
+    results = download_tables.download_all(links, cache, workers=workers, rate=rate, backoff=0.1,
+                                           max_age_days=max_age_days)
+    elapsed = time.perf_counter() - start
+    if results['failed']:
+        print(f"\t{len(results['failed'])} pages failed")
+    return elapsed, results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page downloads against a local server")
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.1, help="server delay per response in seconds")
+    parser.add_argument('--fail-rate', type=float, default=0.05)
+    parser.add_argument('--rate', type=float, default=0, help="requests per second cap (0 for none)")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server, base_url = serve(latency=args.latency, fail_rate=args.fail_rate)
+    links = [f"{base_url}/chart/page{i}.php" for i in range(args.pages)]
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # The serial loop has no retry queue, so only time it without failures
+            if args.fail_rate == 0:
+                results.append(('serial', run_serial(links, cache_dir)))
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                elapsed, _ = run_concurrent(links, cache_dir, workers, args.rate)
+                results.append((f"{workers} workers", elapsed))
+                # Revalidate everything: unchanged pages should come back as 304s
+                elapsed, revalidated = run_concurrent(links, cache_dir, workers, args.rate, max_age_days=0)
+                results.append(("revalidate", elapsed))
+                print(f"\tRevalidated: {revalidated['unchanged']} unchanged, "
+                      f"{revalidated['bytes_downloaded']} body bytes transferred")
+    finally:
+        server.shutdown()
+
+    print(f"\n{args.pages} pages, {args.latency}s latency, {args.fail_rate:.0%} failures")
+    for label, elapsed in results:
+        print(f"{label:>12}: {elapsed:6.2f}s  {args.pages / elapsed:7.1f} pages/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Check the fast table extractor against BeautifulSoup and time both.
+
+Every page is parsed with parse_table's 'bs4' and 'fast' engines and the
+rows must be identical. The corpus is the synthetic chart pages plus
+mutated copies with stray tags, comments, entities and scripts spliced
+in, so the fallback rules get exercised too. Pass --cache to also check
+the real pages saved by download_tables.py.
+
+Run from the repository root:
+
+    python -m benchmarks.extract
+    python -m benchmarks.extract --cache cache --links unique_links.txt
+"""
+import argparse
+import random
+import statistics
+import time
+
+import parse_tables
+import table_extractor
+from benchmarks.corpus import make_corpus
+from page_cache import open_cache
+
+# Markup spliced into pages to produce malformed variants
+SNIPPETS = [
+    '<tr>', '</tr>', '<TR>', '<tr class="x">', '<td>', '</td>', '<td/>', '<th>', '</th>', '<tbody>', '</tbody>',
+    '<thead>', '</thead>', '<br>', '</br>', '<br/>', '<p>', '</p>', '<div>', '</div>', '<b>', '</b>', '<a>', '</a>',
+    '<a href="notes.php?x=1">[notes]</a>', '<table>', '</table>', '<table class="mdctable">', '<!-- c -->',
+    '<!--', '-->', '<script>x</script>', '<script>', '</script>', '<style>p{}</style>', '<pre>', '</pre>',
+    '<textarea>', '</textarea>', '<template>', '</template>', '<rt>', '</rt>', '<![CDATA[ x ]]>', '<title>t</title>',
+    '&amp;', '&nbsp;', '&foo;', '&copy', '&#65;', '<img src=x>', '  \n  ', '\t'
+]
+
+def mutate(html, rng):
+    """Splice a few random snippets into a page"""
+    parts = list(html)
+    for _ in range(rng.randint(1, 6)):
+        parts.insert(rng.randrange(len(parts) + 1), rng.choice(SNIPPETS))
+    return ''.join(parts)
+
+def timed_parse(html, url, engine):
+    """Parse a page, returning (rows or exception type, seconds)"""
+    start = time.perf_counter()
+    try:
+        result = parse_tables.parse_table(html, url, engine)
+    except Exception as e:
+        result = type(e)
+    return result, time.perf_counter() - start
+
+def summarize(label, timings):
+    """Format per-page timing statistics in milliseconds"""
+    ms = sorted(t * 1000 for t in timings)
+    p95 = ms[int(len(ms) * 0.95)]
+    return (f"{label:>6}: mean {statistics.mean(ms):7.3f} ms  median {statistics.median(ms):7.3f} ms  "
+            f"p95 {p95:7.3f} ms  total {sum(ms) / 1000:6.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity check and per-page timing for the table extractors")
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--mutations', type=int, default=2000, help="number of mutated pages to add")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', help="also check pages from this cache")
+    parser.add_argument('--links', default='unique_links.txt', help="URLs to read from --cache")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = list(make_corpus(args.records, args.seed).items())
+    groups = {
+        'synthetic': corpus,
+        'mutated': [(url, mutate(html, rng)) for url, html in rng.choices(corpus, k=args.mutations)]
+    }
+    if args.cache:
+        cache = open_cache(args.cache)
+        with open(args.links, 'r') as f:
+            links = [line.strip() for line in f if line.strip()]
+        groups['cached'] = [(url, cache.get(url)) for url in links if cache.contains(url)]
+
+    for group, pages in groups.items():
+        timings = {'bs4': [], 'fast': []}
+        mismatches = []
+        fallbacks = 0
+        for url, html in pages:
+            expected, elapsed = timed_parse(html, url, 'bs4')
+            timings['bs4'].append(elapsed)
+            result, elapsed = timed_parse(html, url, 'fast')
+            timings['fast'].append(elapsed)
+            if result != expected:
+                mismatches.append(url)
+            try:
+                table_extractor.find_mdctable(html)
+            except table_extractor.FastPathUnsupported:
+                fallbacks += 1
+
+        print(f"{group}: {len(pages)} pages, {fallbacks} fell back to BeautifulSoup, {len(mismatches)} mismatches")
+        for url in mismatches[:20]:
+            print(f"\tMISMATCH {url}")
+        print(summarize('bs4', timings['bs4']))
+        print(summarize('fast', timings['fast']))
+        print(f"Speedup: {sum(timings['bs4']) / sum(timings['fast']):.1f}x\n")
+
+if __name__ == "__main__":
+    main()
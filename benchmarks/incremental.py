@@ -0,0 +1,73 @@
+"""
+Measure an incremental re-parse after a few pages change, against a full parse.
+
+A synthetic corpus is parsed once to fill the manifest, then a fraction
+of the pages is rewritten in the cache (new rows, so new content
+hashes) and the parse runs again. The incremental output must match a
+full parse of the updated cache byte for byte.
+
+Run from the repository root:
+
+    python -m benchmarks.incremental --records 20000 --changed 0.01
+"""
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import random
+import tempfile
+import time
+
+import parse_tables
+from benchmarks.corpus import fill_cache, make_corpus, make_records, make_page
+from page_cache import open_cache
+
+def timed_parse(links, cache_path, csv_file, manifest=None):
+    """Run parse_all quietly and return its wall time"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parse_tables.parse_all(links, cache_path, csv_file, manifest=manifest)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark incremental parsing against a full parse")
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--changed', type=float, default=0.01, help="fraction of pages to change between runs")
+    parser.add_argument('--cache', default='cache', help="cache backend to test: 'cache' or 'cache.sqlite'")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = make_corpus(args.records, args.seed)
+    links = sorted(pages)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, args.cache)
+        cache = open_cache(cache_path)
+        fill_cache(cache, pages)
+        cache.close()
+        manifest_file = os.path.join(tmp, 'parse_manifest.json')
+        csv_file = os.path.join(tmp, 'incremental.csv')
+        full_csv = os.path.join(tmp, 'full.csv')
+
+        elapsed = timed_parse(links, cache_path, csv_file, parse_tables.ParseManifest(manifest_file))
+        print(f"{len(links)} pages, first run (empty manifest): {elapsed:6.2f}s")
+        elapsed = timed_parse(links, cache_path, csv_file, parse_tables.ParseManifest(manifest_file))
+        print(f"Nothing changed: {elapsed:6.2f}s")
+
+        changed = rng.sample(links, max(1, int(len(links) * args.changed)))
+        cache = open_cache(cache_path)
+        for url in changed:
+            cache.put(url, make_page('Updated', make_records(rng.randint(1, 40), rng.random()), rng))
+        cache.close()
+
+        elapsed = timed_parse(links, cache_path, csv_file, parse_tables.ParseManifest(manifest_file))
+        print(f"{len(changed)} pages changed, incremental: {elapsed:6.2f}s")
+        full = timed_parse(links, cache_path, full_csv)
+        print(f"{len(changed)} pages changed, full parse: {full:6.2f}s")
+        identical = filecmp.cmp(csv_file, full_csv, shallow=False)
+        print(f"Speedup: {full / elapsed:.1f}x, output {'identical' if identical else 'DIFFERS'}")
+        print(f"Manifest size: {os.path.getsize(manifest_file) / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
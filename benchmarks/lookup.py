@@ -0,0 +1,87 @@
+"""
+Lookup latency of chart_store against scanning the cleaned CSV with pandas.
+
+A synthetic raw table is cleaned with clean_data.py, the store is built
+from the result, and the same film/developer/dilution lookups are run
+against the store, against a DataFrame already in memory, and the way
+tools did it before (read the CSV, then filter). Each lookup must find
+the same number of rows everywhere.
+
+Run from the repository root:
+
+    python -m benchmarks.lookup --rows 300000 --lookups 1000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+
+import chart_store
+import clean_data
+from benchmarks.clean import make_raw_table
+
+def latencies(function, keys):
+    """Per-call wall times of function(*key) in microseconds, and the row counts it returned"""
+    times, counts = [], []
+    for key in keys:
+        start = time.perf_counter()
+        counts.append(function(*key))
+        times.append((time.perf_counter() - start) * 1e6)
+    return times, counts
+
+def summary(label, times):
+    """One line of latency percentiles"""
+    times = sorted(times)
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+    return f"{label:>22}: median {statistics.median(times):10.1f}us  p99 {p99:10.1f}us  ({len(times)} lookups)"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chart_store lookups against pandas scans")
+    parser.add_argument('--rows', type=int, default=300000, help="raw rows to clean into the test data")
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--csv-lookups', type=int, default=5, help="lookups that re-read the CSV each time")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_file = os.path.join(tmp, 'raw.csv')
+        valid_file = os.path.join(tmp, 'valid.csv')
+        db_file = os.path.join(tmp, 'charts.sqlite')
+        make_raw_table(args.rows, args.seed).to_csv(raw_file, index=False)
+        clean_data.clean_film_data(raw_file, valid_file, os.path.join(tmp, 'invalid.csv'))
+
+        start = time.perf_counter()
+        count = chart_store.build_store(valid_file, db_file)
+        print(f"Built store of {count} rows in {time.perf_counter() - start:.2f}s "
+              f"({os.path.getsize(db_file) / 1e6:.1f} MB, CSV {os.path.getsize(valid_file) / 1e6:.1f} MB)")
+
+        df = pd.read_csv(valid_file)
+        combos = list(df[['Film', 'Developer', 'Dilution']].drop_duplicates().itertuples(index=False, name=None))
+        keys = random.Random(args.seed).choices(combos, k=args.lookups)
+
+        with chart_store.ChartStore(db_file) as store:
+            store_times, store_counts = latencies(
+                lambda film, developer, dilution: len(store.lookup(film, developer, dilution)), keys)
+
+        def scan(frame, film, developer, dilution):
+            match = frame[(frame['Film'] == film) & (frame['Developer'] == developer) & (frame['Dilution'] == dilution)]
+            return len(match)
+
+        frame_times, frame_counts = latencies(lambda *key: scan(df, *key), keys)
+        csv_keys = keys[:args.csv_lookups]
+        csv_times, csv_counts = latencies(lambda *key: scan(pd.read_csv(valid_file), *key), csv_keys)
+
+        print(summary('chart_store', store_times))
+        print(summary('pandas, frame loaded', frame_times))
+        print(summary('pandas, read CSV', csv_times))
+        same = store_counts == frame_counts and csv_counts == frame_counts[:len(csv_counts)]
+        print(f"Row counts {'match' if same else 'DIFFER'}")
+        if not same:
+            raise SystemExit("chart_store lookups differ from the pandas scan")
+
+if __name__ == "__main__":
+    main()
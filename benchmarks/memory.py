@@ -0,0 +1,90 @@
+"""
+Peak memory (max RSS) and wall time of clean_film_data on a large raw
+table: in memory, streamed in chunks, and the original row-wise version.
+
+Each run happens in a fresh Python process that reports its own peak
+RSS, so the numbers don't mix. Read-only runs (just loading the table,
+as plain strings and with clean_data's categorical columns) show how
+much of the peak is the input itself, along with the loaded frame size.
+
+Run from the repository root (the default 5M rows needs a few GB of
+free memory and the original version takes several minutes):
+
+    python -m benchmarks.memory --rows 5000000
+"""
+import argparse
+import filecmp
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.clean import make_raw_table
+
+CHILD = '''
+import json, resource, sys, time
+start = time.perf_counter()
+report = {}
+if sys.argv[1] in ('read', 'read_text'):
+    from table_writer import read_table
+    from clean_data import RAW_DTYPES
+    df = read_table(sys.argv[2], dtype=RAW_DTYPES if sys.argv[1] == 'read' else str)
+    report['frame_mb'] = df.memory_usage(deep=True).sum() / 2 ** 20
+elif len(sys.argv) > 5:
+    import clean_data
+    clean_data.clean_film_data(sys.argv[2], sys.argv[3], sys.argv[4], chunksize=int(sys.argv[5]))
+else:
+    module = __import__(sys.argv[1], fromlist=['clean_film_data'])
+    module.clean_film_data(sys.argv[2], sys.argv[3], sys.argv[4])
+report['seconds'] = time.perf_counter() - start
+report['peak_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(report))
+'''
+
+def write_raw_table(filename, rows, seed=0, chunk_rows=500000):
+    """Write a synthetic raw table in chunks so generating it doesn't need the memory being measured"""
+    for i, start in enumerate(range(0, rows, chunk_rows)):
+        chunk = make_raw_table(min(chunk_rows, rows - start), seed + i)
+        chunk.to_csv(filename, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+def measure(target, input_file, tmp, chunksize=None):
+    """Run one cleaning implementation in a child process, returning its report or None if it failed"""
+    label = f"{target}_{chunksize}" if chunksize else target
+    outputs = [os.path.join(tmp, f"{label}_valid.csv"), os.path.join(tmp, f"{label}_invalid.csv")]
+    args = [sys.executable, '-c', CHILD, target, input_file] + outputs + ([str(chunksize)] if chunksize else [])
+    result = subprocess.run(args, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"\t{target} failed (exit {result.returncode}): {result.stderr.strip()[-300:]}")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak memory of the cleaning stage")
+    parser.add_argument('--rows', type=int, default=5000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunksize', type=int, default=500000, help="rows per chunk for the streamed run")
+    parser.add_argument('--skip-reference', action='store_true', help="don't run the original version")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, 'raw.csv')
+        write_raw_table(input_file, args.rows, args.seed)
+        print(f"{args.rows} rows, {os.path.getsize(input_file) / 1e6:.0f} MB of CSV")
+
+        targets = [('read_text', 'read as text', None), ('read', 'read only', None), ('clean_data', 'in memory', None),
+                   ('clean_data', 'chunked', args.chunksize)]
+        if not args.skip_reference:
+            targets.append(('benchmarks.clean_reference', 'original', None))
+        for target, label, chunksize in targets:
+            report = measure(target, input_file, tmp, chunksize)
+            if report:
+                frame = f"  frame {report['frame_mb']:6.0f} MB" if 'frame_mb' in report else ''
+                print(f"{label:>12}: peak RSS {report['peak_mb']:8.0f} MB  {report['seconds']:8.1f}s{frame}")
+        identical = all(filecmp.cmp(os.path.join(tmp, f"clean_data_{kind}.csv"),
+                                    os.path.join(tmp, f"clean_data_{args.chunksize}_{kind}.csv"), shallow=False)
+                        for kind in ['valid', 'invalid'])
+        print(f"Chunked output {'identical to' if identical else 'DIFFERS from'} the in-memory run")
+
+if __name__ == "__main__":
+    main()
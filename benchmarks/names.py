@@ -0,0 +1,172 @@
+"""
+Build time and accuracy of name_index on a few thousand name variants.
+
+Canonical film and developer names are generated from the corpus
+vocabulary, and each gets spelling variants like the ones scraped pages
+have: other case, extra or missing spaces, other punctuation, "Plus"
+for "+", and one-letter typos. The index is built three ways:
+
+- all pairs: every pair of keys compared with is_typo (what the
+  blocking avoids),
+- blocked: a fresh NameIndex,
+- cached: a NameIndex loaded from the saved mapping, which only has to
+  look names up.
+
+Every variant should map to the canonical name of its own group (a
+wrong mapping is a false merge, a group left with two canonical names a
+missed one). The raw table is then cleaned with and without a name map,
+as a whole, in chunks and as a CleanStream, and the three must write the
+same files.
+
+Run from the repository root:
+
+    python -m benchmarks.names --names 1500 --rows 200000
+"""
+import argparse
+import filecmp
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import clean_data
+import name_index
+from benchmarks.clean import make_raw_table
+from benchmarks.corpus import DEVELOPERS, FILM_MAKERS, FILM_NAMES
+from table_writer import read_table, rows_to_frame
+
+SPEEDS = ['25', '50', '64', '80', '100', '125', '160', '200', '320', '400', '800', '1600', '3200']
+SUFFIXES = ['', ' Professional', ' II', ' Pro', ' Plus', ' Expert']
+
+def typo(name, rng):
+    """One letter added, dropped, changed or two swapped in a word long enough to have typos, or None"""
+    words = name.split(' ')
+    candidates = [i for i, word in enumerate(words) if word.isalpha() and len(word) >= name_index.TYPO_MIN_LENGTH]
+    if not candidates:
+        return None
+    i = rng.choice(candidates)
+    word = words[i]
+    j = rng.randrange(1, len(word) - 1)
+    letter = rng.choice('aeiourstln')
+    word = rng.choice([word[:j] + word[j + 1:], word[:j] + letter + word[j:], word[:j] + letter + word[j + 1:],
+                       word[:j] + word[j + 1] + word[j] + word[j + 2:]])
+    return ' '.join(words[:i] + [word] + words[i + 1:])
+
+def variants(name, rng, count):
+    """Up to `count` scraped-looking spellings of a name"""
+    spellings = [
+        name.lower(), name.upper(), name.replace(' ', '  '), name.replace('-', ''), name.replace('-', ' '),
+        name.replace('+', ' Plus'), f" {name}", f"{name}.", typo(name, rng), typo(name, rng)
+    ]
+    spellings = [spelling for spelling in dict.fromkeys(spellings) if spelling and spelling != name]
+    return rng.sample(spellings, min(count, len(spellings)))
+
+def make_names(count, seed):
+    """{variant: canonical} for about `count` canonical film names and the developers, with their variants"""
+    rng = random.Random(seed)
+    films = sorted({f"{maker} {film} {speed}{suffix}" for maker in FILM_MAKERS for film in FILM_NAMES
+                    for speed in SPEEDS for suffix in SUFFIXES})
+    canonical = rng.sample(films, min(count, len(films))) + list(DEVELOPERS)
+    truth = {}
+    for name in canonical:
+        truth[name] = name
+        for variant in variants(name, rng, rng.randint(0, 3)):
+            # A variant that is itself another canonical name, or another's variant, is ambiguous
+            truth.setdefault(variant, name)
+    return truth
+
+def score(mapping, truth):
+    """(false merges, missed merges): variants mapped across groups, and groups split over several names"""
+    false = sum(truth[mapping[name]] != canonical for name, canonical in truth.items())
+    targets = defaultdict(set)
+    for name, canonical in truth.items():
+        targets[canonical].add(mapping[name])
+    missed = sum(len(names) - 1 for names in targets.values())
+    return false, missed
+
+def all_pairs(names):
+    """Typo pairs found by comparing every pair of keys, and the seconds it took"""
+    start = time.perf_counter()
+    keys = sorted({name_index.name_key(name) for name in names})
+    pairs = sum(name_index.is_typo(a, b) for i, a in enumerate(keys) for b in keys[i + 1:])
+    return pairs, time.perf_counter() - start
+
+def clean_three_ways(raw_file, tmp, name_map, label):
+    """Clean a raw table whole, in chunks and as a stream, returning (results, whether all outputs match)"""
+    outputs = {}
+    for mode in ['whole', 'chunked', 'stream']:
+        if name_map and os.path.exists(name_map):
+            os.remove(name_map)
+        valid_file = os.path.join(tmp, f"{label}_{mode}_valid.csv")
+        invalid_file = os.path.join(tmp, f"{label}_{mode}_invalid.csv")
+        if mode == 'stream':
+            stream = clean_data.CleanStream(invalid_file, name_map)
+            frame = read_table(raw_file, dtype='str')
+            rows = frame.astype(object).where(frame.notna(), '').values.tolist()
+            for i in range(0, len(rows), 50000):
+                stream.add(rows_to_frame(rows[i:i + 50000], list(frame.columns), clean_data.RAW_DTYPES))
+            results = stream.finish(valid_file)
+        else:
+            results = clean_data.clean_film_data(raw_file, valid_file, invalid_file,
+                                                 chunksize=50000 if mode == 'chunked' else None, name_map=name_map)
+        outputs[mode] = (results, valid_file, invalid_file)
+    base, base_valid, base_invalid = outputs['whole']
+    same = all(results == base and filecmp.cmp(valid_file, base_valid, False) and
+               filecmp.cmp(invalid_file, base_invalid, False) for results, valid_file, invalid_file in outputs.values())
+    return base, same
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the canonical-name index")
+    parser.add_argument('--names', type=int, default=1500, help="canonical film names (each gets up to 3 variants)")
+    parser.add_argument('--rows', type=int, default=200000, help="raw rows for the cleaning check")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    truth = make_names(args.names, args.seed)
+    counts = {name: 10 if name == canonical else 1 for name, canonical in truth.items()}
+    print(f"{len(truth)} distinct names, {len(set(truth.values()))} canonical")
+
+    pairs, all_pairs_seconds = all_pairs(truth)
+    print(f"{'all pairs':>10}: {all_pairs_seconds:7.3f}s, {pairs} typo pairs")
+
+    start = time.perf_counter()
+    index = name_index.NameIndex()
+    index.update(counts)
+    print(f"{'blocked':>10}: {time.perf_counter() - start:7.3f}s, "
+          f"{sum(name != target for name, target in index.mapping.items())} names mapped to another spelling")
+    false, missed = score(index.mapping, truth)
+    print(f"{'':>10}  {false} false merges, {missed} missed merges")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        map_file = os.path.join(tmp, 'name_map.json')
+        normalizer = name_index.NameNormalizer(map_file, columns=['Film'])
+        normalizer.indexes['Film'] = index
+        normalizer.save()
+        start = time.perf_counter()
+        cached = name_index.NameNormalizer(map_file, columns=['Film'])
+        learned = cached.update_counts('Film', counts)
+        print(f"{'cached':>10}: {time.perf_counter() - start:7.3f}s to load and update, {learned} names searched")
+
+        # A raw table whose films and developers are spelled every way
+        rng = random.Random(args.seed)
+        films = [name for name, canonical in truth.items() if canonical not in DEVELOPERS]
+        developers = [name for name, canonical in truth.items() if canonical in DEVELOPERS]
+        raw = make_raw_table(args.rows, args.seed)
+        raw['Film'] = [rng.choice(films) if film != '*see notes*' else film for film in raw['Film']]
+        raw['Developer'] = rng.choices(developers, k=len(raw))
+        raw_file = os.path.join(tmp, 'raw.csv')
+        raw.to_csv(raw_file, index=False)
+
+        for label, name_map in [('exact names', None), ('normalized', os.path.join(tmp, 'clean_map.json'))]:
+            start = time.perf_counter()
+            results, same = clean_three_ways(raw_file, tmp, name_map, label.replace(' ', '_'))
+            print(f"{label:>12}: {results['valid_rows']} rows after removing {results['duplicates_removed']} "
+                  f"duplicates, {results['names_normalized']} rows renamed "
+                  f"({time.perf_counter() - start:.2f}s for 3 runs); whole, chunked and stream "
+                  f"{'identical' if same else 'DIFFER'}")
+            if not same:
+                raise SystemExit("cleaning modes disagree")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measure parse throughput at different worker counts on a synthetic corpus.
+
+Run from the repository root:
+
+    python -m benchmarks.parse --records 20000 --workers 1 2 4
+"""
+import argparse
+import contextlib
+import filecmp
+import io
+import os
+import tempfile
+import time
+
+import parse_tables
+from benchmarks.corpus import fill_cache, make_corpus
+from page_cache import open_cache
+
+def time_parse(links, cache_path, csv_file, workers):
+    """Run the parse stage quietly and return its wall time"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        parse_tables.parse_all(links, cache_path, csv_file, workers)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parse stage on a synthetic corpus")
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--cache', default='cache', help="cache backend to test: 'cache' or 'cache.sqlite'")
+    args = parser.parse_args()
+
+    pages = make_corpus(args.records)
+    links = sorted(pages)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, args.cache)
+        cache = open_cache(cache_path)
+        fill_cache(cache, pages)
+        cache.close()
+
+        serial_csv = os.path.join(tmp, 'serial.csv')
+        elapsed = time_parse(links, cache_path, serial_csv, 1)
+        print(f"{len(links)} pages, {args.records} records ({os.cpu_count()} CPUs)")
+        print(f"{'serial':>12}: {elapsed:6.2f}s  {len(links) / elapsed:7.1f} pages/s")
+
+        for workers in args.workers:
+            csv_file = os.path.join(tmp, f"workers{workers}.csv")
+            elapsed = time_parse(links, cache_path, csv_file, workers)
+            identical = filecmp.cmp(serial_csv, csv_file, shallow=False)
+            print(f"{f'{workers} workers':>12}: {elapsed:6.2f}s  {len(links) / elapsed:7.1f} pages/s"
+                  f"  {'identical' if identical else 'OUTPUT DIFFERS'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Parsing ISO, time and temperature columns cell by cell vs once per distinct string, cold and from a saved cache.
+
+A synthetic raw table (see clean.py) gets its time, ISO and temperature
+columns redrawn from vocabularies of realistic size: a few thousand time
+strings, a few hundred ISOs and temperatures, edge cases included. Each
+column is parsed three ways:
+
+- direct: clean_data's vectorized parser on the whole column, as before
+  the parse cache
+- memo: a fresh ParseCache, which parses each distinct string once
+- saved: a ParseCache loaded from the file the memo run saved, as the
+  next run of clean_data.py with --parse-cache would be
+
+All three must give the same values.
+
+Run from the repository root:
+
+    python -m benchmarks.parse_cache --rows 2000000 --times 3000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import clean_data
+from benchmarks.clean import ISO_EDGES, TEMP_EDGES, TIME_EDGES, make_raw_table
+from parse_cache import ParseCache
+
+def vocabulary(rng, count, make, edges):
+    """Up to `count` distinct strings from make(rng), plus the edge cases"""
+    values = set(edges)
+    for _ in range(count * 100):
+        if len(values) >= count + len(edges):
+            break
+        values.add(make(rng))
+    return np.array(sorted(values), dtype=object)
+
+def make_time(rng):
+    first = f"{rng.integers(1, 40)}{rng.choice(['', '.25', '.5', '.75'])}"
+    kind = rng.random()
+    if kind < 0.1:
+        return f"{first}+{rng.integers(1, 15)}"
+    if kind < 0.25:
+        return f"{first}-{rng.integers(2, 45)}"
+    return first
+
+def make_iso(rng):
+    iso = rng.integers(1, 200) * 25
+    return f"{iso}-{iso + rng.integers(1, 8) * 25}" if rng.random() < 0.2 else str(iso)
+
+def make_temp(rng):
+    low = rng.integers(15, 30)
+    reading = rng.choice([f"{low}C", f"{low}-{low + rng.integers(1, 6)}C", f"{round(low * 9 / 5 + 32)}F"])
+    return reading + rng.choice(['', ' (approx)', ' or higher', ' *'])
+
+def parsers():
+    """(label, kind, column, parser, dtypes) for every column clean_data parses"""
+    return [(f"times ({fmt})", 'time', fmt, clean_data.parse_dev_times, clean_data.TIME_DTYPES)
+            for fmt in clean_data.FORMATS] + [
+        ('ISO check', 'iso_valid', 'ASA/ISO', clean_data.valid_iso_mask, {'valid': bool}),
+        ('ISO average', 'iso', 'ASA/ISO', lambda isos: isos.apply(clean_data.average_iso_range), {'ASA/ISO': object}),
+        ('temperature', 'temp', 'Temp', clean_data.parse_temperatures, {'Temperature_C': float})
+    ]
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing cell values once per distinct string")
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--times', type=int, default=3000, help="distinct time strings")
+    parser.add_argument('--isos', type=int, default=300, help="distinct ISO strings")
+    parser.add_argument('--temps', type=int, default=300, help="distinct temperature strings")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    raw = make_raw_table(args.rows, args.seed)
+    times = vocabulary(rng, args.times, make_time, TIME_EDGES)
+    for fmt in clean_data.FORMATS:
+        raw[fmt] = rng.choice(times, args.rows)
+    raw['ASA/ISO'] = rng.choice(vocabulary(rng, args.isos, make_iso, ['(400)', '?'] + ISO_EDGES), args.rows)
+    raw['Temp'] = rng.choice(vocabulary(rng, args.temps, make_temp, TEMP_EDGES), args.rows)
+    # Typed as clean_data reads them: text columns as str, Temp as a categorical
+    raw = raw.astype({column: clean_data.RAW_DTYPES[column] for column in raw.columns})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = os.path.join(tmp, 'parse_cache.json')
+        memo = ParseCache(cache_file, clean_data.PARSE_RULES_VERSION)
+        results = []
+        for label, kind, column, parse, dtypes in parsers():
+            direct_seconds, direct = timed(parse, raw[column])
+            memo_seconds, memoized = timed(memo.parse, kind, raw[column], parse, dtypes)
+            results.append([label, direct_seconds, memo_seconds, direct, memoized])
+        memo.save()
+        cache_kb = os.path.getsize(cache_file) / 1024
+        load_seconds, saved = timed(ParseCache, cache_file, clean_data.PARSE_RULES_VERSION)
+        for result, (label, kind, column, parse, dtypes) in zip(results, parsers()):
+            saved_seconds, from_saved = timed(saved.parse, kind, raw[column], parse, dtypes)
+            result += [saved_seconds, from_saved]
+
+    print(f"{args.rows} rows; cache file {cache_kb:.0f} KB, loaded in {load_seconds * 1e3:.0f}ms")
+    print(f"{'column':>14} {'direct':>8} {'memo':>8} {'saved':>8} {'speedup':>8}")
+    mismatches = []
+    for label, direct_seconds, memo_seconds, direct, memoized, saved_seconds, from_saved in results:
+        print(f"{label:>14} {direct_seconds:7.2f}s {memo_seconds:7.2f}s {saved_seconds:7.2f}s "
+              f"{direct_seconds / memo_seconds:7.1f}x")
+        direct = direct.to_frame(memoized.columns[0]) if isinstance(direct, pd.Series) else direct[memoized.columns]
+        for name, values in [('memo', memoized), ('saved', from_saved)]:
+            if not direct.astype(values.dtypes.to_dict()).equals(values):
+                mismatches.append(f"{label} ({name})")
+    if mismatches:
+        raise SystemExit(f"results differ from the direct parse: {', '.join(mismatches)}")
+    print("Every column parses to the same values all three ways")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Compare a full refresh run script by script with the pipelined runner.
+
+A local server holds a synthetic corpus and answers the search endpoint
+with the chart pages whose name contains the query. The sequential run
+does what the four scripts do one after another (search, download into
+an empty cache, parse to CSV, clean), timing each stage; the pipeline
+does the same into a second empty cache. Both must produce the same
+cleaned rows (the pipeline writes them in the order pages finish, so
+rows are compared as sets), and every page the pipeline downloaded must
+be fresh when its cache is opened again, as the next run would open it.
+
+Run from the repository root:
+
+    python -m benchmarks.pipeline --records 20000 --latency 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import os
+import tempfile
+import time
+from urllib.parse import parse_qs, urlparse
+
+import clean_data
+import download_tables
+import get_urls
+import parse_tables
+import pipeline
+from benchmarks.corpus import make_corpus
+from benchmarks.server import SEARCH_PATH, serve
+from page_cache import open_cache
+
+def corpus_site(records, seed):
+    """Serve paths and a search function for a synthetic corpus"""
+    pages = {}
+    names = {}
+    for url, html in make_corpus(records, seed).items():
+        parsed = urlparse(url)
+        path = f"{parsed.path}?{parsed.query}"
+        pages[path] = html
+        fields = parse_qs(parsed.query)
+        names[path] = (fields.get('Film') or fields['Developer'])[0].lower()
+
+    def search(query):
+        # Match the film or developer name, like the site's search
+        return [path for path, name in names.items() if query.lower() in name]
+    return pages, search
+
+def read_rows(filename, drop=()):
+    """Rows of a CSV as a sorted list, without the named columns"""
+    with open(filename, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        keep = [i for i, name in enumerate(headers) if name not in drop]
+        return sorted(tuple(row[i] for i in keep) for row in reader)
+
+def run_sequential(search_url, tmp, args):
+    """Run the four stages one after another, returning ({stage: seconds}, the links found)"""
+    timings = {}
+    start = time.perf_counter()
+    results, _ = asyncio.run(get_urls.expand_queries(search_url, max_concurrency=args.search_concurrency, rate=0))
+    links = sorted({link for found in results.values() for link in found if "javascript" not in link.lower()})
+    timings['search'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cache_path = os.path.join(tmp, 'sequential_cache')
+    cache = open_cache(cache_path)
+    download_tables.download_all(links, cache, workers=args.workers, rate=0, backoff=0.1)
+    cache.close()
+    timings['download'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw_file = os.path.join(tmp, 'sequential_raw.csv')
+    parse_tables.parse_all(links, cache_path, raw_file, args.parse_workers,
+                           sources_file=os.path.join(tmp, 'sequential_sources.csv'))
+    timings['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    clean_data.clean_film_data(raw_file, os.path.join(tmp, 'sequential_valid.csv'),
+                               os.path.join(tmp, 'sequential_invalid.csv'))
+    timings['clean'] = time.perf_counter() - start
+    return timings, links
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipelined runner against running the scripts in turn")
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--latency', type=float, default=0.05, help="server delay per response in seconds")
+    parser.add_argument('--workers', type=int, default=8, help="concurrent downloads")
+    parser.add_argument('--parse-workers', type=int, default=1)
+    parser.add_argument('--search-concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    pages, search = corpus_site(args.records, args.seed)
+    server, base_url = serve(pages, latency=args.latency, search=search)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings, links = run_sequential(base_url + SEARCH_PATH, tmp, args)
+                results = pipeline.run_pipeline(
+                    os.path.join(tmp, 'pipeline_cache'), os.path.join(tmp, 'pipeline_valid.csv'),
+                    os.path.join(tmp, 'pipeline_invalid.csv'), search_url=base_url + SEARCH_PATH,
+                    search_concurrency=args.search_concurrency, search_rate=0, download_workers=args.workers,
+                    rate=0, parse_workers=args.parse_workers)
+
+            print(f"{len(pages)} pages, {args.records} records, {args.latency}s latency, "
+                  f"{args.workers} download workers, {args.parse_workers} parse workers")
+            for stage, seconds in timings.items():
+                print(f"{stage:>10}: {seconds:6.2f}s")
+            print(f"{'sequential':>10}: {sum(timings.values()):6.2f}s in total")
+            finished = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in results['stage_finished'].items())
+            print(f"{'pipeline':>10}: {results['seconds']:6.2f}s (stages finished at: {finished})")
+
+            same_valid = (read_rows(os.path.join(tmp, 'sequential_valid.csv')) ==
+                          read_rows(os.path.join(tmp, 'pipeline_valid.csv')))
+            # Which page's copy of a repeated row survives depends on the order pages finish
+            same_invalid = (read_rows(os.path.join(tmp, 'sequential_invalid.csv'), ['Source URL']) ==
+                            read_rows(os.path.join(tmp, 'pipeline_invalid.csv'), ['Source URL']))
+            print(f"Cleaned rows {'identical' if same_valid else 'DIFFER'}, "
+                  f"invalid rows {'identical' if same_invalid else 'DIFFER'}")
+
+            cache = open_cache(os.path.join(tmp, 'pipeline_cache'))
+            fresh = sum(cache.is_fresh(url) for url in links)
+            cache.close()
+            print(f"{fresh} of {len(links)} pages fresh in the pipeline's cache when reopened")
+            if fresh < len(links):
+                raise SystemExit("the pipeline didn't save its cache index")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Interrupt the search and the download partway through and resume them from the work queue.
+
+A synthetic corpus is served from a local stand-in site that fails a
+share of requests. get_urls.main() and download_tables.main() first run
+once to completion without a queue, as the reference. Then each is run
+with a work queue and stopped, the way a kill would, after half of its
+items are done (the stop comes out of the queue update, so nothing
+after it runs, not even the final cache.save()). The script is rerun
+until nothing is left failed, and the server's request counts show what
+each run sent: the reruns should only send what the first one didn't
+finish, where a restart without the queue sends everything again. The
+resumed search must find every page, and every page must end up in the
+cache.
+
+Run from the repository root:
+
+    python -m benchmarks.resume --records 5000 --fail-rate 0.2
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+import download_tables
+import get_urls
+from benchmarks.pipeline import corpus_site
+from benchmarks.server import SEARCH_PATH, serve
+from page_cache import open_cache
+from work_queue import WorkQueue
+
+class Interrupted(BaseException):
+    """The simulated kill; a BaseException so the scripts' error handling doesn't catch it"""
+
+@contextlib.contextmanager
+def interrupt_after(finished):
+    """Stop the run once `finished` more items are marked done in any work queue"""
+    original = WorkQueue.update_many
+    done = [0]
+
+    def update_many(self, kind, outcomes):
+        outcomes = list(outcomes)
+        original(self, kind, outcomes)
+        done[0] += sum(state == 'done' for _, state, _, _, _ in outcomes)
+        if done[0] >= finished:
+            raise Interrupted()
+    WorkQueue.update_many = update_many
+    try:
+        yield
+    finally:
+        WorkQueue.update_many = original
+
+def requests_sent(server, run):
+    """Call run() with its output hidden, returning how many requests the server got meanwhile"""
+    before = server.stats['requests']
+    with contextlib.redirect_stdout(io.StringIO()):
+        run()
+    return server.stats['requests'] - before
+
+def resume(server, run, queue_file, kind, interrupt_at, max_runs):
+    """Interrupt one run, then rerun until nothing failed, returning [(label, requests, state counts)]"""
+    runs = []
+    before = server.stats['requests']
+    try:
+        with interrupt_after(interrupt_at), contextlib.redirect_stdout(io.StringIO()):
+            run()
+    except Interrupted:
+        pass
+    requests = server.stats['requests'] - before
+    with WorkQueue(queue_file) as queue:
+        runs.append(('interrupted', requests, queue.counts(kind)))
+    for number in range(1, max_runs + 1):
+        with WorkQueue(queue_file) as queue:
+            counts = queue.counts(kind)
+        requests = requests_sent(server, run)
+        runs.append((f"resume {number}", requests, counts))
+        with WorkQueue(queue_file) as queue:
+            if not queue.counts(kind)['failed']:
+                break
+    return runs
+
+def read_links(filename):
+    with open(filename, 'r') as f:
+        return {line.strip() for line in f if line.strip()}
+
+def print_runs(title, reference, runs):
+    print(f"\n{title}: {reference} requests uninterrupted")
+    for label, requests, counts in runs:
+        print(f"{label:>12}: {requests:6} requests  (queue before: {counts['done']} done, "
+              f"{counts['failed']} failed, {counts['pending']} pending)")
+    total = sum(requests for _, requests, _ in runs)
+    print(f"{'total':>12}: {total:6} requests, against {runs[0][1] + reference} restarting without the queue")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark resuming interrupted searches and downloads")
+    parser.add_argument('--records', type=int, default=5000, help="records in the synthetic corpus")
+    parser.add_argument('--fail-rate', type=float, default=0.2, help="share of requests the server fails")
+    parser.add_argument('--interrupt', type=float, default=0.5, help="share of items done before the interruption")
+    parser.add_argument('--max-runs', type=int, default=5, help="most reruns to clear the failures")
+    parser.add_argument('--workers', type=int, default=8, help="concurrent downloads")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    pages, search = corpus_site(args.records, args.seed)
+    server, base_url = serve(pages, fail_rate=args.fail_rate, seed=args.seed, search=search)
+    search_url = base_url + SEARCH_PATH
+    expected = {base_url + path for path in pages}
+    start_dir = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Both scripts read and write their files in the working directory
+            os.chdir(tmp)
+            queue_file = os.path.join(tmp, 'work_queue.sqlite')
+
+            def search_run(queue=queue_file):
+                get_urls.main(rate=0, search_url=search_url, queue_file=queue)
+
+            def download_run(queue=queue_file, cache_path='cache'):
+                download_tables.main(workers=args.workers, rate=0, cache_path=cache_path, queue_file=queue)
+
+            reference_search = requests_sent(server, lambda: search_run(None))
+            search_runs = resume(server, search_run, queue_file, 'search',
+                                 max(1, int(reference_search * (1 - args.fail_rate) * args.interrupt)), args.max_runs)
+            found = read_links('unique_links.txt')
+            missing = expected - found
+
+            # The reference download goes to its own cache, the resumed one starts from an empty cache
+            reference_download = requests_sent(server, lambda: download_run(None, 'reference_cache'))
+            download_runs = resume(server, download_run, queue_file, 'download',
+                                   max(1, int(len(found) * args.interrupt)), args.max_runs)
+            cache = open_cache('cache')
+            uncached = [url for url in found if not cache.entry(url)]
+            cache.close()
+            os.chdir(start_dir)
+    finally:
+        os.chdir(start_dir)
+        server.shutdown()
+
+    print(f"{len(pages)} pages, {args.fail_rate:.0%} of requests failing, interrupted at {args.interrupt:.0%}")
+    print_runs("Search", reference_search, search_runs)
+    print_runs("Download", reference_download, download_runs)
+    print(f"\nSearch found {len(found & expected)} of {len(expected)} pages, "
+          f"{len(found) - len(uncached)} of {len(found)} pages cached")
+    if missing or uncached:
+        raise SystemExit(f"{len(missing)} pages not found, {len(uncached)} not cached after resuming")
+
+if __name__ == "__main__":
+    main()
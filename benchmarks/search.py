@@ -0,0 +1,112 @@
+"""
+Run the URL search against a local mock search endpoint.
+
+Times the adaptive asyncio crawler in get_urls.py over every two-letter
+query ("brute force"), the prefix-tree query expansion, and unless
+skipped the original fixed 10-thread pool (which sleeps a second after
+every query), and checks which links each one found against what the
+mock server holds. The server can add latency, fail a share of requests,
+reject requests beyond a fixed capacity and cap the results of each
+search, so the crawler's backoff and retries and the expansion of
+truncated queries are exercised.
+
+Run from the repository root:
+
+    python -m benchmarks.search --latency 0.05 --fail-rate 0.05 --capacity 8 --result-cap 25
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlparse
+
+import get_urls
+from benchmarks.server import SEARCH_PATH, default_search, serve
+
+def unique_links(results):
+    """The links get_urls.main would save for a {query: links} result, as path and query (the host varies)"""
+    return {urlparse(link)._replace(scheme='', netloc='').geturl()
+            for links in results.values() for link in links if "javascript" not in link.lower()}
+
+def search_and_extract_hrefs(query, url):
+    """The original search of one query: a new connection per request, and a 1s sleep after it"""
+    import requests
+    data = {'query': query}
+    
+    try:
+        response = requests.post(url, data=data)
+        response.raise_for_status()
+        
+        # Parse HTML and extract all href attributes
+        links = get_urls.extract_hrefs(response.text)
+        
+        print(f"Found {len(links)} links for query '{query}'")
+        return {query: links}
+    except Exception as e:
+        print(f"Error searching for '{query}': {e}")
+        return {query: []}
+    finally:
+        # Be nice to the server
+        time.sleep(1)
+
+def run_original(queries, url):
+    """The original search loop (10 threads, a new connection and a 1s sleep per query), returning (results, stats)"""
+    results = {}
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        for result in executor.map(partial(search_and_extract_hrefs, url=url), queries):
+            results.update(result)
+    # A failed query comes back with no links at all, not even the javascript: one
+    return results, {'failed': [query for query, links in results.items() if not links]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search crawler against a local mock endpoint")
+    parser.add_argument('--queries', type=int, default=676, help="how many of the two-letter queries to run")
+    parser.add_argument('--latency', type=float, default=0.05, help="server delay per response in seconds")
+    parser.add_argument('--fail-rate', type=float, default=0.05)
+    parser.add_argument('--capacity', type=int, default=8, help="requests the server handles at once before 503s")
+    parser.add_argument('--result-cap', type=int, default=25, help="most results per search (0 for no cap)")
+    parser.add_argument('--max-concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=0, help="searches started per second (0 for no cap)")
+    parser.add_argument('--skip-original', action='store_true', help="don't run the original thread pool")
+    args = parser.parse_args()
+
+    queries = get_urls.generate_combinations()[:args.queries]
+    # Every link the server could return: an empty query matches every name
+    expected = unique_links({'': [get_urls.make_absolute_url(link) for link in default_search('')]})
+    crawl_options = {'max_concurrency': args.max_concurrency, 'rate': args.rate, 'backoff': 0.2}
+    runs = [('brute force', lambda url: asyncio.run(get_urls.crawl(queries, url, **crawl_options))),
+            ('expanding', lambda url: asyncio.run(get_urls.expand_queries(url, **crawl_options)))]
+    if not args.skip_original:
+        runs.append(('original', partial(run_original, queries)))
+
+    print(f"{len(queries)} two-letter queries, {args.latency}s latency, {args.fail_rate:.0%} failures, "
+          f"server capacity {args.capacity}, at most {args.result_cap or 'unlimited'} results per search")
+    found_by = {}
+    for label, run in runs:
+        server, base_url = serve(latency=args.latency, fail_rate=args.fail_rate, capacity=args.capacity,
+                                 search_limit=args.result_cap)
+        try:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results, stats = run(base_url + SEARCH_PATH)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+        found = found_by[label] = unique_links(results)
+        line = (f"{label:>11}: {elapsed:6.2f}s  {server.stats['requests']:5} requests  "
+                f"{server.stats['rejected']:4} rejected as overloaded  "
+                f"{len(found)}/{len(expected)} links found  {len(stats['failed'])} queries failed")
+        if 'peak_concurrency' in stats:
+            line += f", concurrency peaked at {stats['peak_concurrency']}"
+        print(line)
+        if not found <= expected:
+            raise SystemExit(f"{label} returned links the server doesn't have")
+    missed = found_by['brute force'] - found_by['expanding']
+    print(f"Expansion found {'every' if not missed else 'NOT every'} link the brute-force search did"
+          + (f" ({len(missed)} missed)" if missed else ""))
+
+if __name__ == "__main__":
+    main()
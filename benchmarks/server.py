@@ -0,0 +1,138 @@
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote_plus
+
+from benchmarks.corpus import DEVELOPERS, FILM_MAKERS, FILM_NAMES
+
+SEARCH_PATH = '/chart/dbsearch/search.php'
+
+def default_page(path):
+    """Build a small stand-in chart page for a request path"""
+    rows = ''.join(
+        f"<tr><td>Film {i}</td><td>Developer</td><td>1+9</td><td>400</td>"
+        f"<td>{i}</td><td>{i}</td><td></td><td>20C</td><td></td></tr>"
+        for i in range(20)
+    )
+    return f"<html><body><h1>{path}</h1><table class=\"mdctable\"><tbody>{rows}</tbody></table></body></html>"
+
+def search_catalogue():
+    """Chart names the default search endpoint matches queries against: every film and developer"""
+    films = [f"{maker} {name}" for maker in FILM_MAKERS for name in FILM_NAMES]
+    return [('Film', film) for film in films] + [('Developer', developer) for developer in DEVELOPERS]
+
+def default_search(query):
+    """Result links for a search: every catalogue name containing the query, plus a javascript: link"""
+    links = [f"/devchart.php?{kind}={quote_plus(name)}&mdc=Search"
+             for kind, name in search_catalogue() if query.lower() in name.lower()]
+    return links + ["javascript:void(0)"]
+
+def search_page(links):
+    """Render search results the way the site does, as a list of anchors"""
+    items = ''.join(f"<li><a href=\"{link}\">{link}</a></li>" for link in links)
+    return f"<html><body><ul>{items}</ul></body></html>"
+
+def serve(pages=None, latency=0.0, fail_rate=0.0, seed=0, search=default_search, capacity=None, search_limit=None):
+    """
+    Start a local stand-in for the chart site in a background thread.
+
+    `pages` maps request paths to HTML (any other path gets a generated
+    page), `latency` adds a fixed delay to every response and `fail_rate`
+    answers that fraction of requests with a 503. Pages carry an ETag, and
+    a matching If-None-Match gets a bodiless 304. POSTs to SEARCH_PATH
+    answer with the links `search` returns for the query, only the first
+    search_limit of them if set (a site's result cap). With `capacity`,
+    requests arriving while that many are already being handled get a
+    503, like an overloaded server. Returns the server and its base URL;
+    call server.shutdown() when done.
+    """
+    pages = pages or {}
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {'requests': 0, 'searches': 0, 'rejected': 0, 'active': 0, 'peak_active': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body, etag=None):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            if etag:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def start_request(self):
+            """Count a request and decide whether it fails, returning True if it should be answered"""
+            with rng_lock:
+                stats['requests'] += 1
+                fail = rng.random() < fail_rate
+                overloaded = capacity is not None and stats['active'] >= capacity
+                if overloaded:
+                    stats['rejected'] += 1
+                else:
+                    stats['active'] += 1
+                    stats['peak_active'] = max(stats['peak_active'], stats['active'])
+            if overloaded:
+                self.send_body(503, "overloaded")
+                return False
+            if latency:
+                time.sleep(latency)
+            if fail:
+                self.end_request()
+                self.send_body(503, "unavailable")
+                return False
+            return True
+
+        def end_request(self):
+            with rng_lock:
+                stats['active'] -= 1
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            form = parse_qs(self.rfile.read(length).decode('utf-8'))
+            if self.path != SEARCH_PATH:
+                self.send_body(404, "not found")
+                return
+            if not self.start_request():
+                return
+            try:
+                with rng_lock:
+                    stats['searches'] += 1
+                links = search(form.get('query', [''])[0])
+                self.send_body(200, search_page(links[:search_limit] if search_limit else links))
+            finally:
+                self.end_request()
+
+        def do_GET(self):
+            if not self.start_request():
+                return
+            try:
+                self.send_page()
+            finally:
+                self.end_request()
+
+        def send_page(self):
+            body = pages.get(self.path) or default_page(self.path)
+            etag = '"%s"' % hashlib.sha256(body.encode('utf-8')).hexdigest()[:16]
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_body(200, body, etag)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
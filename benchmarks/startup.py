@@ -0,0 +1,102 @@
+"""
+Startup cost of each stage, and of a run with nothing to do, through cli.py and the scripts.
+
+A synthetic corpus is served from a local stand-in site and run through
+all four stages once with cli.py, so every stage is up to date. Then,
+each in a fresh process (as a scheduler starts them), the benchmark times:
+
+- import: `import <script>`, and which of requests, bs4 and pandas that loads
+- cli: `cli.py <stage>`, which finds the stage up to date and stops
+- script: `<script>.py`, which has no such check and does its (cached) work
+- forced: `cli.py <stage> --force`, with the startup timers from its run report
+
+Each time is the median of --repeat runs.
+
+Run from the repository root:
+
+    python -m benchmarks.startup --records 5000 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cli
+from benchmarks.pipeline import corpus_site
+from benchmarks.server import SEARCH_PATH, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['requests', 'bs4', 'pandas']
+
+def run_process(command, cwd):
+    """Run a command to completion, returning its wall time in seconds and its output"""
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise SystemExit(f"{' '.join(command)} failed:\n{result.stderr}")
+    return elapsed, result.stdout
+
+def median_time(command, cwd, repeat):
+    return statistics.median(run_process(command, cwd)[0] for _ in range(repeat))
+
+def import_cost(module, cwd, repeat):
+    """Median seconds to start Python and import a module, and the heavy modules it loads"""
+    code = (f"import sys; sys.path.insert(0, {ROOT!r}); import {module}; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    seconds = median_time([sys.executable, '-c', code], cwd, repeat)
+    return seconds, run_process([sys.executable, '-c', code], cwd)[1].strip()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stage startup through cli.py and the scripts")
+    parser.add_argument('--records', type=int, default=5000, help="records in the synthetic corpus")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of each command; the median is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    pages, search = corpus_site(args.records, args.seed)
+    server, base_url = serve(pages, search=search)
+    stage_options = {
+        'search': ['--search-url', base_url + SEARCH_PATH, '--rate', '0'],
+        'download': ['--rate', '0', '--workers', '8'],
+        'parse': [],
+        'clean': []
+    }
+    python = sys.executable
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for stage, options in stage_options.items():
+                run_process([python, os.path.join(ROOT, 'cli.py'), stage] + options, tmp)
+            baseline, _ = run_process([python, '-c', 'pass'], tmp)
+
+            for stage, options in stage_options.items():
+                module = cli.STAGES[stage][0]
+                import_seconds, loaded = import_cost(module, tmp, args.repeat)
+                cli_seconds = median_time([python, os.path.join(ROOT, 'cli.py'), stage] + options, tmp, args.repeat)
+                script_seconds = median_time([python, os.path.join(ROOT, f"{module}.py")] + options, tmp, args.repeat)
+                # The direct script run changed the outputs, so the forced run is the one that stamps them again
+                report_file = os.path.join(tmp, f"{stage}_startup.json")
+                forced_seconds, _ = run_process([python, os.path.join(ROOT, 'cli.py'), stage, '--force',
+                                                 '--metrics', report_file] + options, tmp)
+                with open(report_file, 'r', encoding='utf-8') as f:
+                    timers = json.load(f)['timers']
+                rows.append((stage, import_seconds, loaded, cli_seconds, script_seconds, forced_seconds,
+                             timers['startup']['seconds'], timers['startup.import']['seconds']))
+    finally:
+        server.shutdown()
+
+    print(f"{len(pages)} pages, every stage up to date; bare interpreter start: {baseline * 1e3:.0f}ms")
+    print(f"{'stage':>9} {'import':>8} {'cli':>8} {'script':>8} {'forced':>8} {'startup':>8} "
+          f"{'loading':>8}  heavy modules on import")
+    for stage, imported, loaded, cli_seconds, script_seconds, forced, startup, loading in rows:
+        print(f"{stage:>9} " + ' '.join(f"{value * 1e3:>6.0f}ms"
+                                        for value in (imported, cli_seconds, script_seconds, forced, startup, loading))
+              + f"  {loaded or 'none'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Time every stage of a refresh on synthetic corpora of several sizes, and keep the results per commit.
+
+For each size a synthetic site (see corpus.py: missing </tr> tags,
+tables with and without <tbody>, [notes] links, ranges, two-stage
+times, Fahrenheit readings, invalid values and pages without a chart)
+is served from a local stand-in with a search endpoint, and the stages
+run as the scripts run them, one after another:
+
+- search: get_urls.expand_queries against the local search endpoint
+- download: download_tables.download_all into an empty cache
+- parse: parse_tables.parse_all, dropping duplicates as by default
+- clean: clean_data.clean_film_data with a fresh name map
+- store: chart_store.build_store
+
+Each stage's time is the best of --repeat runs. Counters from metrics.py
+(pages, rows, bytes) are kept next to the timings, and the search must
+find every page of the corpus.
+
+Results are written to benchmarks/results/<commit>.json (with -dirty
+when the tree has uncommitted changes) and compared with an earlier
+file, by default the newest one from another commit: a stage slower by
+more than --tolerance (and by more than the noise floor) is reported as
+a regression, and with --check the run exits with status 1.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --sizes 1000 5000 20000
+    python -m benchmarks.suite --baseline 1a2b3c4 --check
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import chart_store
+import clean_data
+import download_tables
+import get_urls
+import metrics
+import parse_tables
+from benchmarks.pipeline import corpus_site
+from benchmarks.server import SEARCH_PATH, serve
+from page_cache import open_cache
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+STAGES = ['search', 'download', 'parse', 'clean', 'store']
+# Differences smaller than this are timer noise, whatever the percentage
+NOISE_SECONDS = 0.05
+
+def git_revision():
+    """Short hash of HEAD, with -dirty if tracked files have changed, or 'unknown' outside git"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        changed = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                                 text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if changed else commit
+
+def run_stages(base_url, pages, tmp, args):
+    """Run every stage once in order, returning ({stage: seconds}, counters)"""
+    cache_path = os.path.join(tmp, 'cache')
+    raw_file = os.path.join(tmp, 'raw.csv')
+    valid_file = os.path.join(tmp, 'valid.csv')
+    with metrics.run_report('suite') as run:
+        with metrics.timer('search'):
+            results, _ = asyncio.run(get_urls.expand_queries(base_url + SEARCH_PATH,
+                                                             max_concurrency=args.search_concurrency, rate=0))
+        links = sorted({link for found in results.values() for link in found if "javascript" not in link.lower()})
+        if len(links) != len(pages):
+            raise SystemExit(f"Search found {len(links)} of {len(pages)} pages")
+
+        with metrics.timer('download'):
+            cache = open_cache(cache_path)
+            download_tables.download_all(links, cache, workers=args.workers, rate=0, backoff=0.1)
+            cache.close()
+
+        with metrics.timer('parse'):
+            parse_tables.parse_all(links, cache_path, raw_file, sources_file=os.path.join(tmp, 'sources.csv'))
+
+        with metrics.timer('clean'):
+            clean_data.clean_film_data(raw_file, valid_file, os.path.join(tmp, 'invalid.csv'),
+                                       name_map=os.path.join(tmp, 'name_map.json'))
+
+        with metrics.timer('store'):
+            chart_store.build_store(valid_file, os.path.join(tmp, 'charts.sqlite'))
+        report = run.report()
+    return {stage: report['timers'][stage]['seconds'] for stage in STAGES}, report['counters']
+
+def run_size(records, args):
+    """Best time of each stage over args.repeat runs on a corpus of `records` records"""
+    pages, search = corpus_site(records, args.seed)
+    server, base_url = serve(pages, latency=args.latency, search=search)
+    best = {}
+    try:
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+                seconds, counters = run_stages(base_url, pages, tmp, args)
+            best = {stage: min(seconds[stage], best.get(stage, seconds[stage])) for stage in STAGES}
+    finally:
+        server.shutdown()
+    return {
+        'records': records,
+        'pages': len(pages),
+        'seconds': {stage: round(value, 4) for stage, value in best.items()},
+        'counters': counters
+    }
+
+def find_baseline(baseline, revision):
+    """The results file to compare with: a path, a commit prefix, or the newest from another commit"""
+    if baseline and os.path.exists(baseline):
+        return baseline
+    files = glob.glob(os.path.join(RESULTS_DIR, '*.json'))
+    if baseline:
+        files = [f for f in files if os.path.basename(f).startswith(baseline)]
+    else:
+        files = [f for f in files if os.path.basename(f) != f"{revision}.json"]
+    return max(files, key=os.path.getmtime, default=None)
+
+def compare(current, previous, tolerance):
+    """Print each stage against the previous results, returning the regressions"""
+    before = {size['records']: size['seconds'] for size in previous['sizes']}
+    regressions = []
+    print(f"\nCompared with {previous['revision']} ({previous['date']}):")
+    for size in current['sizes']:
+        old = before.get(size['records'])
+        if not old:
+            print(f"{size['records']:>8} records: not in the baseline")
+            continue
+        changes = []
+        for stage in STAGES:
+            now, then = size['seconds'][stage], old.get(stage)
+            if then is None:
+                continue
+            change = (now - then) / then if then else 0.0
+            slower = change > tolerance and now - then > NOISE_SECONDS
+            if slower:
+                regressions.append((size['records'], stage, then, now))
+            changes.append(f"{stage} {change:+.0%}{' REGRESSION' if slower else ''}")
+        print(f"{size['records']:>8} records: {', '.join(changes)}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every stage on synthetic corpora and track results by commit")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000], help="records per corpus")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per size; each stage keeps its best time")
+    parser.add_argument('--latency', type=float, default=0.0, help="server delay per response in seconds")
+    parser.add_argument('--workers', type=int, default=8, help="concurrent downloads")
+    parser.add_argument('--search-concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', help="results file or commit to compare with (default: the newest other)")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="slowdown counted as a regression (0.1 = 10%%)")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 if any stage regressed")
+    parser.add_argument('--no-save', action='store_true', help="don't write the results file")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    results = {
+        'revision': revision,
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'latency': args.latency,
+        'repeat': args.repeat,
+        'sizes': []
+    }
+    print(f"{'records':>8} {'pages':>6} " + ' '.join(f"{stage:>9}" for stage in STAGES) + f" {'rows/s':>9}")
+    for records in args.sizes:
+        start = time.perf_counter()
+        size = run_size(records, args)
+        results['sizes'].append(size)
+        rows_per_second = size['counters'].get('parse.rows', 0) / (size['seconds']['parse'] or 1)
+        print(f"{records:>8} {size['pages']:>6} " + ' '.join(f"{size['seconds'][stage]:>8.2f}s" for stage in STAGES) +
+              f" {rows_per_second:>9.0f}  ({time.perf_counter() - start:.0f}s)")
+
+    baseline = find_baseline(args.baseline, revision)
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        metrics.write_report(results, os.path.join(RESULTS_DIR, f"{revision}.json"))
+        print(f"Saved results to {os.path.join(RESULTS_DIR, revision + '.json')}")
+
+    if baseline is None:
+        print("No earlier results to compare with")
+        return
+    with open(baseline, 'r', encoding='utf-8') as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions and args.check:
+        raise SystemExit(f"{len(regressions)} stage timings regressed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Check the vectorized validation masks in clean_data against the original
+row-wise functions on a large synthetic table, and time both.
+
+Values are drawn from pools mixing the real chart's formats with edge
+cases (ranges with spaces or extra hyphens, parentheses, Unicode digits
+and whitespace, '*see notes*', empty strings). The table is checked as
+read_csv would type it (text columns), with numbers mixed into text
+columns, and with a purely numeric ASA/ISO column.
+
+Run from the repository root:
+
+    python -m benchmarks.validate --rows 2000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import clean_data
+from benchmarks import clean_reference
+
+TEXT_POOL = ['Kodak Tri-X 400', 'D-76', '1+1', 'stock', '*see notes*', '', ' ', 'x', '20C', '68F', '5-6', '(400)']
+ISO_POOL = [
+    '400', '200-400', ' 200-400 ', '200 - 400', '(400)', '400)', '?', '3200', '1.5', '.5', '5.', '.', '-',
+    '-5', '5-', '1-2-3', '1--2', '1.2.3', '1e3', 'inf', 'nan', 'EI 400', '', ' ', '*see notes*', '٣٢٠٠',
+    '\xa0400\xa0', '\x1c400', '400\x85', '²', '12​', '\t100\n', '100-١٢'
+]
+TIME_POOL = ['7', '7.5', '10-11', '5+5', '', ' ', '*see notes*', '?', '6 1/2', '-', '1e1']
+
+def make_frame(rows, seed=0):
+    """Build a raw chart table of text columns with NaN for empty cells"""
+    rng = np.random.default_rng(seed)
+
+    def column(pool, nan_rate=0.05):
+        values = pd.Series(rng.choice(np.array(pool, dtype=object), rows), dtype=object)
+        values[rng.random(rows) < nan_rate] = np.nan
+        return values.astype('str')
+
+    return pd.DataFrame({
+        'Film': column(TEXT_POOL),
+        'Developer': column(TEXT_POOL),
+        'Dilution': column(TEXT_POOL),
+        'ASA/ISO': column(ISO_POOL),
+        '35mm': column(TIME_POOL, 0.2),
+        '120': column(TIME_POOL, 0.3),
+        'Sheet': column(TIME_POOL, 0.5),
+        'Temp': column(TEXT_POOL),
+    })
+
+def variants(df, seed=0):
+    """The same table typed the different ways read_csv can produce"""
+    rng = np.random.default_rng(seed)
+    yield 'text columns', df
+
+    mixed = df.astype(object)
+    # Chunked read_csv can leave numbers among the strings of a column
+    picks = rng.random(len(df)) < 0.1
+    mixed.loc[picks, 'ASA/ISO'] = rng.choice(np.array([400, 3200, 1.5, -5.0, float('nan'), True], dtype=object),
+                                             int(picks.sum()))
+    mixed.loc[picks, 'Film'] = 0
+    yield 'mixed object columns', mixed
+
+    numeric = df.copy()
+    numeric['ASA/ISO'] = rng.choice(np.array([100.0, 400.0, -5.0, np.nan]), len(df))
+    yield 'numeric ASA/ISO', numeric
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vectorized and row-wise validation masks")
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.seed)
+    failures = 0
+    for name, frame in variants(df, args.seed):
+        start = time.perf_counter()
+        expected = clean_reference.validity_masks(frame)
+        row_wise = time.perf_counter() - start
+        start = time.perf_counter()
+        masks = clean_data.validity_masks(frame)
+        vectorized = time.perf_counter() - start
+
+        print(f"{name} ({len(frame)} rows): row-wise {row_wise:.2f}s, vectorized {vectorized:.2f}s, "
+              f"{row_wise / vectorized:.1f}x")
+        for key, mask in expected.items():
+            mismatches = int((masks[key] != mask).sum())
+            if mismatches:
+                failures += 1
+                print(f"\tMISMATCH {key}: {mismatches} rows, e.g. {frame.loc[masks[key] != mask].head(3).to_dict('records')}")
+    if failures:
+        raise SystemExit(f"{failures} masks differ from the row-wise reference")
+    print("All masks identical")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compare writing parsed rows page by page (reopening the CSV each time)
+with the batched TableWriter, on its own and as part of the parse stage.
+
+Run from the repository root:
+
+    python -m benchmarks.write --records 20000
+"""
+import argparse
+import contextlib
+import csv
+import filecmp
+import io
+import os
+import tempfile
+import time
+
+import parse_tables
+from benchmarks.corpus import fill_cache, make_corpus
+from page_cache import open_cache
+from table_writer import TableWriter, read_table
+
+def write_to_csv(data, filename, append=False):
+    """The original writer: open the CSV, write or append the rows, close it"""
+    mode = 'a' if append else 'w'
+    
+    with open(filename, mode, newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerows(data)
+
+def write_per_page(pages, csv_file):
+    """The original output loop: one open/append per page"""
+    write_to_csv(pages[0], csv_file)
+    for data in pages[1:]:
+        write_to_csv(data[1:], csv_file, append=True)
+
+def write_batched(pages, csv_file, columnar_file=None):
+    """Stream every page's rows through one TableWriter"""
+    with TableWriter(csv_file, pages[0][0], columnar_file) as writer:
+        for data in pages:
+            writer.write_rows(data[1:])
+
+def parse_per_page(links, cache_path, csv_file):
+    """The parse stage with the original per-page writes"""
+    first = True
+    for url, data, error in parse_tables.parse_pages(links, cache_path):
+        if error or not data:
+            continue
+        write_to_csv(data if first else data[1:], csv_file, append=not first)
+        first = False
+
+def timed(function, *args, repeat=3):
+    """Best wall time of a few quiet runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-page vs batched output of parsed rows")
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.records)
+    links = sorted(corpus)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'cache')
+        cache = open_cache(cache_path)
+        fill_cache(cache, corpus)
+        pages = [data for url, data, error in parse_tables.parse_pages(links, cache_path) if data]
+        rows = sum(len(data) - 1 for data in pages)
+        print(f"{len(pages)} pages, {rows} rows")
+
+        old_csv = os.path.join(tmp, 'per_page.csv')
+        new_csv = os.path.join(tmp, 'batched.csv')
+        print("Output only:")
+        print(f"{'per page':>20}: {timed(write_per_page, pages, old_csv):6.3f}s")
+        print(f"{'batched':>20}: {timed(write_batched, pages, new_csv):6.3f}s  "
+              f"{'identical' if filecmp.cmp(old_csv, new_csv, shallow=False) else 'OUTPUT DIFFERS'}")
+        for extension in ['.parquet', '.arrow']:
+            columnar_file = os.path.join(tmp, f"batched{extension}")
+            elapsed = timed(write_batched, pages, new_csv, columnar_file)
+            same = read_table(columnar_file).equals(read_table(new_csv, dtype=str))
+            print(f"{'batched + ' + extension[1:]:>20}: {elapsed:6.3f}s  "
+                  f"{'same rows' if same else 'ROWS DIFFER'}")
+
+        print("Whole parse stage:")
+        print(f"{'per page':>20}: {timed(parse_per_page, links, cache_path, old_csv):6.3f}s")
+        print(f"{'batched':>20}: {timed(parse_tables.parse_all, links, cache_path, new_csv):6.3f}s  "
+              f"{'identical' if filecmp.cmp(old_csv, new_csv, shallow=False) else 'OUTPUT DIFFERS'}")
+
+if __name__ == "__main__":
+    main()
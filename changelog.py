@@ -0,0 +1,282 @@
+"""
+What changed in the cleaned data since the last refresh, as a compact delta.
+
+Every refresh rewrites valid_all-film-all-developer.csv in full.
+update_changelog() compares the new file with the copy kept from the
+last run (valid_all-film-all-developer.previous.csv), writes the
+difference to changes.jsonl, and keeps the new file for next time, so
+consumers can apply the delta instead of reloading everything.
+
+Rows are joined on their key, (Film, Developer, Dilution, ASA/ISO) by
+default. A key can have several rows (other temperatures, formats), so:
+
+1. rows whose whole line is unchanged match first, repeats included
+   (each identical line needs its own partner);
+2. the rows left under a key pair up in file order as modified rows,
+   with the fields that differ;
+3. whatever is still left was added (new file) or removed (old file).
+
+Neither file is loaded into a DataFrame. A first pass over each keeps
+two 64-bit hashes per row, of its key and of its whole line; the join
+runs on those arrays, and a second pass reads back only the lines in the
+delta. Memory is about 16 bytes a row plus the changed rows. Two
+different lines with the same hash would hide a change, which at 64
+bits is vanishingly unlikely even for millions of rows. Lines are split
+on line breaks, so quoted cells can't contain one (pandas never writes
+one for this data).
+
+The delta is JSON Lines, cells as written in the CSV and empty ones as
+null. The first line sums it up:
+
+    {"changelog": 1, "key": [...], "columns": [...], "added": 3, "removed": 1, "modified": 2, "unchanged": 981}
+
+then one line per change:
+
+    {"op": "remove", "key": {...}, "row": {...}}
+    {"op": "modify", "key": {...}, "changes": {"dev_total_time": ["7.5", "8.0"]}}
+    {"op": "add", "key": {...}, "row": {...}}
+
+A modified row whose key had more than one row in the old file also
+carries "old", its whole old row, to tell it apart from the others.
+"""
+import os
+import csv
+import json
+import shutil
+import argparse
+import operator
+import numpy as np
+import pandas as pd
+import metrics
+import cli
+
+CHANGELOG_VERSION = 1
+KEY_COLUMNS = ['Film', 'Developer', 'Dilution', 'ASA/ISO']
+# Bytes read at a time; each block's lines are hashed together
+BLOCK_SIZE = 4 * 1024 * 1024
+# Mixed into the hash of a repeated line, times its repeat number, to tell the copies apart
+REPEAT_MIX = np.int64(-7046029254386353131)
+
+def previous_path(input_file):
+    """Where the copy of a file from the last run is kept: name.previous.ext"""
+    root, ext = os.path.splitext(input_file)
+    return f"{root}.previous{ext}"
+
+def read_blocks(f, block_size=BLOCK_SIZE):
+    """Yield lists of the complete lines in a binary file, without their line breaks"""
+    rest = b''
+    while True:
+        data = f.read(block_size)
+        if not data:
+            break
+        lines = (rest + data).split(b'\n')
+        rest = lines.pop()
+        yield lines
+    if rest:
+        yield [rest]
+
+def data_lines(f, crlf):
+    """Yield the blocks of data lines after the header, with any carriage returns removed"""
+    for lines in read_blocks(f):
+        yield [line[:-1] for line in lines] if crlf else lines
+
+def hash_keys(lines, key_indices):
+    """
+    Hash the key cells of each line.
+
+    Most lines have no quotes and are split on commas, only as far as the
+    last key cell; the few that do go through the csv module together.
+    Key cells are hashed as bytes either way, so a key hashes the same
+    whether or not its line needed quotes.
+    """
+    key_of = operator.itemgetter(*key_indices)
+    split_at = max(key_indices) + 1
+    keys = [None if b'"' in line else key_of(line.split(b',', split_at)) for line in lines]
+    if None in keys:
+        quoted = [i for i, key in enumerate(keys) if key is None]
+        if any(lines[i].count(b'"') % 2 for i in quoted):
+            raise Exception("Quoted cells with line breaks aren't supported")
+        for i, row in zip(quoted, csv.reader([lines[i].decode('utf-8') for i in quoted])):
+            key = key_of(row)
+            keys[i] = tuple(cell.encode('utf-8') for cell in key) if len(key_indices) > 1 else key.encode('utf-8')
+    return np.fromiter(map(hash, keys), dtype=np.int64, count=len(keys))
+
+def read_header(f):
+    """The column names of a CSV opened in binary mode, and whether its lines end in CRLF"""
+    header = f.readline()
+    crlf = header.endswith(b'\r\n')
+    return next(csv.reader([header.decode('utf-8')])), crlf
+
+@metrics.timed('changes.index')
+def index_rows(filename, key_columns):
+    """Hash every row of a CSV: returns (columns, key hashes, line hashes)"""
+    with open(filename, 'rb') as f:
+        columns, crlf = read_header(f)
+        missing = [column for column in key_columns if column not in columns]
+        if missing:
+            raise Exception(f"{filename} has no {', '.join(missing)} column")
+        key_indices = [columns.index(column) for column in key_columns]
+        keys = []
+        rows = []
+        for lines in data_lines(f, crlf):
+            rows.append(np.fromiter(map(hash, lines), dtype=np.int64, count=len(lines)))
+            keys.append(hash_keys(lines, key_indices))
+    metrics.count('changes.rows', sum(len(block) for block in rows))
+    return columns, np.concatenate(keys or [[]]).astype(np.int64), np.concatenate(rows or [[]]).astype(np.int64)
+
+def repeat_numbers(values):
+    """Number each value by how many times it came before, 0 for the first"""
+    return pd.Series(values).groupby(values, sort=False).cumcount().to_numpy()
+
+def distinct_hashes(values):
+    """Hashes with repeated values made distinct (the first copy keeps its own), so multisets match with isin"""
+    repeated = pd.Series(values).duplicated().to_numpy()
+    if not repeated.any():
+        return values
+    later = values[repeated]
+    values = values.copy()
+    values[repeated] = later ^ ((repeat_numbers(later) + 1).astype(np.int64) * REPEAT_MIX)
+    return values
+
+@metrics.timed('changes.match')
+def match_rows(old_keys, old_rows, new_keys, new_rows):
+    """
+    Join the two files' rows, returning (modified old/new position pairs, removed positions, added positions).
+
+    Identical lines match first; the rest pair up by key in file order.
+    """
+    old_distinct = distinct_hashes(old_rows)
+    new_distinct = distinct_hashes(new_rows)
+    old_left = np.flatnonzero(~pd.Series(old_distinct).isin(new_distinct).to_numpy())
+    new_left = np.flatnonzero(~pd.Series(new_distinct).isin(old_distinct).to_numpy())
+
+    old = pd.DataFrame({'key': old_keys[old_left], 'old': old_left})
+    new = pd.DataFrame({'key': new_keys[new_left], 'new': new_left})
+    old['n'] = repeat_numbers(old['key'].to_numpy())
+    new['n'] = repeat_numbers(new['key'].to_numpy())
+    pairs = old.merge(new, on=['key', 'n'], how='outer')
+    modified = pairs.dropna(subset=['old', 'new']).sort_values('new')
+    removed = pairs.loc[pairs['new'].isna(), 'old']
+    added = pairs.loc[pairs['old'].isna(), 'new']
+    return (modified[['old', 'new']].to_numpy(dtype=np.int64), np.sort(removed.to_numpy(dtype=np.int64)),
+            np.sort(added.to_numpy(dtype=np.int64)))
+
+def read_rows(filename, positions):
+    """{position: cells} for the data rows at the given positions"""
+    wanted = np.zeros(0, dtype=bool)
+    if len(positions):
+        wanted = np.zeros(int(positions.max()) + 1, dtype=bool)
+        wanted[positions] = True
+    rows = {}
+    with open(filename, 'rb') as f:
+        _, crlf = read_header(f)
+        start = 0
+        for lines in data_lines(f, crlf):
+            if start >= len(wanted):
+                break
+            for i in np.flatnonzero(wanted[start:start + len(lines)]):
+                rows[start + int(i)] = next(csv.reader([lines[i].decode('utf-8')]))
+            start += len(lines)
+    return rows
+
+def cells(columns, row):
+    """A row as {column: cell}, empty cells as None"""
+    return {column: cell or None for column, cell in zip(columns, row)}
+
+@metrics.timed('changes.write')
+def write_changes(changes_file, summary, columns, key_columns, old_rows, new_rows, modified, removed, added,
+                  ambiguous):
+    """Write the delta as JSON Lines, through a temporary file"""
+    key_indices = [columns.index(column) for column in key_columns]
+
+    def key(row):
+        return {column: row[i] or None for column, i in zip(key_columns, key_indices)}
+
+    tmp_file = f"{changes_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(summary) + '\n')
+        for position in removed:
+            row = old_rows[position]
+            f.write(json.dumps({'op': 'remove', 'key': key(row), 'row': cells(columns, row)}) + '\n')
+        for (old_position, new_position), repeated in zip(modified, ambiguous):
+            old, new = old_rows[old_position], new_rows[new_position]
+            change = {'op': 'modify', 'key': key(new),
+                      'changes': {column: [before or None, after or None]
+                                  for column, before, after in zip(columns, old, new) if before != after}}
+            if repeated:
+                change['old'] = cells(columns, old)
+            f.write(json.dumps(change) + '\n')
+        for position in added:
+            row = new_rows[position]
+            f.write(json.dumps({'op': 'add', 'key': key(row), 'row': cells(columns, row)}) + '\n')
+    os.replace(tmp_file, changes_file)
+
+def diff_files(old_file, new_file, changes_file, key_columns=KEY_COLUMNS):
+    """
+    Write the changes from old_file to new_file as a delta, returning its summary.
+
+    With old_file None every row of new_file is added.
+    """
+    columns, new_keys, new_hashes = index_rows(new_file, key_columns)
+    if old_file is None:
+        old_keys = old_hashes = np.zeros(0, dtype=np.int64)
+    else:
+        old_columns, old_keys, old_hashes = index_rows(old_file, key_columns)
+        if old_columns != columns:
+            raise Exception(f"The columns of {new_file} changed since {old_file}: "
+                            f"remove {old_file} to start the changelog again")
+    modified, removed, added = match_rows(old_keys, old_hashes, new_keys, new_hashes)
+
+    old_rows = read_rows(old_file, np.concatenate([modified[:, 0], removed])) if old_file else {}
+    new_rows = read_rows(new_file, np.concatenate([modified[:, 1], added]))
+    # Modified rows whose key has other rows in the old file need their old row to be found
+    modified_keys = old_keys[modified[:, 0]]
+    key_counts = pd.Series(old_keys[pd.Series(old_keys).isin(modified_keys).to_numpy()]).value_counts()
+    ambiguous = key_counts.reindex(modified_keys).to_numpy() > 1
+
+    summary = {
+        'changelog': CHANGELOG_VERSION,
+        'key': list(key_columns),
+        'columns': columns,
+        'added': len(added),
+        'removed': len(removed),
+        'modified': len(modified),
+        'unchanged': len(old_keys) - len(removed) - len(modified)
+    }
+    write_changes(changes_file, summary, columns, key_columns, old_rows, new_rows, modified, removed, added,
+                  ambiguous)
+    for name in ['added', 'removed', 'modified']:
+        metrics.count(f'changes.{name}', summary[name])
+    return summary
+
+def update_changelog(input_file, changes_file, previous_file=None, key_columns=KEY_COLUMNS):
+    """
+    Write the changes to input_file since the last call, then keep a copy of it for the next one.
+
+    The copy goes to previous_file (by default name.previous.ext next to
+    input_file). The first time, with no copy yet, every row is added.
+    """
+    previous_file = previous_file or previous_path(input_file)
+    summary = diff_files(previous_file if os.path.exists(previous_file) else None, input_file, changes_file,
+                         key_columns)
+    tmp_file = f"{previous_file}.tmp"
+    shutil.copyfile(input_file, tmp_file)
+    os.replace(tmp_file, previous_file)
+    return summary
+
+def run(args):
+    """Update the changelog with the options from cli.add_changes_arguments"""
+    first = not os.path.exists(args.previous or previous_path(args.input))
+    with metrics.timer('changes'):
+        summary = update_changelog(args.input, args.output, args.previous, args.key or KEY_COLUMNS)
+    if first:
+        print(f"No earlier version of {args.input}: every row is listed as added")
+    print(f"{summary['added']} rows added, {summary['removed']} removed, {summary['modified']} modified, "
+          f"{summary['unchanged']} unchanged; changes saved to {args.output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write what changed in the cleaned data since the last run")
+    cli.add_changes_arguments(parser)
+    args = parser.parse_args()
+    with metrics.run_report('changelog', args.metrics, args.profile):
+        run(args)
@@ -0,0 +1,142 @@
+"""
+Indexed SQLite store of the cleaned development data, with a lookup API.
+
+build_store() loads valid_all-film-all-developer.csv into one table
+with indexes for the questions darkroom tools ask (film, developer,
+dilution and ISO, names compared case-insensitively), so a lookup is an
+index probe instead of a scan of the whole CSV:
+
+    with ChartStore('charts.sqlite') as store:
+        for row in store.lookup(film='Kodak Tri-X 400', developer='D-76', dilution='1+1'):
+            print(row['iso'], row['total_time'])
+
+Times are returned for `temperature` (20°C unless asked otherwise),
+converted from the temperature on the chart with normalize_time.
+"""
+import os
+import math
+import sqlite3
+import argparse
+from table_writer import read_table
+
+# Development time changes by about 8% per °C: t(T2) = t(T1) * exp(-k * (T2 - T1))
+TEMPERATURE_COEFFICIENT = 0.081
+FORMATS = ['35mm', '120', 'Sheet']
+
+# Cleaned CSV column -> store column; per-format columns may be missing from the CSV
+COLUMNS = {
+    'Film': 'film',
+    'Developer': 'developer',
+    'Dilution': 'dilution',
+    'ASA/ISO': 'iso',
+    'is_two_stage_developer': 'two_stage',
+    'dev_total_time': 'total_time',
+    'dev_first_stage': 'first_stage',
+    'dev_second_stage': 'second_stage',
+    **{f'{fmt}_{part}': f'{part}_{fmt.lower()}' for fmt in FORMATS
+       for part in ['total_time', 'first_stage', 'second_stage']},
+    'Temperature_C': 'temperature_c'
+}
+TIME_COLUMNS = [column for column in COLUMNS.values()
+                if column not in ('film', 'developer', 'dilution', 'iso', 'two_stage', 'temperature_c')]
+# Every lookup is one of these shapes, each served by an index
+INDEXES = {
+    'times_film': ['film', 'developer', 'dilution', 'iso'],
+    'times_developer': ['developer', 'dilution', 'iso'],
+    'times_iso': ['iso']
+}
+
+def normalize_time(minutes, from_temperature, to_temperature=20.0, coefficient=TEMPERATURE_COEFFICIENT):
+    """Convert a development time at one temperature (°C) to the equivalent time at another"""
+    if minutes is None or from_temperature is None:
+        return minutes
+    return minutes * math.exp(-coefficient * (to_temperature - from_temperature))
+
+def build_store(csv_file, db_file):
+    """
+    Build the store from a cleaned CSV, returning the number of rows.
+
+    The database is written under a temporary name and moved into place,
+    so tools reading the old store never see a half-built one.
+    """
+    # Per-format columns clean_data.py left out come back as NULLs
+    df = read_table(csv_file).rename(columns=COLUMNS).reindex(columns=list(COLUMNS.values()))
+
+    tmp_file = f"{db_file}.tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    conn = sqlite3.connect(tmp_file)
+    try:
+        names = ['film', 'developer', 'dilution']
+        definitions = [f"{column} TEXT NOT NULL COLLATE NOCASE" if column in names else
+                       f"{column} NUMERIC" if column == 'iso' else
+                       f"{column} INTEGER" if column == 'two_stage' else f"{column} REAL"
+                       for column in COLUMNS.values()]
+        conn.execute(f"CREATE TABLE times ({', '.join(definitions)})")
+        placeholders = ', '.join('?' * len(COLUMNS))
+        rows = df.astype(object).where(df.notna(), None)
+        conn.executemany(f"INSERT INTO times VALUES ({placeholders})", rows.itertuples(index=False, name=None))
+        for name, columns in INDEXES.items():
+            conn.execute(f"CREATE INDEX {name} ON times ({', '.join(columns)})")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_file, db_file)
+    return len(df)
+
+class ChartStore:
+    """Read-only lookups against a store built by build_store"""
+
+    def __init__(self, db_file):
+        if not os.path.exists(db_file):
+            raise Exception(f"Chart store not found: {db_file} (build it with chart_store.py)")
+        self.conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+
+    def lookup(self, film=None, developer=None, dilution=None, iso=None, temperature=20.0):
+        """
+        Return every chart row matching the given fields, as dicts.
+
+        Names match case-insensitively; fields left as None match
+        anything. Time columns are converted to `temperature` (°C), the
+        chart's own temperature stays in temperature_c.
+        """
+        fields = {'film': film, 'developer': developer, 'dilution': dilution, 'iso': iso}
+        conditions = [f"{column} = ?" for column, value in fields.items() if value is not None]
+        values = [value for value in fields.values() if value is not None]
+        query = "SELECT * FROM times"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        rows = []
+        for row in self.conn.execute(query, values):
+            row = dict(row)
+            for column in TIME_COLUMNS:
+                row[column] = normalize_time(row[column], row['temperature_c'], temperature)
+            rows.append(row)
+        return rows
+
+    def films(self, developer=None):
+        """List the films in the store, optionally only those with times for a developer"""
+        if developer is None:
+            query, values = "SELECT DISTINCT film FROM times ORDER BY film", []
+        else:
+            query, values = "SELECT DISTINCT film FROM times WHERE developer = ? ORDER BY film", [developer]
+        return [row[0] for row in self.conn.execute(query, values)]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the indexed chart store from the cleaned data")
+    parser.add_argument('--input', default='valid_all-film-all-developer.csv', help="cleaned CSV from clean_data.py")
+    parser.add_argument('--db', default='charts.sqlite', help="store to write")
+    args = parser.parse_args()
+    count = build_store(args.input, args.db)
+    print(f"Stored {count} rows in {args.db}")
@@ -1,310 +1,635 @@
+import numpy as np
 import pandas as pd
-import re  # Make sure this is imported for regex in is_valid_iso()
+import re
+import argparse
+import metrics
+import cli
+from collections import defaultdict
+from pandas.util import hash_pandas_object
+from table_writer import read_table, read_table_chunks
+from name_index import NameNormalizer
+from parse_cache import ParseCache
 
-def clean_film_data(input_file, output_file, invalid_file):
+# Values that count as missing on top of NaN
+MISSING_VALUES = ['', '*see notes*']
+# A number, or a range of two numbers, using only digits, '.' and one '-'
+# (exactly the strings is_valid_iso's character check and float() both accepted)
+ISO_NUMBER = r'(?:\d+\.?\d*|\.\d+)'
+ISO_PATTERN = f"{ISO_NUMBER}(?:-{ISO_NUMBER})?"
+# Cells made of these characters get the same answer from Arrow's and Python's string functions
+ASCII_TEXT = r'[\t\n\x0b\x0c\r\x20-\x7e]*'
+# A development time: one number, an 'a-b' range or an 'a+b' two-stage time
+TIME_NUMBER = r'[0-9]+(?:\.[0-9]*)?|\.[0-9]+'
+TIME_PATTERN = rf'^[ \t\n\r\x0b\x0c]*({TIME_NUMBER})(?:[ \t\n\r\x0b\x0c]*([-+])[ \t\n\r\x0b\x0c]*({TIME_NUMBER}))?[ \t\n\r\x0b\x0c]*$'
+FORMATS = ['35mm', '120', 'Sheet']
+# Text columns that repeat the same few values on every row, loaded as categoricals:
+# each distinct string is stored once and rows hold small integer codes
+CATEGORY_COLUMNS = ['Film', 'Developer', 'Dilution', 'Temp', 'Source URL']
+# Every other raw column is read as text, so a chunk can't be typed differently from the whole file
+RAW_DTYPES = defaultdict(lambda: 'str', {column: 'category' for column in CATEGORY_COLUMNS})
+FORMAT_TIME_COLUMNS = [f'{fmt}_{part}' for fmt in FORMATS for part in ['total_time', 'first_stage', 'second_stage']]
+# Bump whenever the ISO checks, average_iso_range, process_dev_time, extract_temp or their
+# vectorized versions change, so parse caches written under the old rules are rebuilt
+PARSE_RULES_VERSION = 1
+TIME_DTYPES = {'total_time': float, 'is_two_stage': bool, 'first_stage': float, 'second_stage': float}
+
+def to_float(strings):
+    """Convert a column of number strings to floats with Python's float(), NaN where missing"""
+    values = strings.to_numpy(dtype=object, na_value=np.nan).astype(float)
+    return pd.Series(values, index=strings.index)
+
+def text_cells(series):
+    """Return (text, is_text): the string cells of a column as Arrow-backed strings, and which cells were strings"""
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return pd.Series(np.nan, index=series.index, dtype='str'), pd.Series(False, index=series.index)
+    # .str gives NaN for anything that isn't a string
+    is_text = series.str.len().notna()
+    return series.where(is_text).astype('str'), is_text
+
+def exotic_mask(text):
+    """Cells with characters where Arrow's string functions and Python's could disagree"""
+    return text.str.fullmatch(ASCII_TEXT).eq(False)
+
+def valid_mask(series):
+    """Vectorized is_valid: not NaN, not empty and not '*see notes*'"""
+    return series.notna() & ~series.isin(MISSING_VALUES)
+
+def fullmatch_stripped(text, pattern):
     """
-    Clean film development data based on specific criteria and output invalid rows.
-    
-    Requirements:
-    1. Valid film name (not "*see notes*")
-    2. Valid developer listed
-    3. Valid dilution listed
-    4. Valid ASA/ISO listed
-    5. At least one valid value in 35mm, 120, or Sheet
-    6. Valid temperature listed
+    Check which strings match a regex once surrounding whitespace is stripped.
+
+    Arrow-backed string columns use RE2 and Unicode whitespace rules, which
+    differ from Python's re and str.strip() outside ASCII, so any cell with
+    other characters is re-checked with Python's string functions.
+    NaN and non-string cells give False.
     """
-    # Read the CSV file
-    df = pd.read_csv(input_file)
-    
-    # Define a function to check if a value is valid
-    def is_valid(value):
-        if pd.isna(value) or value == "" or value == "*see notes*":
-            return False
-        return True
-    
-    # Define a function specifically for ISO validation
-    def is_valid_iso(value):
-        if not is_valid(value):
-            return False
-        # Check for parentheses in ASA/ISO values only
-        if isinstance(value, str) and ('(' in value or ')' in value):
-            return False
-        
-        # Make sure ISO value is a valid number or range of numbers
-        if isinstance(value, (int, float)):
-            return True
-            
-        # Handle string values
-        if isinstance(value, str):
-            # First remove all spaces
-            cleaned_value = value.strip()
-            
-            # Check for invalid characters (anything not numeric or hyphen)
-            # This will catch question marks, letters, etc.
-            if re.search(r'[^\d\-\.]', cleaned_value):
-                return False
-                
-            # If it's a range with exactly one hyphen, check each part
-            if '-' in cleaned_value:
-                parts = cleaned_value.split('-')
-                if len(parts) != 2:
-                    return False  # More than one hyphen or empty part
-                
-                # Check each part of the range
-                for part in parts:
-                    part = part.strip()
-                    if not part:  # Empty part
-                        return False
-                    try:
-                        _ = float(part)
-                    except ValueError:
-                        return False
-                return True
-            else:
-                # For single values, try to convert to float
-                try:
-                    _ = float(cleaned_value)
-                    return True
-                except ValueError:
-                    return False
-                    
+    matched = text.str.strip().str.fullmatch(pattern).eq(True)
+    exotic = exotic_mask(text)
+    if exotic.any():
+        matched[exotic] = text[exotic].astype(object).str.strip().str.fullmatch(pattern).eq(True)
+    return matched
+
+def valid_iso_mask(series):
+    """
+    Vectorized is_valid_iso: a valid number or range of numbers, without parentheses.
+
+    Numeric cells (a numeric column, or numbers mixed into a text column)
+    are valid as they are; strings must match ISO_PATTERN after stripping.
+    """
+    valid = valid_mask(series)
+    text, is_text = text_cells(series)
+    has_parens = text.str.contains('(', regex=False).eq(True) | text.str.contains(')', regex=False).eq(True)
+    iso_text = fullmatch_stripped(text, ISO_PATTERN) & ~has_parens
+    return valid & (iso_text | ~is_text)
+
+def validity_masks(df, parsed=None):
+    """
+    Boolean masks for each validation rule in clean_film_data, keyed by column ('Format' for the time columns).
+
+    ISOs are checked once per distinct string, remembered in `parsed` (a
+    ParseCache) if given.
+    """
+    parsed = parsed or ParseCache()
+    return {
+        'Film': valid_mask(df['Film']),
+        'Developer': valid_mask(df['Developer']),
+        'Dilution': valid_mask(df['Dilution']),
+        'ASA/ISO': parsed.parse('iso_valid', df['ASA/ISO'], valid_iso_mask, {'valid': bool})['valid'],
+        'Format': valid_mask(df['35mm']) | valid_mask(df['120']) | valid_mask(df['Sheet']),
+        'Temp': valid_mask(df['Temp'])
+    }
+
+# Check if a single value is valid
+def is_valid(value):
+    if pd.isna(value) or value == "" or value == "*see notes*":
         return False
+    return True
+
+# Extract a clean temperature value from one cell
+def extract_temp(temp_str):
+    if not isinstance(temp_str, str):
+        return None
     
-    # Create validity mask for each criteria
-    film_valid = df['Film'].apply(is_valid)
-    developer_valid = df['Developer'].apply(is_valid)
-    dilution_valid = df['Dilution'].apply(is_valid)
-    iso_valid = df['ASA/ISO'].apply(is_valid_iso)  # Using the ISO-specific validation
-    format_valid = (df['35mm'].apply(is_valid) | df['120'].apply(is_valid) | df['Sheet'].apply(is_valid))
-    temp_valid = df['Temp'].apply(is_valid)
+    # Extract numeric temperature using regex
+    match = re.search(r'(\d+)[CF]', str(temp_str))
+    if match:
+        temp_value = float(match.group(1))
+        # Convert to Celsius if in Fahrenheit
+        if 'F' in temp_str.upper():
+            temp_value = (temp_value - 32) * 5/9
+        return round(temp_value, 1)
+    return None
+
+# Process one development time
+def process_dev_time(time_str):
+    if not is_valid(time_str):
+        return {
+            'total_time': None,
+            'is_two_stage': False,
+            'first_stage': None,
+            'second_stage': None
+        }
     
-    # Combined validity mask
-    all_valid = (
-        film_valid & 
-        developer_valid & 
-        dilution_valid & 
-        iso_valid & 
-        format_valid & 
-        temp_valid
-    )
+    time_str = str(time_str).strip()
     
-    # Get valid and invalid rows
-    valid_rows = df[all_valid].copy()
-    invalid_rows = df[~all_valid].copy()
-    
-    # Add reason columns to invalid rows
-    invalid_rows['Invalid_Film'] = ~film_valid
-    invalid_rows['Invalid_Developer'] = ~developer_valid
-    invalid_rows['Invalid_Dilution'] = ~dilution_valid
-    invalid_rows['Invalid_ISO'] = ~iso_valid
-    invalid_rows['Invalid_Format'] = ~format_valid
-    invalid_rows['Invalid_Temp'] = ~temp_valid
-    
-    # Function to average ISO ranges
-    def average_iso_range(iso_value):
-        if not isinstance(iso_value, str):
-            return iso_value
-            
-        # Check if the ISO value is a range (contains a hyphen)
-        if '-' in iso_value:
-            try:
-                # Split the range and convert to integers
-                parts = iso_value.split('-')
-                min_iso = int(parts[0].strip())
-                max_iso = int(parts[1].strip())
-                
-                # Calculate average and round to nearest integer
-                return round((min_iso + max_iso) / 2)
-            except (ValueError, IndexError):
-                return iso_value
-        
-        return iso_value
-    
-    # Process ISO ranges in valid rows
-    valid_rows['ASA/ISO'] = valid_rows['ASA/ISO'].apply(average_iso_range)
+    # Check if it's a two-stage process (contains +)
+    if '+' in time_str:
+        # Two-stage process
+        stages = time_str.split('+')
+        try:
+            first_stage = float(stages[0].strip())
+            second_stage = float(stages[1].strip())
+            return {
+                'total_time': first_stage + second_stage,
+                'is_two_stage': True,
+                'first_stage': first_stage,
+                'second_stage': second_stage
+            }
+        except ValueError:
+            return {
+                'total_time': None,
+                'is_two_stage': True,
+                'first_stage': None,
+                'second_stage': None
+            }
     
-    # Extract clean temperature values
-    def extract_temp(temp_str):
-        if not isinstance(temp_str, str):
-            return None
-        
-        # Extract numeric temperature using regex
-        match = re.search(r'(\d+)[CF]', str(temp_str))
-        if match:
-            temp_value = float(match.group(1))
-            # Convert to Celsius if in Fahrenheit
-            if 'F' in temp_str.upper():
-                temp_value = (temp_value - 32) * 5/9
-            return round(temp_value, 1)
-        return None
+    # Check if it's a range (e.g., "10-11")
+    elif '-' in time_str and not time_str.startswith('-'):
+        try:
+            times = time_str.split('-')
+            min_time = float(times[0].strip())
+            max_time = float(times[1].strip())
+            # Average the range
+            return {
+                'total_time': (min_time + max_time) / 2,
+                'is_two_stage': False,
+                'first_stage': None,
+                'second_stage': None
+            }
+        except ValueError:
+            return {
+                'total_time': None,
+                'is_two_stage': False,
+                'first_stage': None,
+                'second_stage': None
+            }
     
-    # Process development times
-    def process_dev_time(time_str):
-        if not is_valid(time_str):
+    # Single value
+    else:
+        try:
+            time_value = float(time_str)
+            return {
+                'total_time': time_value,
+                'is_two_stage': False,
+                'first_stage': None,
+                'second_stage': None
+            }
+        except ValueError:
             return {
                 'total_time': None,
                 'is_two_stage': False,
                 'first_stage': None,
                 'second_stage': None
             }
+
+def parse_temperatures(series):
+    """
+    Vectorized extract_temp: degrees Celsius rounded to 0.1, NaN where there is no temperature.
+
+    The first run of digits followed by C or F is the temperature; an F
+    anywhere in the cell converts it from Fahrenheit, as extract_temp does.
+    Non-ASCII cells go through extract_temp itself. A categorical column
+    is parsed once per distinct reading.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # The trailing NaN is what code -1 (a missing cell) picks
+        temps = np.append(parse_temperatures(pd.Series(series.cat.categories)).to_numpy(), np.nan)
+        return pd.Series(temps[series.cat.codes.to_numpy()], index=series.index)
+    text, is_text = text_cells(series)
+    degrees = to_float(text.str.extract(r'([0-9]+)[CF]', expand=False))
+    fahrenheit = text.str.contains('[fF]').eq(True)
+    degrees = degrees.where(~fahrenheit, (degrees - 32) * 5/9)
+    # np.round agrees with round() for every integer Fahrenheit reading up to 200000
+    temps = np.round(degrees, 1)
+    exotic = exotic_mask(text)
+    if exotic.any():
+        temps[exotic] = series[exotic].map(extract_temp).astype(float)
+    return temps
+
+def parse_dev_times(series):
+    """
+    Vectorized process_dev_time for a whole column.
+
+    Returns a DataFrame with total_time, is_two_stage, first_stage and
+    second_stage per cell. Single values, 'a-b' ranges (averaged) and
+    'a+b' two-stage times are split out with one regex; any valid cell
+    the regex doesn't cover (other number formats, more than two parts,
+    non-ASCII text) goes through process_dev_time so the results are
+    identical.
+    """
+    valid = valid_mask(series)
+    text = series.where(valid).astype('str')
+    parts = text.str.extract(TIME_PATTERN)
+    first = to_float(parts[0])
+    second = to_float(parts[2])
+    matched = parts[0].notna()
+    two_stage = matched & parts[1].eq('+')
+    is_range = matched & parts[1].eq('-')
+
+    times = pd.DataFrame({
+        'total_time': first.where(~two_stage, first + second).where(~is_range, (first + second) / 2),
+        'is_two_stage': two_stage,
+        'first_stage': first.where(two_stage),
+        'second_stage': second.where(two_stage)
+    }, index=series.index)
+
+    fallback = valid & (~matched | exotic_mask(text))
+    if fallback.any():
+        fallback_times = pd.DataFrame(series[fallback].map(process_dev_time).tolist(), index=series.index[fallback])
+        for column in ['total_time', 'first_stage', 'second_stage']:
+            times.loc[fallback, column] = fallback_times[column].astype(float)
+        times.loc[fallback, 'is_two_stage'] = fallback_times['is_two_stage']
+    return times
+
+# Function to average ISO ranges
+def average_iso_range(iso_value):
+    if not isinstance(iso_value, str):
+        return iso_value
         
-        time_str = str(time_str).strip()
-        
-        # Check if it's a two-stage process (contains +)
-        if '+' in time_str:
-            # Two-stage process
-            stages = time_str.split('+')
-            try:
-                first_stage = float(stages[0].strip())
-                second_stage = float(stages[1].strip())
-                return {
-                    'total_time': first_stage + second_stage,
-                    'is_two_stage': True,
-                    'first_stage': first_stage,
-                    'second_stage': second_stage
-                }
-            except ValueError:
-                return {
-                    'total_time': None,
-                    'is_two_stage': True,
-                    'first_stage': None,
-                    'second_stage': None
-                }
-        
-        # Check if it's a range (e.g., "10-11")
-        elif '-' in time_str and not time_str.startswith('-'):
-            try:
-                times = time_str.split('-')
-                min_time = float(times[0].strip())
-                max_time = float(times[1].strip())
-                # Average the range
-                return {
-                    'total_time': (min_time + max_time) / 2,
-                    'is_two_stage': False,
-                    'first_stage': None,
-                    'second_stage': None
-                }
-            except ValueError:
-                return {
-                    'total_time': None,
-                    'is_two_stage': False,
-                    'first_stage': None,
-                    'second_stage': None
-                }
-        
-        # Single value
-        else:
-            try:
-                time_value = float(time_str)
-                return {
-                    'total_time': time_value,
-                    'is_two_stage': False,
-                    'first_stage': None,
-                    'second_stage': None
-                }
-            except ValueError:
-                return {
-                    'total_time': None,
-                    'is_two_stage': False,
-                    'first_stage': None,
-                    'second_stage': None
-                }
-    
-    # First determine if this is a two-stage developer
-    sample_data = valid_rows.apply(
-        lambda row: any('+' in str(row[col]) for col in ['35mm', '120', 'Sheet'] if is_valid(row[col])),
-        axis=1
+    # Check if the ISO value is a range (contains a hyphen)
+    if '-' in iso_value:
+        try:
+            # Split the range and convert to integers
+            parts = iso_value.split('-')
+            min_iso = int(parts[0].strip())
+            max_iso = int(parts[1].strip())
+            
+            # Calculate average and round to nearest integer
+            return round((min_iso + max_iso) / 2)
+        except (ValueError, IndexError):
+            return iso_value
+    
+    return iso_value
+
+@metrics.timed('clean.validate')
+def split_valid(df, parsed=None):
+    """Split raw rows into valid rows and invalid rows flagged with the Invalid_* reason columns"""
+    masks = validity_masks(df, parsed)
+    all_valid = (
+        masks['Film'] & 
+        masks['Developer'] & 
+        masks['Dilution'] & 
+        masks['ASA/ISO'] & 
+        masks['Format'] & 
+        masks['Temp']
     )
-    valid_rows['is_two_stage_developer'] = sample_data
     
-    # Function to check if a row has different times across formats
-    def has_different_times_in_row(row):
-        valid_formats = [fmt for fmt in ['35mm', '120', 'Sheet'] if is_valid(row[fmt])]
-        if len(valid_formats) <= 1:
-            return False
-        first_time = str(row[valid_formats[0]])
-        return any(str(row[fmt]) != first_time for fmt in valid_formats[1:])
+    # Boolean indexing already returns new frames, no .copy() needed
+    valid_rows = df[all_valid]
+    invalid_rows = df[~all_valid]
+    invalid_rows = invalid_rows.assign(
+        Invalid_Film=~masks['Film'][~all_valid],
+        Invalid_Developer=~masks['Developer'][~all_valid],
+        Invalid_Dilution=~masks['Dilution'][~all_valid],
+        Invalid_ISO=~masks['ASA/ISO'][~all_valid],
+        Invalid_Format=~masks['Format'][~all_valid],
+        Invalid_Temp=~masks['Temp'][~all_valid]
+    )
+    return valid_rows, invalid_rows
+
+def format_cells(valid_rows):
+    """Per-format validity masks, and the times as str() gives them, which is what formats are compared by"""
+    format_valid = {fmt: valid_mask(valid_rows[fmt]) for fmt in FORMATS}
+    format_text = {fmt: valid_rows[fmt].astype('str') for fmt in FORMATS}
+    return format_valid, format_text
+
+def format_specific_mask(format_valid, format_text):
+    """Rows where a valid time differs from the row's first valid time"""
+    first_text = format_text['Sheet'].where(format_valid['Sheet'])
+    for fmt in ['120', '35mm']:
+        first_text = format_text[fmt].where(format_valid[fmt], first_text)
+    format_specific = pd.Series(False, index=first_text.index)
+    for fmt in FORMATS:
+        format_specific |= format_valid[fmt] & format_text[fmt].ne(first_text)
+    return format_specific
+
+@metrics.timed('clean.derive')
+def derive_columns(valid_rows, parsed=None):
+    """
+    Turn valid rows into cleaned rows, returning (cleaned, any_different_times).
+
+    Every derived column is computed once from per-format masks, strings
+    and parsed times: the two-stage flag, the unified dev_* times, the
+    per-format times (filled only on rows whose formats disagree) and
+    Temperature_C. The per-format columns are always present; the caller
+    drops them (FORMAT_TIME_COLUMNS) when no row anywhere has different
+    times, so that decision can cover more than one batch of rows.
     
-    # Check if any row has different times across formats
-    any_different_times = any(valid_rows.apply(has_different_times_in_row, axis=1))
+    ISOs, times and temperatures are parsed once per distinct string,
+    remembered in `parsed` (a ParseCache) if given.
+    """
+    parsed = parsed or ParseCache()
+    isos = parsed.parse('iso', valid_rows['ASA/ISO'], lambda isos: isos.apply(average_iso_range), {'ASA/ISO': object})
+    cleaned = valid_rows.assign(**{'ASA/ISO': isos['ASA/ISO']})
     
-    # Add a flag to indicate if we need to preserve format-specific times
-    valid_rows['has_format_specific_times'] = valid_rows.apply(has_different_times_in_row, axis=1)
+    format_valid, format_text = format_cells(valid_rows)
+    format_times = {fmt: parsed.parse('time', valid_rows[fmt], parse_dev_times, TIME_DTYPES) for fmt in FORMATS}
     
-    # Function to get first valid development time from any format
-    def get_first_valid_time(row):
-        for format_col in ['35mm', '120', 'Sheet']:
-            if is_valid(row[format_col]):
-                return process_dev_time(row[format_col])
-        return process_dev_time(None)
+    # A two-stage developer has a '+' in any valid time
+    is_two_stage = pd.Series(False, index=valid_rows.index)
+    for fmt in FORMATS:
+        is_two_stage |= format_valid[fmt] & format_text[fmt].str.contains('+', regex=False).eq(True)
+    cleaned['is_two_stage_developer'] = is_two_stage
     
-    # Process unified development times (using first available format)
-    time_data = valid_rows.apply(get_first_valid_time, axis=1)
-    valid_rows['dev_total_time'] = time_data.apply(lambda x: x['total_time'])
-    valid_rows['dev_first_stage'] = time_data.apply(lambda x: x['first_stage'])
-    valid_rows['dev_second_stage'] = time_data.apply(lambda x: x['second_stage'])
-    
-    # Only process format-specific times if needed
-    if any_different_times:
-        for format_col in ['35mm', '120', 'Sheet']:
-            # Only process rows where this format differs from others
-            format_rows = valid_rows[valid_rows['has_format_specific_times']]
-            if not format_rows.empty:
-                time_data = format_rows[format_col].apply(process_dev_time)
-                valid_rows.loc[valid_rows['has_format_specific_times'], f'{format_col}_total_time'] = time_data.apply(lambda x: x['total_time'])
-                valid_rows.loc[valid_rows['has_format_specific_times'], f'{format_col}_first_stage'] = time_data.apply(lambda x: x['first_stage'])
-                valid_rows.loc[valid_rows['has_format_specific_times'], f'{format_col}_second_stage'] = time_data.apply(lambda x: x['second_stage'])
+    # Take the times of the first valid format of each row
+    time_data = format_times['Sheet'].where(format_valid['Sheet'], axis=0)
+    for fmt in ['120', '35mm']:
+        time_data = format_times[fmt].where(format_valid[fmt], time_data, axis=0)
+    format_specific = format_specific_mask(format_valid, format_text)
     
-    # Drop format-specific columns if all times are identical
-    if not any_different_times:
-        format_specific_columns = []
-        for fmt in ['35mm', '120', 'Sheet']:
-            format_specific_columns.extend([f'{fmt}_total_time', f'{fmt}_first_stage', f'{fmt}_second_stage'])
-        columns_to_drop = [col for col in format_specific_columns if col in valid_rows.columns]
-        if columns_to_drop:
-            valid_rows = valid_rows.drop(columns=columns_to_drop)
+    # Process unified development times (using first available format)
+    cleaned['dev_total_time'] = time_data['total_time']
+    cleaned['dev_first_stage'] = time_data['first_stage']
+    cleaned['dev_second_stage'] = time_data['second_stage']
     
-    # Always drop the has_format_specific_times column
-    if 'has_format_specific_times' in valid_rows.columns:
-        valid_rows = valid_rows.drop(columns=['has_format_specific_times'])
+    # Format-specific times, only on rows where the formats differ
+    for fmt in FORMATS:
+        cleaned[f'{fmt}_total_time'] = format_times[fmt]['total_time'].where(format_specific)
+        cleaned[f'{fmt}_first_stage'] = format_times[fmt]['first_stage'].where(format_specific)
+        cleaned[f'{fmt}_second_stage'] = format_times[fmt]['second_stage'].where(format_specific)
     
-    # Apply temperature extraction to valid rows
-    valid_rows['Temperature_C'] = valid_rows['Temp'].apply(extract_temp)
+    cleaned['Temperature_C'] = parsed.parse('temp', valid_rows['Temp'], parse_temperatures,
+                                            {'Temperature_C': float})['Temperature_C']
     
     # Drop original time and temperature columns after processing
     columns_to_drop = ['35mm', '120', 'Sheet', 'Temp']
-    if 'Notes' in valid_rows.columns:
+    if 'Notes' in cleaned.columns:
         columns_to_drop.append('Notes')
-    if 'Source URL' in valid_rows.columns:
+    if 'Source URL' in cleaned.columns:
         columns_to_drop.append('Source URL')
+    cleaned = cleaned.drop(columns=columns_to_drop)
+    return cleaned, bool(format_specific.any())
+
+@metrics.timed('clean.names')
+def normalize_names(cleaned, normalizer):
+    """Map the Film and Developer names of cleaned rows to their canonical spellings, returning (rows, rows renamed)"""
+    renamed = normalizer.apply(cleaned)
+    changed = pd.Series(False, index=cleaned.index)
+    for column in normalizer.indexes:
+        changed |= renamed[column].astype(object).ne(cleaned[column].astype(object))
+    return renamed, int(changed.sum())
+
+def clean_film_data(input_file, output_file, invalid_file, chunksize=None, name_map=None, parse_cache=None):
+    """
+    Clean film development data based on specific criteria and output invalid rows.
+    
+    Requirements:
+    1. Valid film name (not "*see notes*")
+    2. Valid developer listed
+    3. Valid dilution listed
+    4. Valid ASA/ISO listed
+    5. At least one valid value in 35mm, 120, or Sheet
+    6. Valid temperature listed
+    
+    With chunksize, the input is streamed that many rows at a time (see
+    clean_film_data_chunked) instead of being loaded whole.
     
-    valid_rows = valid_rows.drop(columns=columns_to_drop)
+    With name_map (a JSON file, created if missing), spelling variants of
+    film and developer names are mapped to one canonical name (see
+    name_index.py) before duplicates are removed, and the file is updated
+    with any names not seen before.
+    
+    ISO, time and temperature strings are parsed once each; with
+    parse_cache (a JSON file, created if missing) the results are kept
+    for the next run, which only parses strings it hasn't seen (see
+    parse_cache.py).
+    """
+    if chunksize:
+        return clean_film_data_chunked(input_file, output_file, invalid_file, chunksize, name_map, parse_cache)
+    
+    # Read the parsed rows (CSV, or the Parquet/Arrow copy parse_tables.py can write);
+    # the raw frame isn't kept once it's split
+    parsed = ParseCache(parse_cache, PARSE_RULES_VERSION)
+    valid_rows, invalid_rows = split_valid(read_table(input_file, dtype=RAW_DTYPES), parsed)
+    original_rows = len(valid_rows) + len(invalid_rows)
+    valid_rows, any_different_times = derive_columns(valid_rows, parsed)
+    parsed.save()
+    
+    # Drop format-specific columns if all times are identical
+    if not any_different_times:
+        valid_rows = valid_rows.drop(columns=FORMAT_TIME_COLUMNS)
+    
+    renamed_count = 0
+    if name_map:
+        normalizer = NameNormalizer(name_map)
+        normalizer.update(valid_rows)
+        valid_rows, renamed_count = normalize_names(valid_rows, normalizer)
+        normalizer.save()
     
     # Deduplicate valid rows
     original_valid_count = len(valid_rows)
-    valid_rows = valid_rows.drop_duplicates()
+    with metrics.timer('clean.dedupe'):
+        valid_rows = valid_rows.drop_duplicates()
     deduplicated_count = original_valid_count - len(valid_rows)
     
     # Save cleaned, deduplicated data and invalid data
-    valid_rows.to_csv(output_file, index=False)
-    invalid_rows.to_csv(invalid_file, index=False)
+    with metrics.timer('clean.write'):
+        valid_rows.to_csv(output_file, index=False)
+        invalid_rows.to_csv(invalid_file, index=False)
     
     return {
-        'original_rows': len(df),
+        'original_rows': original_rows,
         'valid_rows': len(valid_rows),
         'invalid_rows': len(invalid_rows),
         'duplicates_removed': deduplicated_count,
-        'percent_kept': round(len(valid_rows) / len(df) * 100, 1)
+        'names_normalized': renamed_count,
+        'percent_kept': round(len(valid_rows) / original_rows * 100, 1)
     }
 
-if __name__ == "__main__":
-    results = clean_film_data(
-        'all-film-all-developer.csv', 
-        'valid_all-film-all-developer.csv',
-        'invalid_data.csv'
-    )
+def row_hashes(frame):
+    """
+    64-bit hash of each row, for spotting duplicates across chunks.
+
+    hash_pandas_object compares object cells by their text, so the
+    averaged ASA/ISO 400 and the string '400' would collide although
+    drop_duplicates keeps both; a flag for string cells tells them apart.
+    -0.0 is folded into 0.0, which drop_duplicates treats as equal.
+    """
+    keys = {}
+    for column in frame.columns:
+        values = frame[column]
+        if values.dtype == object:
+            keys[f'{column} is text'] = values.str.len().notna()
+        elif pd.api.types.is_float_dtype(values):
+            values = values + 0.0
+        keys[column] = values
+    return hash_pandas_object(pd.DataFrame(keys), index=False).to_numpy()
+
+def clean_film_data_chunked(input_file, output_file, invalid_file, chunksize=500000, name_map=None,
+                            parse_cache=None):
+    """
+    Clean a file too large for memory, chunksize rows at a time, with the same output as clean_film_data.
+
+    A first pass over the input only checks whether any row has different
+    times across formats, which decides the output columns. The second
+    pass validates and transforms each chunk and appends it to the
+    outputs, dropping duplicates against a sorted array of the hashes of
+    every row written so far (8 bytes per unique row, the only state that
+    grows with the input).
+    
+    With name_map the first pass also counts every film and developer
+    name, so canonical names are chosen from the whole file as
+    clean_film_data chooses them, and the second pass applies them.
+    
+    Parsed strings are remembered across chunks (and with parse_cache,
+    across runs), so each chunk only parses strings new to the run.
+    """
+    parsed = ParseCache(parse_cache, PARSE_RULES_VERSION)
+    normalizer = NameNormalizer(name_map) if name_map else None
+    name_counts = {column: defaultdict(int) for column in normalizer.indexes} if normalizer else {}
+    any_different_times = False
+    for chunk in read_table_chunks(input_file, chunksize, dtype=RAW_DTYPES):
+        valid_rows, _ = split_valid(chunk, parsed)
+        if format_specific_mask(*format_cells(valid_rows)).any():
+            any_different_times = True
+            if not normalizer:
+                break
+        for column, counts in name_counts.items():
+            for name, count in valid_rows[column].value_counts().items():
+                counts[name] += count
+    if normalizer:
+        for column, counts in name_counts.items():
+            normalizer.update_counts(column, counts)
+        normalizer.save()
+    
+    seen = np.array([], dtype=np.uint64)
+    original_rows = valid_count = invalid_count = kept_count = renamed_count = 0
+    for i, chunk in enumerate(read_table_chunks(input_file, chunksize, dtype=RAW_DTYPES)):
+        valid_rows, invalid_rows = split_valid(chunk, parsed)
+        original_rows += len(chunk)
+        valid_count += len(valid_rows)
+        invalid_count += len(invalid_rows)
+        valid_rows, _ = derive_columns(valid_rows, parsed)
+        if not any_different_times:
+            valid_rows = valid_rows.drop(columns=FORMAT_TIME_COLUMNS)
+        if normalizer:
+            valid_rows, renamed = normalize_names(valid_rows, normalizer)
+            renamed_count += renamed
+        
+        # Keep the first occurrence of each row, within the chunk and across earlier chunks
+        with metrics.timer('clean.dedupe'):
+            hashes = row_hashes(valid_rows)
+            first = ~pd.Series(hashes).duplicated().to_numpy()
+            first &= ~np.isin(hashes, seen, assume_unique=False)
+            valid_rows = valid_rows[first]
+            seen = np.union1d(seen, hashes[first])
+        kept_count += len(valid_rows)
+        
+        mode, header = ('w', True) if i == 0 else ('a', False)
+        with metrics.timer('clean.write'):
+            valid_rows.to_csv(output_file, mode=mode, header=header, index=False)
+            invalid_rows.to_csv(invalid_file, mode=mode, header=header, index=False)
+    parsed.save()
+    
+    return {
+        'original_rows': original_rows,
+        'valid_rows': kept_count,
+        'invalid_rows': invalid_count,
+        'duplicates_removed': valid_count - kept_count,
+        'names_normalized': renamed_count,
+        'percent_kept': round(kept_count / original_rows * 100, 1)
+    }
+
+class CleanStream:
+    """
+    Clean raw rows batch by batch as they arrive, with the same output as clean_film_data on all of them.
+
+    Each batch is validated and transformed when it's added; its invalid
+    rows go straight to invalid_file and its cleaned valid rows are kept.
+    finish() drops the per-format columns if no row had different times,
+    normalizes names if name_map is given (from the counts of every
+    batch), removes duplicates across every batch and writes the valid rows.
+    Strings parsed in one batch aren't parsed again in later ones, and
+    with parse_cache they are kept for the next run too.
+    """
+    
+    def __init__(self, invalid_file, name_map=None, parse_cache=None):
+        self.invalid_file = invalid_file
+        self.name_map = name_map
+        self.parsed = ParseCache(parse_cache, PARSE_RULES_VERSION)
+        self.valid_batches = []
+        self.any_different_times = False
+        self.original_rows = 0
+        self.invalid_rows = 0
+    
+    def add(self, raw):
+        """Validate and transform one batch of raw rows (loaded as read_table would, with RAW_DTYPES)"""
+        valid_rows, invalid_rows = split_valid(raw, self.parsed)
+        valid_rows, different_times = derive_columns(valid_rows, self.parsed)
+        self.any_different_times |= different_times
+        self.valid_batches.append(valid_rows)
+        
+        first = self.original_rows == 0
+        with metrics.timer('clean.write'):
+            invalid_rows.to_csv(self.invalid_file, mode='w' if first else 'a', header=first, index=False)
+        self.original_rows += len(raw)
+        self.invalid_rows += len(invalid_rows)
+    
+    def finish(self, output_file):
+        """Deduplicate and write the valid rows, returning the same summary as clean_film_data"""
+        if not self.valid_batches:
+            raise Exception("No rows to clean")
+        self.parsed.save()
+        valid_rows = pd.concat(self.valid_batches, ignore_index=True)
+        self.valid_batches = []
+        if not self.any_different_times:
+            valid_rows = valid_rows.drop(columns=FORMAT_TIME_COLUMNS)
+        
+        renamed_count = 0
+        if self.name_map:
+            normalizer = NameNormalizer(self.name_map)
+            normalizer.update(valid_rows)
+            valid_rows, renamed_count = normalize_names(valid_rows, normalizer)
+            normalizer.save()
+        
+        original_valid_count = len(valid_rows)
+        with metrics.timer('clean.dedupe'):
+            valid_rows = valid_rows.drop_duplicates()
+        with metrics.timer('clean.write'):
+            valid_rows.to_csv(output_file, index=False)
+        
+        return {
+            'original_rows': self.original_rows,
+            'valid_rows': len(valid_rows),
+            'invalid_rows': self.invalid_rows,
+            'duplicates_removed': original_valid_count - len(valid_rows),
+            'names_normalized': renamed_count,
+            'percent_kept': round(len(valid_rows) / self.original_rows * 100, 1)
+        }
+
+def run(args):
+    """Clean args.input into the valid and invalid files with the options from cli.add_clean_arguments"""
+    with metrics.timer('clean'):
+        results = clean_film_data(
+            args.input, 
+            'valid_all-film-all-developer.csv',
+            'invalid_data.csv',
+            chunksize=args.chunksize,
+            name_map=None if args.no_normalize else args.name_map,
+            parse_cache=None if args.no_parse_cache else args.parse_cache
+        )
+    metrics.count('clean.rows', results['original_rows'])
+    metrics.count('clean.valid_rows', results['valid_rows'])
     print(f"Original dataset: {results['original_rows']} rows")
     print(f"Cleaned dataset: {results['valid_rows']} rows")
     print(f"Invalid data: {results['invalid_rows']} rows")
+    print(f"Names normalized: {results['names_normalized']} rows")
     print(f"Duplicates removed: {results['duplicates_removed']} rows")
-    print(f"Kept {results['percent_kept']}% of the original data")
\ No newline at end of file
+    print(f"Kept {results['percent_kept']}% of the original data")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate and clean the parsed chart data")
+    cli.add_clean_arguments(parser)
+    args = parser.parse_args()
+    with metrics.run_report('clean_data', args.metrics, args.profile):
+        run(args)
\ No newline at end of file
@@ -0,0 +1,298 @@
+"""
+One command line for the stages of the refresh, loading only what a run needs.
+
+    python cli.py search      # get_urls.py
+    python cli.py download    # download_tables.py
+    python cli.py parse       # parse_tables.py
+    python cli.py clean       # clean_data.py
+    python cli.py changes     # changelog.py
+
+Each subcommand takes its script's options (defined here, and used by
+the scripts too). Before importing the stage it checks whether there is
+anything to do, with the standard library, the page cache index and a
+small stamp file, never requests, bs4 or pandas:
+
+- search: unique_links.txt is younger than --max-age hours and the work
+  queue holds no failed searches
+- download: every link is cached and fresh, and the work queue holds no
+  unfinished pages
+- parse: the links and the content hash of every cached page are the
+  ones the last parse ran on, and its outputs are as it left them
+- clean: the parsed input is the one the last clean ran on (same size
+  and modification time), and its outputs are as it left them
+- changes: the cleaned data is the file the last changelog was written
+  for, and the changelog is as it left it
+
+A stage that is up to date says so and exits; --force runs it anyway.
+What parse, clean and changes ran on is recorded in stage_stamps.json after each
+run. The run report (see metrics.py) gains startup timers: startup.check
+for the check, startup.import for loading the stage's modules, and
+startup for everything from this module's import to the stage starting.
+Running a script directly skips the check, as before.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import metrics
+
+START = time.perf_counter()
+
+STAMPS_FILE = 'stage_stamps.json'
+LINKS_FILE = 'unique_links.txt'
+RAW_FILE = 'all-film-all-developer.csv'
+SOURCES_FILE = 'all-film-all-developer-sources.csv'
+VALID_FILE = 'valid_all-film-all-developer.csv'
+INVALID_FILE = 'invalid_data.csv'
+CHANGES_FILE = 'changes.jsonl'
+
+def add_report_arguments(parser, script):
+    """Options for the run report every script writes (see metrics.py)"""
+    parser.add_argument('--metrics', default=f'{script}_metrics.json',
+                        help="where to write the run's timings and counts")
+    parser.add_argument('--profile', help="profile the run with cProfile and dump the profile to this file")
+
+def add_search_arguments(parser):
+    """Options of get_urls.py"""
+    parser.add_argument('--max-concurrency', type=int, default=16, help="most searches in flight at once")
+    parser.add_argument('--rate', type=float, default=10.0, help="maximum searches started per second")
+    parser.add_argument('--brute-force', action='store_true', help="search every two-letter combination instead")
+    parser.add_argument('--result-cap', type=int,
+                        help="most results the site returns for one search (default: detect it from the counts)")
+    parser.add_argument('--min-length', type=int, default=1, help="length of the first queries in the tree")
+    parser.add_argument('--max-length', type=int, default=5, help="longest query to extend truncated searches to")
+    parser.add_argument('--match', choices=['contains', 'prefix'], default='contains',
+                        help="whether the site matches a query anywhere in a name or only at its start")
+    parser.add_argument('--max-queries', type=int, default=26 ** 2,
+                        help="most queries to send before extending past two letters stops (default: as brute force)")
+    parser.add_argument('--search-url', help="search endpoint to query (default: the chart site's)")
+    parser.add_argument('--queue', default='work_queue.sqlite',
+                        help="file saving each search's outcome, so an interrupted run resumes")
+    parser.add_argument('--fresh', action='store_true', help="ignore searches saved by an earlier run")
+    add_report_arguments(parser, 'get_urls')
+
+def add_download_arguments(parser):
+    """Options of download_tables.py"""
+    parser.add_argument('--workers', type=int, default=4, help="number of concurrent downloads")
+    parser.add_argument('--rate', type=float, default=1.0, help="maximum requests per second across all workers")
+    parser.add_argument('--cache', default='cache', help="cache directory, or a .sqlite file for a single-file archive")
+    parser.add_argument('--queue', default='work_queue.sqlite',
+                        help="file saving each page's outcome, so an interrupted run resumes")
+    parser.add_argument('--fresh', action='store_true', help="ignore pages saved by an earlier run")
+    add_report_arguments(parser, 'download_tables')
+
+def add_parse_arguments(parser):
+    """Options of parse_tables.py"""
+    parser.add_argument('--cache', default='cache', help="cache directory, or a .sqlite file for a single-file archive")
+    parser.add_argument('--workers', type=int, default=1, help="number of parse processes (default 1, serial)")
+    parser.add_argument('--engine', choices=['fast', 'bs4'], default='fast',
+                        help="table extractor: 'fast' parses only the chart table, 'bs4' the whole page")
+    parser.add_argument('--columnar', help="also write the rows to this .parquet or .arrow file (needs pyarrow)")
+    parser.add_argument('--manifest', default='parse_manifest.json',
+                        help="where to keep the rows of each parsed page, so unchanged pages aren't parsed again")
+    parser.add_argument('--full', action='store_true', help="re-parse every page, ignoring the manifest")
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help="write every row, including those already found on another page")
+    add_report_arguments(parser, 'parse_tables')
+
+def add_clean_arguments(parser):
+    """Options of clean_data.py"""
+    parser.add_argument('--input', default=RAW_FILE,
+                        help="parsed rows: the CSV, or a .parquet/.arrow file from parse_tables.py --columnar")
+    parser.add_argument('--chunksize', type=int,
+                        help="stream the input this many rows at a time instead of loading it all (same output)")
+    parser.add_argument('--name-map',
+                        help="normalize film/developer names, caching the mapping of name variants to canonical "
+                             "names in this file, e.g. name_map.json (see name_index.py); opt-in, off by default "
+                             "until the matching rules have been checked against the real developer list")
+    parser.add_argument('--no-normalize', action='store_true', help="keep film and developer names as scraped "
+                        "even with --name-map")
+    parser.add_argument('--parse-cache', default='parse_cache.json',
+                        help="cached parses of ISO, time and temperature strings, so later runs only parse new ones")
+    parser.add_argument('--no-parse-cache', action='store_true', help="parse every string again and don't save them")
+    add_report_arguments(parser, 'clean_data')
+
+def add_changes_arguments(parser):
+    """Options of changelog.py"""
+    parser.add_argument('--input', default=VALID_FILE, help="cleaned data to compare with its last version")
+    parser.add_argument('--output', default=CHANGES_FILE, help="where to write the changes, as JSON Lines")
+    parser.add_argument('--previous',
+                        help="copy of the input kept from the last run (default: the input's name with .previous)")
+    parser.add_argument('--key', nargs='+', help="columns identifying a row (default: Film Developer Dilution ASA/ISO)")
+    add_report_arguments(parser, 'changelog')
+
+def file_state(path):
+    """[size, modification time in ns] of a file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def read_links():
+    """The URLs in unique_links.txt, or None if there is no such file"""
+    if not os.path.exists(LINKS_FILE):
+        return None
+    with open(LINKS_FILE, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def unfinished_items(queue_file, kind, states=('pending', 'failed')):
+    """Number of items of a kind in the given states in a work queue file (0 if there is none)"""
+    if not os.path.exists(queue_file):
+        return 0
+    from work_queue import WorkQueue
+    with WorkQueue(queue_file) as queue:
+        counts = queue.counts(kind)
+    return sum(counts[state] for state in states)
+
+class Stamps:
+    """What each stage last ran on and the state of the files it wrote, kept in a small JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.stages = json.load(f)
+
+    def matches(self, stage, inputs, outputs):
+        """Check the stage last ran on these inputs and every output is still as it left it"""
+        stamp = self.stages.get(stage)
+        return (stamp is not None and stamp['inputs'] == inputs
+                and stamp['outputs'] == {path: file_state(path) for path in outputs}
+                and all(state is not None for state in stamp['outputs'].values()))
+
+    def record(self, stage, inputs, outputs):
+        """Remember a finished run of a stage"""
+        self.stages[stage] = {'inputs': inputs, 'outputs': {path: file_state(path) for path in outputs}}
+        tmp_file = f"{self.path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.stages, f, indent=2)
+        os.replace(tmp_file, self.path)
+
+# Each check returns (why the stage is up to date, or None if it has work to do, and
+# (inputs, outputs) to stamp after a run, or None for stages that don't use stamps)
+
+def check_search(args, stamps):
+    state = file_state(LINKS_FILE)
+    # A search that finishes without failures clears its items, so any left (even done ones, between
+    # two levels of the query tree) mean the last search was interrupted or has queries to retry
+    if state is None or unfinished_items(args.queue, 'search', ('pending', 'done', 'failed')):
+        return None, None
+    hours = (time.time() - state[1] / 1e9) / 3600
+    if hours >= args.max_age:
+        return None, None
+    return f"{LINKS_FILE} is {hours:.1f} hours old", None
+
+def check_download(args, stamps):
+    links = read_links()
+    if links is None or unfinished_items(args.queue, 'download'):
+        return None, None
+    from page_cache import open_cache
+    cache = open_cache(args.cache)
+    try:
+        stale = sum(not cache.is_fresh(url) for url in links)
+    finally:
+        cache.close()
+    if stale:
+        return None, None
+    return f"all {len(links)} pages are cached and fresh", None
+
+def check_parse(args, stamps):
+    links = read_links()
+    if links is None:
+        return None, None
+    # parse_tables loads bs4 only when a page needs it
+    from parse_tables import PARSER_VERSION, FINGERPRINT_VERSION
+    from page_cache import open_cache
+    cache = open_cache(args.cache)
+    try:
+        digests = [cache.digest(url) for url in links]
+    finally:
+        cache.close()
+    if None in digests:
+        # Uncached pages, or legacy files with no hash in the index: let parse_tables work it out
+        return None, None
+    pages = hashlib.sha256(''.join(f"{url}\t{digest}\n" for url, digest in zip(links, digests)).encode('utf-8'))
+    inputs = {'parser_version': PARSER_VERSION, 'cache': args.cache, 'pages': pages.hexdigest(),
+              'columnar': args.columnar, 'keep_duplicates': args.keep_duplicates,
+              'fingerprint_version': None if args.keep_duplicates else FINGERPRINT_VERSION}
+    outputs = [RAW_FILE, args.manifest] + ([] if args.keep_duplicates else [SOURCES_FILE])
+    outputs += [args.columnar] if args.columnar else []
+    if args.full or not stamps.matches('parse', inputs, outputs):
+        return None, (inputs, outputs)
+    return f"none of the {len(links)} pages changed since the last parse", (inputs, outputs)
+
+def check_clean(args, stamps):
+    name_map = None if args.no_normalize else args.name_map
+    inputs = {'input': args.input, 'state': file_state(args.input), 'name_map': name_map}
+    outputs = [VALID_FILE, INVALID_FILE] + ([name_map] if name_map else [])
+    if inputs['state'] is None or not stamps.matches('clean', inputs, outputs):
+        return None, (inputs, outputs)
+    return f"{args.input} is unchanged since the last clean", (inputs, outputs)
+
+def check_changes(args, stamps):
+    inputs = {'input': args.input, 'state': file_state(args.input), 'previous': args.previous, 'key': args.key}
+    outputs = [args.output]
+    if inputs['state'] is None or not stamps.matches('changes', inputs, outputs):
+        return None, (inputs, outputs)
+    return f"{args.input} is unchanged since the last changelog", (inputs, outputs)
+
+# Subcommand: (module, description, add_arguments, check)
+STAGES = {
+    'search': ('get_urls', "Search the chart site and save the chart URLs", add_search_arguments, check_search),
+    'download': ('download_tables', "Download chart pages into the cache", add_download_arguments, check_download),
+    'parse': ('parse_tables', "Parse cached chart pages into a CSV", add_parse_arguments, check_parse),
+    'clean': ('clean_data', "Validate and clean the parsed chart data", add_clean_arguments, check_clean),
+    'changes': ('changelog', "Write what changed in the cleaned data since the last run", add_changes_arguments,
+                check_changes)
+}
+
+def build_parser():
+    """The argument parser with a subcommand per stage"""
+    parser = argparse.ArgumentParser(description="Run a stage of the refresh if it has anything to do")
+    subparsers = parser.add_subparsers(dest='stage', required=True)
+    for name, (_, description, add_arguments, _) in STAGES.items():
+        stage_parser = subparsers.add_parser(name, help=description, description=description)
+        add_arguments(stage_parser)
+        stage_parser.add_argument('--force', action='store_true', help="run even if the stage looks up to date")
+        stage_parser.add_argument('--stamps', default=STAMPS_FILE,
+                                  help="where to record what each stage last ran on")
+        if name == 'search':
+            stage_parser.add_argument('--max-age', type=float, default=24.0,
+                                      help="hours before the saved links count as out of date")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    module_name, _, _, check = STAGES[args.stage]
+    stamps = Stamps(args.stamps)
+
+    start = time.perf_counter()
+    up_to_date, stamp = check(args, stamps)
+    check_seconds = time.perf_counter() - start
+    if up_to_date and not args.force:
+        print(f"{args.stage}: up to date, {up_to_date} (checked in {check_seconds * 1e3:.0f}ms; --force to run)")
+        return
+
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_seconds = time.perf_counter() - start
+    with metrics.run_report(module_name, args.metrics, args.profile) as run:
+        run.add_time('startup.check', check_seconds)
+        run.add_time('startup.import', import_seconds)
+        run.add_time('startup', time.perf_counter() - START)
+        # A stage's run() returns False when it failed without raising
+        finished = module.run(args) is not False
+    if not finished:
+        print(f"{args.stage}: failed, so its output isn't recorded as up to date")
+        return 1
+    if stamp:
+        stamps.record(args.stage, *stamp)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
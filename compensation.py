@@ -0,0 +1,227 @@
+"""
+Development time curves per film, developer and dilution, with a batch lookup.
+
+build_tables() fits two curves for every (Film, Developer, Dilution) in
+the cleaned data:
+
+- time against temperature: t(T) = t(20°C) * exp(-k * (T - 20)). k is
+  fitted from the charts that give more than one temperature for the
+  same ISO, and is TEMPERATURE_COEFFICIENT (about 8% per °C) otherwise.
+- time against ISO at 20°C: the chart times (normalized to 20°C with k)
+  interpolated linearly in log(time) against stops (log2 ISO). Beyond
+  the charted ISOs, for a push or pull, the curve carries on with the
+  key's fitted slope per stop, or the median slope of all keys when the
+  chart has a single ISO.
+
+The curves are stored as flat arrays in one .npz file, every key's
+points one after another, so CompensationTables.times() answers a whole
+batch of (film, developer, ISO, temperature) queries with one key
+lookup and one searchsorted over all the curves instead of a scan of the
+table per query:
+
+    tables = CompensationTables('compensation.npz')
+    minutes = tables.times(films, developers, isos, temperatures)
+
+Names are matched case-insensitively. A query without a dilution uses
+the dilution with the most chart rows for that film and developer.
+Unknown combinations give NaN.
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from chart_store import TEMPERATURE_COEFFICIENT
+from table_writer import read_table
+
+# Bump whenever the fitting or the file layout changes, so older tables are rebuilt
+TABLES_VERSION = 1
+REFERENCE_TEMPERATURE = 20.0
+# Fitted temperature coefficients outside this range are noise in the charts, not chemistry
+COEFFICIENT_RANGE = (0.02, 0.2)
+# Used for push/pull when no key has charts at two ISOs: about 25% more time per stop
+DEFAULT_STOP_SLOPE = np.log(1.25)
+# Keys are laid out this far apart on one axis for the batch searchsorted (log2 ISO stays well inside it)
+KEY_SPAN = 1000.0
+ISO_OFFSET = 100.0
+
+def chart_points(df):
+    """The usable (key, log2 ISO, temperature, log time) rows of a cleaned table"""
+    iso = pd.to_numeric(df['ASA/ISO'].astype('str').str.strip(), errors='coerce')
+    points = pd.DataFrame({
+        'film': df['Film'].astype('str'),
+        'developer': df['Developer'].astype('str'),
+        'dilution': df['Dilution'].astype('str'),
+        'stops': np.log2(iso.where(iso > 0)),
+        'temperature': df['Temperature_C'].astype(float),
+        # 'inf' is a number to float(), so a few cleaned times are infinite
+        'log_time': np.log(df['dev_total_time'].astype(float).where(lambda t: (t > 0) & np.isfinite(t)))
+    })
+    return points.dropna().reset_index(drop=True)
+
+def fit_coefficients(points, key):
+    """Per-key temperature coefficient k, fitted from ISOs charted at several temperatures, NaN where there are none"""
+    group = [points[key], points['stops']]
+    d_temp = points['temperature'] - points.groupby(group)['temperature'].transform('mean')
+    d_time = points['log_time'] - points.groupby(group)['log_time'].transform('mean')
+    sums = pd.DataFrame({'xy': d_temp * d_time, 'xx': d_temp * d_temp}).groupby(points[key]).sum()
+    k = -sums['xy'] / sums['xx'].where(sums['xx'] > 0)
+    return k.where(k.between(*COEFFICIENT_RANGE))
+
+def fit_slopes(curves):
+    """Per-key least-squares slope of log time per stop, NaN for keys charted at one ISO"""
+    d_stops = curves['stops'] - curves.groupby('key')['stops'].transform('mean')
+    d_time = curves['log_time'] - curves.groupby('key')['log_time'].transform('mean')
+    sums = pd.DataFrame({'xy': d_stops * d_time, 'xx': d_stops * d_stops}).groupby(curves['key']).sum()
+    return sums['xy'] / sums['xx'].where(sums['xx'] > 0)
+
+def build_tables(csv_file, tables_file):
+    """Fit the curves for every key of a cleaned CSV and save them, returning the number of keys"""
+    points = chart_points(read_table(csv_file))
+    if points.empty:
+        raise Exception(f"No rows with an ISO, temperature and time to fit in {csv_file}")
+    keys = points[['film', 'developer', 'dilution']].drop_duplicates().sort_values(
+        ['film', 'developer', 'dilution']).reset_index(drop=True)
+    key_index = pd.MultiIndex.from_frame(keys)
+    points['key'] = key_index.get_indexer(pd.MultiIndex.from_frame(points[['film', 'developer', 'dilution']]))
+
+    coefficients = fit_coefficients(points, 'key').reindex(range(len(keys))).fillna(TEMPERATURE_COEFFICIENT)
+    # Every chart time at 20°C, averaged per ISO: the points of the ISO curve
+    k = coefficients.to_numpy()[points['key'].to_numpy()]
+    points['log_time'] -= k * (REFERENCE_TEMPERATURE - points['temperature'])
+    curves = points.groupby(['key', 'stops'], as_index=False)['log_time'].mean()
+
+    slopes = fit_slopes(curves).reindex(range(len(keys)))
+    fitted = slopes[slopes > 0]
+    default_slope = float(fitted.median()) if len(fitted) else DEFAULT_STOP_SLOPE
+    # A slope can't be negative: more speed never needs less development
+    slopes = slopes.where(slopes > 0, default_slope)
+
+    starts = np.searchsorted(curves['key'].to_numpy(), np.arange(len(keys) + 1))
+    # The dilution with the most chart rows for each film and developer, for queries without one
+    rows = points.groupby(['film', 'developer', 'dilution']).size().rename('rows').reset_index()
+    rows = rows.sort_values(['film', 'developer', 'rows', 'dilution'], ascending=[True, True, False, True])
+    defaults = rows.drop_duplicates(['film', 'developer'])
+
+    tmp_file = f"{tables_file}.tmp.npz"
+    np.savez(tmp_file, version=TABLES_VERSION,
+             films=keys['film'].to_numpy(dtype=str), developers=keys['developer'].to_numpy(dtype=str),
+             dilutions=keys['dilution'].to_numpy(dtype=str),
+             coefficients=coefficients.to_numpy(), slopes=slopes.to_numpy(), starts=starts,
+             stops=curves['stops'].to_numpy(), log_times=curves['log_time'].to_numpy(),
+             default_films=defaults['film'].to_numpy(dtype=str),
+             default_developers=defaults['developer'].to_numpy(dtype=str),
+             default_dilutions=defaults['dilution'].to_numpy(dtype=str))
+    os.replace(tmp_file, tables_file)
+    return len(keys)
+
+def folded_index(*columns):
+    """A MultiIndex of case-folded names, for case-insensitive lookups"""
+    return pd.MultiIndex.from_arrays([pd.Index(np.asarray(column, dtype=str)).str.casefold() for column in columns])
+
+def position_lookup(index, positions):
+    """Series mapping each name tuple to a position; names differing only in case keep the first"""
+    lookup = pd.Series(positions, index=index)
+    return lookup[~lookup.index.duplicated()]
+
+class CompensationTables:
+    """Batch development times from the curves build_tables saved"""
+
+    def __init__(self, tables_file):
+        if not os.path.exists(tables_file):
+            raise Exception(f"Compensation tables not found: {tables_file} (build them with compensation.py)")
+        with np.load(tables_file) as data:
+            if int(data['version']) != TABLES_VERSION:
+                raise Exception(f"{tables_file} was built by another version of compensation.py, rebuild it")
+            arrays = {name: data[name] for name in data.files}
+        self.films, self.developers, self.dilutions = arrays['films'], arrays['developers'], arrays['dilutions']
+        self.coefficients = arrays['coefficients']
+        self.slopes = arrays['slopes']
+        self.starts = arrays['starts']
+        self.stops = arrays['stops']
+        self.log_times = arrays['log_times']
+        self.key_lookup = position_lookup(folded_index(self.films, self.developers, self.dilutions),
+                                          np.arange(len(self.films)))
+        key_of_point = np.repeat(np.arange(len(self.films)), np.diff(self.starts))
+        # Every curve on one sorted axis: key * KEY_SPAN + stops
+        self.axis = key_of_point * KEY_SPAN + self.stops + ISO_OFFSET
+        defaults = folded_index(arrays['default_films'], arrays['default_developers'], arrays['default_dilutions'])
+        self.default_lookup = position_lookup(folded_index(arrays['default_films'], arrays['default_developers']),
+                                              self.key_lookup.reindex(defaults).to_numpy())
+
+    def keys(self, film, developer, dilution=None):
+        """Index of each query's curve, -1 where the film/developer/dilution isn't charted"""
+        if dilution is None:
+            keys = self.default_lookup.reindex(folded_index(film, developer))
+        else:
+            keys = self.key_lookup.reindex(folded_index(film, developer, dilution))
+        return keys.fillna(-1).to_numpy(dtype=np.int64)
+
+    def times(self, film, developer, iso, temperature=REFERENCE_TEMPERATURE, dilution=None):
+        """
+        Development times in minutes for arrays of queries (scalars are broadcast), NaN where unknown.
+
+        The ISO curve is interpolated between charted ISOs and extended
+        with the key's slope per stop outside them, then moved from 20°C
+        to each query's temperature with the key's coefficient.
+        """
+        film, developer, iso, temperature = np.broadcast_arrays(film, developer, np.asarray(iso, dtype=float),
+                                                                np.asarray(temperature, dtype=float))
+        if dilution is not None:
+            dilution = np.broadcast_to(dilution, film.shape)
+        keys = self.keys(film.ravel(), developer.ravel(), None if dilution is None else dilution.ravel())
+        known = keys >= 0
+        key = np.where(known, keys, 0)
+        stops = np.log2(iso.ravel())
+
+        start, end = self.starts[key], self.starts[key + 1] - 1
+        position = np.searchsorted(self.axis, key * KEY_SPAN + stops + ISO_OFFSET)
+        left = np.clip(position - 1, start, end)
+        right = np.clip(position, start, end)
+        x_left, x_right = self.stops[left], self.stops[right]
+        y_left, y_right = self.log_times[left], self.log_times[right]
+        between = x_right > x_left
+        with np.errstate(invalid='ignore', divide='ignore'):
+            interpolated = y_left + (y_right - y_left) * (stops - x_left) / (x_right - x_left)
+        # Outside the charted ISOs (or a single one): carry on from the nearest point with the slope per stop
+        extrapolated = y_left + self.slopes[key] * (stops - x_left)
+        log_time = np.where(between, interpolated, extrapolated)
+        log_time -= self.coefficients[key] * (temperature.ravel() - REFERENCE_TEMPERATURE)
+        times = np.where(known & (iso.ravel() > 0), np.exp(log_time), np.nan)
+        return times.reshape(film.shape)
+
+    def recommend(self, queries):
+        """
+        Answer a DataFrame of queries (film, developer, iso, temperature and optionally dilution columns).
+
+        Returns a copy with the dilution used, the time in minutes, and
+        whether the ISO was charted, interpolated, pushed or pulled.
+        """
+        dilution = queries['dilution'] if 'dilution' in queries.columns else None
+        keys = self.keys(queries['film'], queries['developer'], dilution)
+        known = keys >= 0
+        key = np.where(known, keys, 0)
+        stops = np.log2(queries['iso'].to_numpy(dtype=float))
+        first, last = self.stops[self.starts[key]], self.stops[self.starts[key + 1] - 1]
+        charted = np.isin(key * KEY_SPAN + stops + ISO_OFFSET, self.axis)
+        method = np.select([~known, charted, stops > last, stops < first], ['unknown', 'charted', 'push', 'pull'],
+                           'interpolated')
+        return queries.assign(
+            dilution=np.where(known, self.dilutions[key], None),
+            time=self.times(queries['film'], queries['developer'], queries['iso'], queries['temperature'],
+                            None if dilution is None else dilution.to_numpy()),
+            method=method
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit time/ISO/temperature curves from the cleaned data")
+    parser.add_argument('--input', default='valid_all-film-all-developer.csv', help="cleaned CSV from clean_data.py")
+    parser.add_argument('--output', default='compensation.npz', help="where to save the curves")
+    parser.add_argument('--queries', help="CSV of film,developer,iso,temperature[,dilution] queries to answer")
+    parser.add_argument('--answers', default='recommendations.csv', help="where to write the answers to --queries")
+    args = parser.parse_args()
+    count = build_tables(args.input, args.output)
+    print(f"Fitted curves for {count} film/developer/dilution combinations in {args.output}")
+    if args.queries:
+        answers = CompensationTables(args.output).recommend(pd.read_csv(args.queries))
+        answers.to_csv(args.answers, index=False)
+        print(f"Answered {len(answers)} queries in {args.answers} ({(answers['method'] == 'unknown').sum()} unknown)")
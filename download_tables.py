@@ -1,80 +1,269 @@
-import os
 import time
-import requests
-from urllib.parse import urlparse
+import heapq
+import argparse
+import threading
+import metrics
+import cli
+from page_cache import open_cache, MAX_AGE_DAYS
+from work_queue import WorkQueue
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Pages downloaded between saves of the cache index and of their state in the work queue
+CHECKPOINT_PAGES = 25
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
 
 def read_links():
     """Read the URLs from unique_links.txt"""
     with open('unique_links.txt', 'r') as f:
         return [line.strip() for line in f if line.strip()]
 
-def download_page(url, cache_dir):
-    """Download a webpage and save to cache directory"""
-    # Create filename from URL (sanitize for filesystem)
-    safe_filename = url.replace('://', '_').replace('/', '_')
-    safe_filename = ''.join(c for c in safe_filename if c.isalnum() or c in '_-.')
-    filename = os.path.join(cache_dir, safe_filename)
-    
-    # Check if already cached and not too old
-    if os.path.exists(filename):
-        print("\tcached")
-        # Check file age
-        file_age_days = (time.time() - os.path.getmtime(filename)) / (60 * 60 * 24)
-        if file_age_days < 30:
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except UnicodeDecodeError:
-                # Try different encoding if utf-8 fails
-                with open(filename, 'r', encoding='latin-1') as f:
-                    return f.read()
-    # Download the page with timeout and retry
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            # Try to detect encoding
-            if response.encoding:
-                content = response.text
-            else:
-                content = response.content.decode('utf-8', errors='replace')
-            
-            # Save to cache
-            with open(filename, 'w', encoding='utf-8', errors='replace') as f:
-                f.write(content)
-            
-            # Pause to be polite to the server (longer after retries)
-            time.sleep(1 + attempt)
-            
-            return content
-            
-        except (requests.RequestException, UnicodeError) as e:
-            print(f"Attempt {attempt+1} failed for {url}: {e}")
-            if attempt == max_retries - 1:
-                raise
-            time.sleep(2 * (attempt + 1))  # Exponential backoff
-    
-    raise Exception(f"Failed to download {url} after {max_retries} attempts")
-
-def main():
+@metrics.timed('download.request')
+def fetch_page(url, session=None, timeout=10, headers=None):
+    """Make a single attempt at downloading a page and return the response"""
+    # requests is imported where it's needed, so a run with nothing to download never loads it
+    import requests
+    metrics.count('download.requests')
+    request_headers = dict(headers or {})
+    if session is None:
+        request_headers.update(HEADERS)
+        response = requests.get(url, headers=request_headers, timeout=timeout)
+    else:
+        response = session.get(url, headers=request_headers, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+def response_text(response):
+    """Decode a response body"""
+    # Try to detect encoding
+    if response.encoding:
+        return response.text
+    return response.content.decode('utf-8', errors='replace')
+
+def refresh_page(url, cache, session=None):
+    """
+    Download a page into the cache, revalidating it if it's already there.
+
+    Sends If-None-Match/If-Modified-Since for cached pages so an unchanged
+    page costs a 304 and no body. Returns whether the page was 'downloaded'
+    or 'unchanged', plus the number of body bytes transferred.
+    """
+    response = fetch_page(url, session, headers=cache.validators(url))
+    if response.status_code == 304 and cache.entry(url):
+        cache.touch(url)
+        metrics.count('download.unchanged')
+        return 'unchanged', 0
+    content = response_text(response)
+    with metrics.timer('cache.write'):
+        cache.put(url, content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    metrics.count('download.downloaded')
+    metrics.count('download.bytes', len(response.content))
+    return 'downloaded', len(response.content)
+
+class RateLimiter:
+    """Hand out request slots so all threads together stay under `rate` requests per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Claim the next request slot and return how many seconds until it comes up"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        return slot - now
+
+    def wait(self):
+        """Block until this thread's request slot comes up"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+def make_session(pool_size):
+    """Create a keep-alive session whose connection pool fits every worker"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def download_all(links, cache, workers=4, rate=1.0, max_retries=3, backoff=2.0,
+                 max_age_days=MAX_AGE_DAYS, on_result=None):
+    """
+    Download many pages concurrently into the page cache.
+
+    A bounded pool of workers shares one keep-alive session, and a global
+    rate limiter caps requests per second across all of them. Failed
+    attempts are rescheduled on a retry queue instead of sleeping inside a
+    worker, so a slow or failing URL never holds up the rest. Cached pages
+    older than max_age_days are revalidated with a conditional GET.
+    on_result(url, status, attempts, error), if given, is called as each
+    page is 'downloaded', 'unchanged' or has 'failed' for good.
+    """
+    import requests
+    # Skip anything that is already cached and fresh
+    pending = [url for url in links if not cache.is_fresh(url, max_age_days)]
+    cached = len(links) - len(pending)
+    metrics.count('cache.fresh', cached)
+    print(f"{cached} pages cached, {len(pending)} to download or revalidate")
+
+    limiter = RateLimiter(rate)
+    session = make_session(workers)
+
+    def attempt_download(url):
+        limiter.wait()
+        return refresh_page(url, cache, session)
+
+    # Work items are (ready_time, order, url, attempt), retries go back on the heap
+    queue = [(0.0, order, url, 0) for order, url in enumerate(pending)]
+    heapq.heapify(queue)
+    in_flight = {}
+    downloaded = 0
+    unchanged = 0
+    bytes_downloaded = 0
+    failed = []
+    # Pages stored since the cache index was last saved
+    since_checkpoint = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while queue or in_flight:
+            # Keep every worker busy with items whose backoff has expired
+            now = time.monotonic()
+            while queue and queue[0][0] <= now and len(in_flight) < workers:
+                _, order, url, attempt = heapq.heappop(queue)
+                in_flight[executor.submit(attempt_download, url)] = (order, url, attempt)
+
+            if not in_flight:
+                # Nothing running, sleep until the next retry is due
+                time.sleep(max(0.0, queue[0][0] - time.monotonic()))
+                continue
+
+            # Wake up when a download finishes or, if a worker is free, when the next retry is due
+            timeout = None
+            if queue and len(in_flight) < workers:
+                timeout = max(0.0, queue[0][0] - now)
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                order, url, attempt = in_flight.pop(future)
+                try:
+                    status, size = future.result()
+                    if status == 'unchanged':
+                        unchanged += 1
+                    else:
+                        downloaded += 1
+                        bytes_downloaded += size
+                    since_checkpoint += 1
+                    print(f"Page {downloaded + unchanged}/{len(pending)} {status}: {url}")
+                    if on_result:
+                        on_result(url, status, attempt + 1, None)
+                except (requests.RequestException, UnicodeError) as e:
+                    print(f"Attempt {attempt+1} failed for {url}: {e}")
+                    if attempt + 1 < max_retries:
+                        # Exponential backoff
+                        retry_at = time.monotonic() + backoff * (2 ** attempt)
+                        heapq.heappush(queue, (retry_at, order, url, attempt + 1))
+                        metrics.count('download.retries')
+                    else:
+                        failed.append(url)
+                        metrics.count('download.failed')
+                        if on_result:
+                            on_result(url, 'failed', attempt + 1, e)
+                except Exception as e:
+                    print(f"Error processing {url}: {e}")
+                    failed.append(url)
+                    metrics.count('download.failed')
+                    if on_result:
+                        on_result(url, 'failed', attempt + 1, e)
+
+            # Checkpoint the index so an interrupted run keeps its progress
+            if since_checkpoint >= CHECKPOINT_PAGES:
+                cache.save()
+                since_checkpoint = 0
+
+    session.close()
+    cache.save()
+    return {
+        'cached': cached,
+        'downloaded': downloaded,
+        'unchanged': unchanged,
+        'bytes_downloaded': bytes_downloaded,
+        'failed': failed
+    }
+
+def main(workers=4, rate=1.0, cache_path='cache', queue_file=None, fresh=False):
     # Setup
-    cache_dir = 'cache'
-    os.makedirs(cache_dir, exist_ok=True)
-    
+    cache = open_cache(cache_path)
+
     # Get all links
     links = read_links()
     print(f"Found {len(links)} links to download")
-    
-    for i, url in enumerate(links, 1):
-        try:
-            download_page(url, cache_dir)
-            print(f"Downloading page {i}/{len(links)}")
-        except Exception as e:
-            print(f"Error processing {url}: {e}")
 
+    # With a work queue every page's outcome is saved as it comes in, so a rerun skips what's done
+    queue = WorkQueue(queue_file) if queue_file else None
+    todo = links
+    on_result = None
+    if queue:
+        if fresh:
+            queue.clear('download')
+        queue.add('download', links)
+        # A done page missing from the cache (deleted since, say) is downloaded again
+        unfinished = set(queue.unfinished('download', links))
+        todo = [url for url in links if url in unfinished or not cache.entry(url)]
+        if len(todo) < len(links):
+            print(f"Resuming: {len(links) - len(todo)} pages already done, "
+                  f"{len(queue.failures('download'))} failed last time")
+
+        finished = []
+
+        def checkpoint():
+            # Pages only count as done once the cache index that points to them is on disk
+            cache.save()
+            queue.finish_all('download', finished)
+            finished.clear()
+
+        def on_result(url, status, attempts, error):
+            if status == 'failed':
+                queue.fail('download', url, error, attempts)
+                return
+            finished.append((url, attempts))
+            if len(finished) >= CHECKPOINT_PAGES:
+                checkpoint()
+
+    with metrics.timer('download'):
+        results = download_all(todo, cache, workers=workers, rate=rate, on_result=on_result)
+    if queue:
+        checkpoint()
+    removed = cache.prune()
+    print(f"Downloaded {results['downloaded']} pages ({results['bytes_downloaded']} bytes), "
+          f"{results['unchanged']} unchanged, {results['cached']} already cached")
+    if removed:
+        print(f"Removed {removed} cached pages no longer referenced")
+    if results['failed']:
+        print(f"Failed to download {len(results['failed'])} pages:")
+        for url in results['failed']:
+            print(f"\t{url}")
+    if queue:
+        if results['failed']:
+            print(f"Kept their state in '{queue_file}': the next run retries only them")
+        else:
+            # Every page is in the cache: the next run checks them all again
+            queue.clear('download')
+        queue.close()
+    cache.close()
+
+def run(args):
+    """Call main() with the options from cli.add_download_arguments"""
+    main(workers=args.workers, rate=args.rate, cache_path=args.cache, queue_file=args.queue, fresh=args.fresh)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download chart pages into the cache")
+    cli.add_download_arguments(parser)
+    args = parser.parse_args()
+    with metrics.run_report('download_tables', args.metrics, args.profile):
+        run(args)
\ No newline at end of file
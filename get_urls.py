@@ -1,10 +1,19 @@
-import requests
 import itertools
 import string
 import re
 import time
-from bs4 import BeautifulSoup
+import asyncio
+import argparse
+import metrics
+import cli
+from urllib.parse import urlparse
 from concurrent.futures import ThreadPoolExecutor
+from download_tables import RateLimiter, make_session
+from work_queue import WorkQueue
+
+SEARCH_URL = 'https://www.digitaltruth.com/chart/dbsearch/search.php'
+# Queries the brute-force search sends: every two-letter combination
+BRUTE_FORCE_QUERIES = 26 ** 2
 
 def generate_combinations():
     """Generate all combinations from 'aa' to 'zz'"""
@@ -20,43 +29,302 @@ def make_absolute_url(url, base="https://www.digitaltruth.com"):
     else:
         return f"{base}/{url}"
 
-def search_and_extract_hrefs(query):
-    """Search for a query and extract all hrefs from the results"""
-    url = 'https://www.digitaltruth.com/chart/dbsearch/search.php'
-    data = {'query': query}
-    
+def extract_hrefs(html, base="https://www.digitaltruth.com"):
+    """Extract all hrefs from a search results page as absolute URLs"""
+    # bs4 and requests are imported where they're needed, so importing this module stays cheap
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    links = [make_absolute_url(a.get('href'), base) for a in soup.find_all('a', href=True)]
+
+    # Filter out None values and empty strings
+    return [link for link in links if link]
+
+def search_query(query, session, url=SEARCH_URL, timeout=10):
+    """Make a single attempt at a search and return the result links, relative ones made absolute on its site"""
+    with metrics.timer('search.request'):
+        response = session.post(url, data={'query': query}, timeout=timeout)
+    response.raise_for_status()
+    metrics.count('search.bytes', len(response.content))
+    parsed = urlparse(url)
+    with metrics.timer('search.extract'):
+        return extract_hrefs(response.text, f"{parsed.scheme}://{parsed.netloc}")
+
+class AdaptiveConcurrency:
+    """
+    Limit the number of searches in flight, adapting the limit to how the server copes (AIMD).
+
+    Every success raises the limit by 1/limit, so about one more request
+    per round trip while the server is healthy. A failure, or a response
+    much slower than the running average, cuts the limit by `decrease`;
+    cuts within one round trip of the last are skipped, since the
+    requests behind them were sent before the server had recovered.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, decrease=0.5, spike_factor=3.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.spike_factor = spike_factor
+        self.average_latency = None
+        self.last_cut = 0.0
+        self.in_flight = 0
+        self.peak_limit = self.limit
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency=None, failed=False):
+        """Free a slot and adjust the limit from the outcome of the request that held it"""
+        async with self.condition:
+            self.in_flight -= 1
+            spike = (latency is not None and self.average_latency is not None
+                     and latency > self.spike_factor * self.average_latency)
+            if failed or spike:
+                self.cut()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self.peak_limit = max(self.peak_limit, self.limit)
+            if latency is not None and not failed:
+                self.average_latency = latency if self.average_latency is None else (
+                    0.8 * self.average_latency + 0.2 * latency)
+            self.condition.notify_all()
+
+    def cut(self):
+        """Back off multiplicatively, at most once per round trip"""
+        now = time.monotonic()
+        if now - self.last_cut < (self.average_latency or 0.0):
+            return
+        self.last_cut = now
+        self.limit = max(self.minimum, self.limit * self.decrease)
+
+async def crawl(queries, url=SEARCH_URL, max_concurrency=16, initial_concurrency=4, rate=10.0, max_retries=4,
+                backoff=1.0, timeout=10, on_result=None, on_failure=None, on_start=None):
+    """
+    Run every search query concurrently and return ({query: links}, stats).
+
+    Requests go through one keep-alive session on a pool sized for
+    max_concurrency; requests has no asyncio API, so each blocking call
+    runs on that pool while the event loop schedules them. The number in
+    flight follows AdaptiveConcurrency and the start rate is capped at
+    `rate` per second. A failed query is retried with exponential backoff
+    (without holding a slot) up to max_retries times, unless the server
+    answered with a page that couldn't be read; queries that still fail
+    are listed in stats['failed'] instead of passing as empty results.
+    on_result(query, links), if given, is called as each query succeeds,
+    and on_failure(query, attempts, error) as each one fails for good;
+    on_start(queries) is called with every query before any is sent.
+    """
+    import requests
+    loop = asyncio.get_running_loop()
+    controller = AdaptiveConcurrency(initial_concurrency, maximum=max_concurrency)
+    limiter = RateLimiter(rate)
+    session = make_session(max_concurrency)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    results = {}
+    stats = {'requests': 0, 'retries': 0, 'failed': []}
+
+    async def run_query(query):
+        error = None
+        for attempt in range(max_retries):
+            await controller.acquire()
+            latency = None
+            failed = False
+            try:
+                await asyncio.sleep(limiter.reserve())
+                start = time.monotonic()
+                stats['requests'] += 1
+                metrics.count('search.requests')
+                links = await loop.run_in_executor(executor, search_query, query, session, url, timeout)
+                latency = time.monotonic() - start
+            except requests.RequestException as e:
+                error = e
+                failed = True
+            except Exception as e:
+                # The server answered but the page couldn't be read: asking again won't change it
+                error = e
+            finally:
+                await controller.release(latency, failed=failed)
+            if latency is not None:
+                print(f"Found {len(links)} links for query '{query}'")
+                results[query] = links
+                metrics.count('search.links', len(links))
+                if on_result:
+                    on_result(query, links)
+                return
+            if not failed:
+                print(f"Error reading the results for '{query}': {error}")
+                break
+            print(f"Attempt {attempt+1} failed for '{query}': {error}")
+            if attempt + 1 < max_retries:
+                stats['retries'] += 1
+                metrics.count('search.retries')
+                await asyncio.sleep(backoff * (2 ** attempt))
+        stats['failed'].append(query)
+        metrics.count('search.failed')
+        if on_failure:
+            on_failure(query, attempt + 1, error)
+
+    if on_start:
+        on_start(queries)
     try:
-        response = requests.post(url, data=data)
-        response.raise_for_status()
-        
-        # Parse HTML and extract all href attributes
-        soup = BeautifulSoup(response.text, 'html.parser')
-        links = [make_absolute_url(a.get('href')) for a in soup.find_all('a', href=True)]
-        
-        # Filter out None values and empty strings
-        links = [link for link in links if link]
-        
-        print(f"Found {len(links)} links for query '{query}'")
-        return {query: links}
-    except Exception as e:
-        print(f"Error searching for '{query}': {e}")
-        return {query: []}
+        await asyncio.gather(*(run_query(query) for query in queries))
     finally:
-        # Be nice to the server
-        time.sleep(1)
+        executor.shutdown(wait=False)
+        session.close()
+    stats['peak_concurrency'] = int(controller.peak_limit)
+    return results, stats
 
-def main():
-    # Generate all combinations
-    combinations = generate_combinations()
-    print(f"Generated {len(combinations)} combinations to search")
-    
-    # Store all collected hrefs
-    all_results = {}
-    
-    # Use ThreadPoolExecutor for parallel requests (adjust max_workers as needed)
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        for result in executor.map(search_and_extract_hrefs, combinations):
-            all_results.update(result)
+def detect_result_cap(counts, min_hits=1):
+    """
+    Guess the site's result cap: the largest result count, if at least min_hits queries got exactly that many.
+
+    With the default of one, a lone largest count counts as the cap too:
+    it may be the only query that reached it, and taking its results as
+    complete would prune every query containing it.
+    """
+    top = max(counts, default=0)
+    if top and counts.count(top) >= min_hits:
+        return top
+    return None
+
+def is_covered(query, complete, match='contains'):
+    """
+    Check whether a query can only return links an already complete (untruncated) query returned.
+
+    For a 'contains' search, any name containing the query also contains
+    each of its substrings; for a 'prefix' search, each of its prefixes.
+    """
+    if match == 'prefix':
+        return any(query[:end] in complete for end in range(1, len(query)))
+    return any(query[start:end] in complete
+               for start in range(len(query)) for end in range(start + 1, len(query) + 1)
+               if end - start < len(query))
+
+async def expand_queries(url=SEARCH_URL, min_length=1, max_length=5, result_cap=None, match='contains',
+                         known=None, max_queries=BRUTE_FORCE_QUERIES, **crawl_options):
+    """
+    Search with a prefix tree of queries instead of every two-letter combination, returning ({query: links}, stats).
+
+    Starts from every query of min_length letters and only extends a
+    query by another letter when its results look truncated, i.e. reach
+    the site's result cap (result_cap, or detect_result_cap on the counts
+    so far). An extension is skipped when a complete query it contains
+    already returned everything it could (see is_covered). A two-letter
+    query is therefore only sent when neither of its letters came back
+    complete, and keeps its own (possibly truncated) results, so the
+    links found include everything the 676 two-letter searches return.
+    Queries that fail after retries are extended like truncated ones.
+    Each level of the tree is one crawl() with the given options. match
+    says how the site matches a query, 'contains' or 'prefix' (see
+    is_covered).
+
+    Levels longer than two letters are only searched while the queries
+    sent stay within max_queries, by default the 676 of the brute-force
+    search: under a small result cap the tree could otherwise cost more
+    than brute force. The queries it stops at are left in
+    stats['truncated'], as brute force would leave them.
+
+    If every min_length-letter query succeeds with no results, the site
+    ignores queries that short and the search starts again one letter
+    longer, once and never past max_length. A level where queries failed
+    and none returned anything (the site is down, or its search changed)
+    ends the search instead, with its failures in stats['failed'] and
+    stats['truncated'].
+
+    known holds {query: links} from an earlier, interrupted run: those
+    queries aren't sent again, their links are used as if just returned,
+    so the tree grows the same way and only the rest is searched.
+    """
+    letters = string.ascii_lowercase
+    known = known or {}
+    results = {}
+    complete = set()
+    stats = {'requests': 0, 'retries': 0, 'failed': [], 'peak_concurrency': 0, 'levels': [], 'truncated': []}
+    level = [''.join(combo) for combo in itertools.product(letters, repeat=min_length)]
+    restarted = False
+    sent = 0
+    while level:
+        sent += len(level)
+        found, level_stats = await crawl([query for query in level if query not in known], url, **crawl_options)
+        found.update((query, known[query]) for query in level if query in known)
+        for key in ['requests', 'retries']:
+            stats[key] += level_stats[key]
+        stats['peak_concurrency'] = max(stats['peak_concurrency'], level_stats['peak_concurrency'])
+        results.update(found)
+        stats['failed'] += level_stats['failed']
+        if level_stats['failed'] and not any(found.values()):
+            # Failures aren't "no results": extending them would only multiply the failing queries
+            print(f"{len(level_stats['failed'])} {len(level[0])}-letter queries failed and none returned "
+                  f"anything, stopping the search")
+            stats['levels'].append({'length': len(level[0]), 'queries': len(level), 'expanded': 0})
+            stats['truncated'] = list(level_stats['failed'])
+            break
+        if len(level[0]) == min_length < max_length and not restarted and not any(found.values()):
+            # The site ignores queries this short: start again one letter longer
+            print(f"No results for any {min_length}-letter query, starting from {min_length + 1} letters")
+            restarted = True
+            min_length += 1
+            level = [''.join(combo) for combo in itertools.product(letters, repeat=min_length)]
+            continue
+
+        cap = result_cap or detect_result_cap([len(links) for links in results.values()])
+        expand = [query for query in level if query not in found or (cap and len(found[query]) >= cap)]
+        complete.update(query for query in level if query not in expand)
+        stats['levels'].append({'length': len(level[0]), 'queries': len(level), 'expanded': len(expand)})
+        print(f"{len(level)} {len(level[0])}-letter queries, {len(expand)} truncated or failed")
+        if len(level[0]) >= max_length:
+            stats['truncated'] = expand
+            break
+        level = [query + letter for query in expand for letter in letters
+                 if not is_covered(query + letter, complete, match)]
+        if len(level[0] if level else '') > 2 and sent + len(level) > max_queries:
+            print(f"{len(level)} more queries would take the search past {max_queries}, stopping")
+            stats['truncated'] = expand
+            break
+    stats['queries'] = sent
+    return results, stats
+
+def main(max_concurrency=16, rate=10.0, brute_force=False, result_cap=None, min_length=1, max_length=5,
+         queue_file=None, fresh=False, search_url=SEARCH_URL, match='contains', max_queries=BRUTE_FORCE_QUERIES):
+    # With a work queue every query's outcome is saved as it comes in, so a rerun resumes
+    queue = WorkQueue(queue_file) if queue_file else None
+    known = {}
+    crawl_options = {'max_concurrency': max_concurrency, 'rate': rate}
+    if queue:
+        if fresh:
+            queue.clear('search')
+        known = queue.results('search')
+        if known:
+            print(f"Resuming: {len(known)} searches already done, "
+                  f"{len(queue.failures('search'))} failed last time")
+        crawl_options['on_result'] = lambda query, links: queue.finish('search', query, links)
+        crawl_options['on_failure'] = lambda query, attempts, error: queue.fail('search', query, error, attempts)
+        # Queries are pending until they finish, so an interrupted search shows in the queue
+        crawl_options['on_start'] = lambda queries: queue.add('search', queries)
+
+    if brute_force:
+        # Generate all combinations
+        combinations = generate_combinations()
+        print(f"Generated {len(combinations)} combinations to search")
+        
+        # Run every search through the adaptive crawler
+        with metrics.timer('search'):
+            all_results, stats = asyncio.run(crawl([query for query in combinations if query not in known],
+                                                   search_url, **crawl_options))
+        all_results.update((query, known[query]) for query in combinations if query in known)
+    else:
+        with metrics.timer('search'):
+            all_results, stats = asyncio.run(expand_queries(search_url, min_length=min_length,
+                                                            max_length=max_length, result_cap=result_cap,
+                                                            match=match, known=known, max_queries=max_queries,
+                                                            **crawl_options))
+        if stats['truncated']:
+            print(f"{len(stats['truncated'])} queries still truncated or failed where the search stopped")
     
     # Deduplicate links across all queries and filter out JavaScript links
     unique_links = set()
@@ -87,6 +355,28 @@ def main():
     # Count total links found before deduplication
     total_links = sum(len(links) for links in all_results.values())
     print(f"Total links found (with duplicates): {total_links}")
+    print(f"{stats['requests']} requests, {stats['retries']} retries, "
+          f"concurrency peaked at {stats['peak_concurrency']}")
+    if stats['failed']:
+        print(f"{len(stats['failed'])} queries failed after retries: {', '.join(stats['failed'])}")
+    if queue:
+        if stats['failed']:
+            print(f"Kept their state in '{queue_file}': the next run retries only them")
+        else:
+            # A complete search: the next run starts a fresh one
+            queue.clear('search')
+        queue.close()
+
+def run(args):
+    """Call main() with the options from cli.add_search_arguments"""
+    main(max_concurrency=args.max_concurrency, rate=args.rate, brute_force=args.brute_force,
+         result_cap=args.result_cap, min_length=args.min_length, max_length=args.max_length,
+         queue_file=args.queue, fresh=args.fresh, search_url=args.search_url or SEARCH_URL, match=args.match,
+         max_queries=args.max_queries)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Search the chart site and save the chart URLs")
+    cli.add_search_arguments(parser)
+    args = parser.parse_args()
+    with metrics.run_report('get_urls', args.metrics, args.profile):
+        run(args)
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Timers and counters for the scripts, written as a JSON report at the end of a run.
+
+Code anywhere in the scripts records into one process-wide registry:
+
+    with metrics.timer('parse.find_table'):
+        table = find_mdctable(html)
+    metrics.count('download.bytes', len(response.content))
+
+or times a whole function with the @metrics.timed('name') decorator.
+Names are dotted by stage ('search', 'download', 'cache', 'parse',
+'write', 'clean'). A timer keeps the number of calls and their total and
+longest time; for every counter 'stage.thing' whose stage also has a
+timer, the report adds 'stage.thing_per_second', so 'parse.pages' and
+the 'parse' timer give pages per second.
+
+run_report() wraps a script's run: it resets the registry, optionally
+runs the script under cProfile (dumping the profile for pstats or
+snakeviz and listing the hot functions in the report), and writes the
+report with the run's wall time and peak memory:
+
+    with metrics.run_report('parse_tables', 'parse_tables_metrics.json', profile_file='parse.prof'):
+        main()
+
+Only the process that writes the report is measured: pages parsed in a
+worker process (parse_tables.py --workers N) show up in the counters
+the main process keeps, but not in the per-function timers, and their
+memory only in peak_memory_mb['children'].
+"""
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak memory is left out of the report
+    resource = None
+
+# Functions listed in the report's hot_functions when profiling
+HOT_FUNCTIONS = 25
+
+class Metrics:
+    """Thread-safe timers and counters for one run"""
+
+    def __init__(self, script=None):
+        self.script = script
+        self.started = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.timers = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add_time(self, name, seconds):
+        """Record one call of a timer"""
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = {'calls': 1, 'seconds': seconds, 'max_seconds': seconds}
+            else:
+                timer['calls'] += 1
+                timer['seconds'] += seconds
+                timer['max_seconds'] = max(timer['max_seconds'], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Time the body of a with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        """Add n to a counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def rates(self):
+        """Every counter 'stage.thing' per second of its stage's timer"""
+        rates = {}
+        for name, value in self.counters.items():
+            stage, _, thing = name.rpartition('.')
+            seconds = self.timers.get(stage, {}).get('seconds')
+            if stage and seconds:
+                rates[f"{stage}.{thing}_per_second"] = round(value / seconds, 3)
+        return rates
+
+    def report(self):
+        """The run's metrics as a JSON-serializable dict"""
+        with self.lock:
+            timers = {name: {'calls': timer['calls'], 'seconds': round(timer['seconds'], 6),
+                             'max_seconds': round(timer['max_seconds'], 6)}
+                      for name, timer in sorted(self.timers.items())}
+            counters = dict(sorted(self.counters.items()))
+        return {
+            'script': self.script,
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - self.start, 3),
+            'peak_memory_mb': peak_memory_mb(),
+            'timers': timers,
+            'counters': counters,
+            'rates': self.rates()
+        }
+
+def peak_memory_mb():
+    """Peak resident memory of this process and of its finished child processes, or None where unknown"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)
+    }
+
+# The registry every script records into
+METRICS = Metrics()
+
+def timer(name):
+    """Time a with block in the current run"""
+    return METRICS.timer(name)
+
+def count(name, n=1):
+    """Add to a counter of the current run"""
+    METRICS.count(name, n)
+
+def timed(name):
+    """Decorator timing every call of a function under `name`"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                METRICS.add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def hot_functions(profiler, limit=HOT_FUNCTIONS):
+    """The functions with the most time spent in them (not counting callees), from a cProfile run"""
+    import pstats
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({'function': f"{os.path.basename(filename)}:{line}({function})", 'calls': calls,
+                     'own_seconds': round(own, 6), 'cumulative_seconds': round(cumulative, 6)})
+    rows.sort(key=lambda row: row['own_seconds'], reverse=True)
+    return rows[:limit]
+
+def write_report(report, report_file):
+    """Write a report as JSON, through a temporary file"""
+    directory = os.path.dirname(report_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_file = f"{report_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_file, report_file)
+
+@contextmanager
+def run_report(script, report_file=None, profile_file=None):
+    """
+    Measure one run of a script, writing the report to report_file when it ends (even if it fails).
+
+    With profile_file the run is profiled with cProfile, the profile is
+    dumped there, and the hottest functions are added to the report.
+    """
+    global METRICS
+    METRICS = Metrics(script)
+    profiler = None
+    if profile_file:
+        # Only loaded when profiling, to keep every script's startup short
+        import cProfile
+        profiler = cProfile.Profile()
+    failed = True
+    if profiler:
+        profiler.enable()
+    try:
+        yield METRICS
+        failed = False
+    finally:
+        if profiler:
+            profiler.disable()
+        report = METRICS.report()
+        report['failed'] = failed
+        if profiler:
+            profiler.dump_stats(profile_file)
+            report['profile'] = profile_file
+            report['hot_functions'] = hot_functions(profiler)
+        if report_file:
+            write_report(report, report_file)
@@ -0,0 +1,243 @@
+"""
+Canonical film and developer names.
+
+The scraped names come in variants that exact matching keeps apart:
+"Kodak Tri-X 400", "kodak tri-x  400", "Kodak TriX 400", "Kodka Tri-X
+400". Names with the same key (name_key: case, spacing and punctuation
+folded) are grouped, as are names whose spellings differ by one typo
+(one letter added, dropped, changed or two swapped) in a word of at
+least TYPO_MIN_LENGTH letters, and every variant is mapped to the
+group's most common spelling. Words with digits must match exactly, so
+Delta 100 and Delta 400 stay apart, and short words like CHS and CMS
+are never taken for typos of each other.
+
+Typos are looked for in the spelling with its punctuation kept
+(spelling_key), and only in words of letters alone: folding the
+punctuation first would join suffixes onto the name, and Caffenol-C and
+Caffenol-CH, Pyrocat-HD and Pyrocat-HDC, Xtol and Xtol-R are different
+developers, not typos of each other.
+
+Typo candidates are found by blocking instead of comparing every pair
+of names: each name is indexed under every spelling of itself with one
+letter of one word deleted, and two names one typo apart always share
+one of those entries, so only names in the same block are compared.
+
+The mapping is saved as JSON. On later runs names already in it are
+mapped with a dictionary lookup; only names never seen before are
+searched, against the existing canonical names.
+"""
+import os
+import re
+import json
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+# Bump whenever name_key or the matching rules change, so older mappings are rebuilt
+NAME_INDEX_VERSION = 2
+NAME_COLUMNS = ['Film', 'Developer']
+# Shortest word (in the longer spelling) in which a one-letter difference counts as a typo
+TYPO_MIN_LENGTH = 5
+
+def name_key(name):
+    """Fold case, punctuation and spacing: 'Ilford HP5 Plus' and 'ilford hp-5+' give the same key"""
+    key = name.casefold().replace('+', ' plus ')
+    key = re.sub(r'[^\w\s]|_', '', key)
+    return ' '.join(key.split())
+
+def spelling_key(name):
+    """Fold case and spacing but keep punctuation, so a typo is only looked for within whole words"""
+    return ' '.join(name.casefold().replace('+', ' plus ').split())
+
+def compact_key(key):
+    """A key without its spaces, so 'tri x' and 'trix' are the same name"""
+    return key.replace(' ', '')
+
+def is_typo_word(word):
+    """Only words of letters alone, long enough to be recognisable, can have typos"""
+    return word.isalpha() and len(word) >= TYPO_MIN_LENGTH - 1
+
+def one_edit(a, b):
+    """True when two different words are one insertion, deletion, substitution or adjacent swap apart"""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    start = 0
+    while start < len(a) and a[start] == b[start]:
+        start += 1
+    if len(a) < len(b):
+        return a[start:] == b[start + 1:]
+    swapped = a[start + 1:start + 2] + a[start:start + 1]
+    return a[start + 1:] == b[start + 1:] or (swapped == b[start:start + 2] and a[start + 2:] == b[start + 2:])
+
+def typo_blocks(key):
+    """Every block a key belongs to: one word (of letters) replaced by itself or by itself with one letter deleted"""
+    words = key.split()
+    for i, word in enumerate(words):
+        if not is_typo_word(word):
+            continue
+        for variant in {word} | {word[:j] + word[j + 1:] for j in range(len(word))}:
+            yield (i, *words[:i], variant, *words[i + 1:])
+
+def is_typo(key, other):
+    """True when two spelling keys differ only by one typo in one long enough word of letters"""
+    words, other_words = key.split(), other.split()
+    if len(words) != len(other_words):
+        return False
+    different = [(a, b) for a, b in zip(words, other_words) if a != b]
+    return (len(different) == 1 and all(map(is_typo_word, different[0])) and
+            max(map(len, different[0])) >= TYPO_MIN_LENGTH and one_edit(*different[0]))
+
+class NameIndex:
+    """
+    Map the raw names of one column to canonical names, learning new names as they appear.
+
+    mapping holds every raw name seen so far and its canonical name.
+    update() adds the names of a batch: names with the same compact key
+    and names whose spellings are one typo apart are joined with
+    union-find, without ever merging two existing canonical names. A
+    group that already has a canonical name keeps it; a new group takes
+    its most common spelling in the batch.
+    """
+
+    def __init__(self, mapping=None):
+        self.mapping = dict(mapping or {})
+
+    def update(self, counts):
+        """Learn the names in {name: count} not mapped yet, returning how many were added"""
+        new = {name: count for name, count in counts.items()
+               if isinstance(name, str) and count > 0 and name not in self.mapping}
+        if not new:
+            return 0
+        canonical = set(self.mapping.values())
+        names = sorted(canonical) + sorted(new)
+        parent = list(range(len(names)))
+        # The existing canonical name of each group, if it has one
+        anchor = {i: name for i, name in enumerate(names) if name in canonical}
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i, j):
+            i, j = find(i), find(j)
+            if i == j or (i in anchor and j in anchor):
+                return
+            if j in anchor:
+                i, j = j, i
+            parent[j] = i
+
+        # Names with the same compact key are variants of each other
+        by_key = defaultdict(list)
+        for i, name in enumerate(names):
+            by_key[name_key(name)].append(i)
+        by_compact = defaultdict(list)
+        for key, members in by_key.items():
+            by_compact[compact_key(key)].extend(members)
+        for members in by_compact.values():
+            for i in members[1:]:
+                union(members[0], i)
+
+        by_spelling = defaultdict(list)
+        for i, name in enumerate(names):
+            by_spelling[spelling_key(name)].append(i)
+        for key, other in self.typo_pairs(by_spelling):
+            # Pairs of existing canonical names were settled when they were learned
+            if all(names[i] in canonical for i in by_spelling[key] + by_spelling[other]):
+                continue
+            union(by_spelling[key][0], by_spelling[other][0])
+
+        groups = defaultdict(list)
+        for i in range(len(names)):
+            groups[find(i)].append(i)
+        for root, members in groups.items():
+            if root in anchor:
+                target = anchor[root]
+            else:
+                # Most common spelling, ties broken alphabetically
+                target = min((names[i] for i in members), key=lambda name: (-new.get(name, 0), name))
+            for i in members:
+                if names[i] in new:
+                    self.mapping[names[i]] = target
+        return len(new)
+
+    @staticmethod
+    def typo_pairs(keys):
+        """Yield the pairs of keys one typo apart, comparing only keys that share a block (see typo_blocks)"""
+        blocks = defaultdict(list)
+        for key in keys:
+            for block in typo_blocks(key):
+                blocks[block].append(key)
+        checked = set()
+        for members in blocks.values():
+            for i, key in enumerate(members):
+                for other in members[i + 1:]:
+                    if (key, other) not in checked:
+                        checked.add((key, other))
+                        if is_typo(key, other):
+                            yield key, other
+
+    def apply(self, series):
+        """Replace every mapped name in a column, keeping a categorical column categorical"""
+        values = series.astype('category')
+        categories = values.cat.categories
+        mapped = pd.Index([self.mapping.get(name, name) for name in categories])
+        new_categories = mapped.unique()
+        # -1 (missing) stays -1
+        codes = np.append(new_categories.get_indexer(mapped), -1)[values.cat.codes.to_numpy()]
+        result = pd.Series(pd.Categorical.from_codes(codes, new_categories), index=series.index, name=series.name)
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            result = result.astype(series.dtype)
+        return result
+
+class NameNormalizer:
+    """
+    Canonical names for the Film and Developer columns, cached in a JSON file.
+
+    update(frame) learns the names of a frame, apply(frame) rewrites
+    them; save() writes the mapping back so the next run only has to
+    search for names it hasn't seen.
+    """
+
+    def __init__(self, path=None, columns=NAME_COLUMNS):
+        self.path = path
+        mappings = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('version') == NAME_INDEX_VERSION:
+                mappings = saved['columns']
+        self.indexes = {column: NameIndex(mappings.get(column)) for column in columns}
+
+    def update(self, frame):
+        """Learn every new name in the frame's name columns, returning how many there were"""
+        return sum(self.update_counts(column, frame[column].value_counts()) for column in self.indexes
+                   if column in frame.columns)
+
+    def update_counts(self, column, counts):
+        """Learn new names of one column from a Series or dict of {name: count}"""
+        return self.indexes[column].update(dict(counts))
+
+    def apply(self, frame):
+        """Return the frame with its name columns mapped to canonical names"""
+        return frame.assign(**{column: index.apply(frame[column]) for column, index in self.indexes.items()
+                               if column in frame.columns})
+
+    def variants(self):
+        """Number of raw names mapped to a different canonical name"""
+        return sum(name != target for index in self.indexes.values() for name, target in index.mapping.items())
+
+    def save(self):
+        """Write the mapping to its JSON file"""
+        if not self.path:
+            return
+        tmp_file = f"{self.path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': NAME_INDEX_VERSION,
+                'columns': {column: index.mapping for column, index in self.indexes.items()}
+            }, f, ensure_ascii=False, indent=0)
+        os.replace(tmp_file, self.path)
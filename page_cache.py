@@ -0,0 +1,351 @@
+import os
+import abc
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+MAX_AGE_DAYS = 30
+
+def legacy_filename(url, cache_dir):
+    """Build the old one-file-per-URL cache path (sanitized for filesystem)"""
+    safe_filename = url.replace('://', '_').replace('/', '_')
+    safe_filename = ''.join(c for c in safe_filename if c.isalnum() or c in '_-.')
+    return os.path.join(cache_dir, safe_filename)
+
+def read_text_file(filename):
+    """Read a cached page, falling back to latin-1 if utf-8 fails"""
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return f.read()
+    except UnicodeDecodeError:
+        # Try different encoding if utf-8 fails
+        with open(filename, 'r', encoding='latin-1') as f:
+            return f.read()
+
+def encode_page(content):
+    """Encode page text for storage, returning the bytes and their content hash"""
+    data = content.encode('utf-8', errors='replace')
+    return data, hashlib.sha256(data).hexdigest()
+
+def open_cache(path):
+    """Open a page cache: a .sqlite/.db path is a single-file archive, anything else a directory"""
+    if path.endswith(('.sqlite', '.sqlite3', '.db')):
+        return ArchiveCache(path)
+    return PageCache(path)
+
+class BaseCache(abc.ABC):
+    """Freshness and revalidation logic shared by the cache backends"""
+
+    @abc.abstractmethod
+    def entry(self, url):
+        """The metadata stored for a URL (checked, sha256, etag, last_modified), or None if it isn't cached"""
+
+    def age_days(self, url):
+        """Days since the page was last downloaded or revalidated, None if never"""
+        entry = self.entry(url)
+        if not entry:
+            return None
+        return (time.time() - entry['checked']) / (60 * 60 * 24)
+
+    def is_fresh(self, url, max_age_days=MAX_AGE_DAYS):
+        """Check if a page is cached and was confirmed recently enough to skip the network"""
+        age = self.age_days(url)
+        return age is not None and age < max_age_days
+
+    def digest(self, url):
+        """Content hash of the cached body for a URL, or None"""
+        entry = self.entry(url)
+        return entry['sha256'] if entry else None
+
+    def validators(self, url):
+        """Conditional request headers for revalidating a cached page"""
+        entry = self.entry(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def close(self):
+        """Release any resources held by the cache"""
+        pass
+
+class PageCache(BaseCache):
+    """
+    Content-addressed page store with revalidation metadata per URL.
+
+    Page bodies live under objects/ named by their SHA-256, so identical
+    pages are stored once. index.json maps each URL to the hash of its
+    current body plus the ETag/Last-Modified validators and the time the
+    page was last confirmed, which is all a conditional GET needs.
+
+    Pages cached by older versions (one sanitized file per URL) are still
+    read, and are moved into the store the next time they are downloaded.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    def object_path(self, digest):
+        """Path of the body stored under a content hash"""
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.html")
+
+    def entry(self, url):
+        """Return the index entry for a URL, or None if it isn't in the store"""
+        return self.entries.get(url)
+
+    def contains(self, url):
+        """Check if a URL has a cached body (in the store or a legacy file)"""
+        return url in self.entries or os.path.exists(legacy_filename(url, self.cache_dir))
+
+    def age_days(self, url):
+        """Days since the page was last downloaded or revalidated, None if never"""
+        if url in self.entries:
+            return super().age_days(url)
+        filename = legacy_filename(url, self.cache_dir)
+        if not os.path.exists(filename):
+            return None
+        return (time.time() - os.path.getmtime(filename)) / (60 * 60 * 24)
+
+    def get(self, url):
+        """Return the cached page text for a URL, or None if it isn't cached"""
+        entry = self.entries.get(url)
+        if entry:
+            with open(self.object_path(entry['sha256']), 'r', encoding='utf-8') as f:
+                return f.read()
+        filename = legacy_filename(url, self.cache_dir)
+        if os.path.exists(filename):
+            return read_text_file(filename)
+        return None
+
+    def put(self, url, content, etag=None, last_modified=None, checked=None):
+        """Store a downloaded page and its validators, returning its content hash"""
+        data, digest = encode_page(content)
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write under a temporary name so readers never see a partial body
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self.entries[url] = {
+                'sha256': digest,
+                'etag': etag,
+                'last_modified': last_modified,
+                'checked': checked or time.time()
+            }
+        # The legacy copy is superseded by the stored object
+        filename = legacy_filename(url, self.cache_dir)
+        if os.path.exists(filename):
+            os.remove(filename)
+        return digest
+
+    def touch(self, url):
+        """Record that the server confirmed the cached page is unchanged"""
+        with self.lock:
+            self.entries[url]['checked'] = time.time()
+
+    def urls(self):
+        """List every URL with a body in the store"""
+        return list(self.entries)
+
+    def scan(self):
+        """Yield (url, html) for every stored page, reading each body once in on-disk order"""
+        by_digest = {}
+        for url, entry in self.entries.items():
+            by_digest.setdefault(entry['sha256'], []).append(url)
+        for digest in sorted(by_digest):
+            with open(self.object_path(digest), 'r', encoding='utf-8') as f:
+                html = f.read()
+            for url in by_digest[digest]:
+                yield url, html
+
+    def save(self):
+        """Write the index to disk"""
+        with self.lock:
+            data = json.dumps(self.entries)
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_file, self.index_file)
+
+    def prune(self):
+        """Delete stored bodies no URL points to any more, returning how many were removed"""
+        with self.lock:
+            referenced = {entry['sha256'] for entry in self.entries.values()}
+        removed = 0
+        for subdir in os.listdir(self.objects_dir):
+            subdir_path = os.path.join(self.objects_dir, subdir)
+            for name in os.listdir(subdir_path):
+                if name.endswith('.html') and name[:-5] not in referenced:
+                    os.remove(os.path.join(subdir_path, name))
+                    removed += 1
+        return removed
+
+class ArchiveCache(BaseCache):
+    """
+    Single-file page store in SQLite with zlib-compressed bodies.
+
+    Works like PageCache (same content addressing and validators) but keeps
+    everything in one indexed file: `pages` maps each URL to a body hash,
+    `bodies` holds each distinct compressed body once. Lookups by URL use
+    the primary key; scan() reads bodies in storage order.
+    """
+
+    def __init__(self, path, compression_level=6):
+        self.path = path
+        self.compression_level = compression_level
+        self.lock = threading.Lock()
+        # Downloads write from worker threads, the lock serializes them
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS bodies (
+            sha256 TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        )''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            checked REAL NOT NULL
+        )''')
+        self.conn.commit()
+
+    def entry(self, url):
+        """Return the index entry for a URL, or None if it isn't in the store"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT sha256, etag, last_modified, checked FROM pages WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'sha256': row[0], 'etag': row[1], 'last_modified': row[2], 'checked': row[3]}
+
+    def contains(self, url):
+        """Check if a URL has a cached body"""
+        return self.entry(url) is not None
+
+    def get(self, url):
+        """Return the cached page text for a URL, or None if it isn't cached"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT b.data FROM pages p JOIN bodies b ON b.sha256 = p.sha256 WHERE p.url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, url, content, etag=None, last_modified=None, checked=None):
+        """Store a downloaded page and its validators, returning its content hash"""
+        data, digest = encode_page(content)
+        compressed = zlib.compress(data, self.compression_level)
+        with self.lock:
+            self.conn.execute('INSERT OR IGNORE INTO bodies (sha256, data) VALUES (?, ?)', (digest, compressed))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO pages (url, sha256, etag, last_modified, checked) VALUES (?, ?, ?, ?, ?)',
+                (url, digest, etag, last_modified, checked or time.time())
+            )
+        return digest
+
+    def touch(self, url):
+        """Record that the server confirmed the cached page is unchanged"""
+        with self.lock:
+            self.conn.execute('UPDATE pages SET checked = ? WHERE url = ?', (time.time(), url))
+
+    def urls(self):
+        """List every URL with a body in the store"""
+        with self.lock:
+            return [row[0] for row in self.conn.execute('SELECT url FROM pages')]
+
+    def scan(self):
+        """Yield (url, html) for every stored page, reading each body once in storage order"""
+        # A separate connection so the scan doesn't hold the lock writers need
+        conn = sqlite3.connect(self.path)
+        try:
+            rows = conn.execute(
+                'SELECT b.data, group_concat(p.url, char(10)) FROM bodies b '
+                'JOIN pages p ON p.sha256 = b.sha256 GROUP BY b.rowid ORDER BY b.rowid'
+            )
+            for data, urls in rows:
+                html = zlib.decompress(data).decode('utf-8')
+                for url in urls.split('\n'):
+                    yield url, html
+        finally:
+            conn.close()
+
+    def save(self):
+        """Commit pending writes"""
+        with self.lock:
+            self.conn.commit()
+
+    def prune(self):
+        """Delete stored bodies no URL points to any more, returning how many were removed"""
+        with self.lock:
+            cursor = self.conn.execute('DELETE FROM bodies WHERE sha256 NOT IN (SELECT sha256 FROM pages)')
+            self.conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        """Commit and close the database"""
+        self.save()
+        self.conn.close()
+
+def copy_cache(source, destination, urls=None):
+    """
+    Copy pages and their validators from one cache to another, returning the page count.
+
+    Legacy one-file-per-URL pages can't be listed, so pass `urls` to pick
+    them up as well.
+    """
+    if urls is None:
+        pages = source.scan()
+    else:
+        pages = ((url, source.get(url)) for url in urls)
+    count = 0
+    for url, html in pages:
+        if html is None:
+            continue
+        entry = source.entry(url)
+        if entry:
+            destination.put(url, html, entry['etag'], entry['last_modified'], entry['checked'])
+        else:
+            checked = time.time() - source.age_days(url) * 60 * 60 * 24
+            destination.put(url, html, checked=checked)
+        count += 1
+    destination.save()
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy a page cache into another backend, e.g. cache cache.sqlite")
+    parser.add_argument('source', help="cache to read from")
+    parser.add_argument('destination', help="cache to write to")
+    parser.add_argument('--links', help="file of URLs to copy, needed for pages in the old one-file-per-URL layout")
+    args = parser.parse_args()
+
+    urls = None
+    if args.links:
+        with open(args.links, 'r') as f:
+            urls = [line.strip() for line in f if line.strip()]
+    source = open_cache(args.source)
+    destination = open_cache(args.destination)
+    count = copy_cache(source, destination, urls)
+    destination.close()
+    print(f"Copied {count} pages from {args.source} to {args.destination}")
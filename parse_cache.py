@@ -0,0 +1,98 @@
+"""
+Parsed cell values, worked out once per distinct string and optionally kept between runs.
+
+The raw columns repeat a small set of strings: a few hundred
+temperatures ('20C', '68F'), a few thousand times and ISOs. ParseCache
+factorizes a column, runs the vectorized parser over the distinct
+strings it hasn't seen before, and maps the results back to the rows
+through the factorized codes, so a column of millions of cells costs a
+factorize, a parse of its new strings and a take.
+
+Results are kept per kind of cell (clean_data.py has 'time', 'temp',
+'iso' and 'iso_valid') for the life of the object, so streamed chunks
+and pipeline batches only parse strings new to the run. With a path
+they are also saved as JSON and loaded by the next run, together with a
+version tag: a cache written under another version of the parsing rules
+is ignored and rebuilt.
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+import metrics
+
+def is_text_column(series):
+    """Check the cells are all strings or missing, so parse results can be keyed by the string"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.api.types.is_string_dtype(series.cat.categories)
+    return pd.api.types.is_string_dtype(series)
+
+def json_value(value):
+    """A parse result as JSON stores it: NumPy scalars as Python ones, NaN as None"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+class ParseCache:
+    """
+    Parse results per distinct string for each kind of cell, saved to a JSON file if given a path.
+
+    parse(kind, series, parser, dtypes) gives what parser(series) would,
+    as a DataFrame with the columns and dtypes of `dtypes`; save() writes
+    the results back for the next run.
+    """
+
+    def __init__(self, path=None, version=None):
+        self.path = path
+        self.version = version
+        self.kinds = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('version') == version:
+                self.kinds = saved['kinds']
+
+    def parse(self, kind, series, parser, dtypes):
+        """
+        Apply a vectorized parser to a column, parsing each distinct string once.
+
+        parser takes a Series and returns a DataFrame (or a Series, for
+        one column) computed cell by cell, so parsing the distinct strings
+        alone gives the same result for each of them. Columns that aren't
+        all text are parsed directly.
+        """
+        columns = list(dtypes)
+
+        def as_frame(parsed):
+            return parsed.to_frame(columns[0]) if isinstance(parsed, pd.Series) else parsed[columns]
+
+        if not is_text_column(series):
+            return as_frame(parser(series)).astype(dtypes)
+        codes, uniques = pd.factorize(series)
+        strings = list(uniques)
+        known = self.kinds.setdefault(kind, {})
+        new = [string for string in strings if string not in known]
+        if new:
+            parsed = as_frame(parser(pd.Series(new, dtype='str')))
+            known.update(zip(new, ([json_value(value) for value in row] for row in parsed.itertuples(index=False))))
+        metrics.count(f'clean.{kind}_strings_parsed', len(new))
+        metrics.count(f'clean.{kind}_strings_cached', len(strings) - len(new))
+        # Missing cells (code -1) take the last row: the parse of a missing cell
+        missing = [json_value(value) for value in next(as_frame(parser(pd.Series([np.nan], dtype='str')))
+                                                       .itertuples(index=False))]
+        values = pd.DataFrame([known[string] for string in strings] + [missing], columns=columns).astype(dtypes)
+        codes = np.where(codes < 0, len(strings), codes)
+        result = values.take(codes)
+        result.index = series.index
+        return result
+
+    def save(self):
+        """Write the results to the JSON file"""
+        if not self.path:
+            return
+        tmp_file = f"{self.path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'kinds': self.kinds}, f, ensure_ascii=False, indent=0)
+        os.replace(tmp_file, self.path)
@@ -1,39 +1,73 @@
 import os
-import csv
-from bs4 import BeautifulSoup
+import json
+import hashlib
+import argparse
+import metrics
+import cli
 from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor
+from page_cache import open_cache, encode_page
+from table_extractor import find_mdctable, FastPathUnsupported
+from table_writer import TableWriter
+
+# Bump whenever parse_table's output changes, so manifests from older versions are ignored
+PARSER_VERSION = 1
+# Bump whenever row_fingerprint changes, so outputs deduplicated by an older one are rebuilt
+FINGERPRINT_VERSION = 2
 
 def read_links():
     """Read the URLs from unique_links.txt"""
     with open('unique_links.txt', 'r') as f:
         return [line.strip() for line in f if line.strip()]
 
-def read_cached_page(url, cache_dir):
-    """Read a webpage from cache directory"""
-    # Create filename from URL (sanitize for filesystem)
-    safe_filename = url.replace('://', '_').replace('/', '_')
-    safe_filename = ''.join(c for c in safe_filename if c.isalnum() or c in '_-.')
-    filename = os.path.join(cache_dir, safe_filename)
-    
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return f.read()
-    except UnicodeDecodeError:
-        # Try different encoding if utf-8 fails
-        with open(filename, 'r', encoding='latin-1') as f:
-            return f.read()
-    except FileNotFoundError:
+def read_cached_page(url, cache):
+    """Read a webpage from the page cache"""
+    with metrics.timer('cache.read'):
+        html = cache.get(url)
+    if html is None:
+        metrics.count('cache.misses')
         raise Exception(f"Cache file not found for {url}")
+    metrics.count('cache.hits')
+    return html
 
-def parse_table(html, source_url=""):
-    """Extract table data from HTML with handling for malformed tables"""
+@metrics.timed('parse.find_table_bs4')
+def find_table_bs4(html):
+    """Find the mdctable by parsing the whole page with BeautifulSoup"""
+    # Imported here so runs where every page takes the fast path (or is unchanged) never load bs4
+    from bs4 import BeautifulSoup
     # First, try to fix missing </tr> tags
     html = html.replace('<tr>', '</tr><tr>')
     # Remove the first occurrence which would be incorrect
     html = html.replace('</tr>', '', 1)
     
     soup = BeautifulSoup(html, 'html.parser')
-    table = soup.find('table', class_='mdctable')
+    return soup.find('table', class_='mdctable')
+
+@metrics.timed('parse.find_table')
+def find_table(html, engine='fast'):
+    """
+    Find the mdctable in a page.
+
+    The 'fast' engine tokenizes only the table itself (see table_extractor)
+    and falls back to BeautifulSoup when it can't be sure of matching it;
+    'bs4' always parses the whole page with BeautifulSoup.
+    """
+    if engine == 'fast':
+        try:
+            table = find_mdctable(html)
+            metrics.count('parse.fast_pages')
+            return table
+        except FastPathUnsupported:
+            metrics.count('parse.fast_fallbacks')
+    elif engine != 'bs4':
+        raise ValueError(f"Unknown parse engine: {engine}")
+    metrics.count('parse.bs4_pages')
+    return find_table_bs4(html)
+
+@metrics.timed('parse.parse_table')
+def parse_table(html, source_url="", engine='fast'):
+    """Extract table data from HTML with handling for malformed tables"""
+    table = find_table(html, engine)
     
     if not table:
         return []
@@ -121,59 +155,296 @@ def parse_table(html, source_url=""):
     headers.append('Source URL')
     return [headers] + rows
 
-def write_to_csv(data, filename, append=False):
-    """Write or append data to CSV file"""
-    mode = 'a' if append else 'w'
-    
-    with open(filename, mode, newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerows(data)
-
-def main():
-    # Setup
-    cache_dir = 'cache'
-    csv_file = 'all-film-all-developer.csv'
-    os.makedirs(cache_dir, exist_ok=True)
-    
-    
-    # Get all links
-    links = read_links()
-    print(f"Found {len(links)} links to process")
+def parse_cached_page(url, cache, engine='fast'):
+    """Read a page from the cache and parse its table"""
+    return parse_table(read_cached_page(url, cache), url, engine)
+
+# Cache and engine used by each worker process of the parallel parse
+_worker_cache = None
+_worker_engine = 'fast'
+
+def _init_worker(cache_path, engine):
+    """Open a private cache handle in a parse worker process"""
+    global _worker_cache, _worker_engine
+    _worker_cache = open_cache(cache_path)
+    _worker_engine = engine
+
+def _parse_in_worker(url):
+    """Parse one page in a worker, returning (url, data, error) so failures cross the process boundary"""
+    try:
+        return url, parse_cached_page(url, _worker_cache, _worker_engine), None
+    except Exception as e:
+        return url, None, Exception(str(e))
+
+def parse_pages(links, cache_path, workers=1, chunksize=8, engine='fast'):
+    """
+    Parse every link, yielding (url, data, error) in link order.
+
+    With workers > 1 the pages are spread over a process pool; results
+    still come back in the original order, so the output is identical
+    to a serial run.
+    """
+    if workers <= 1:
+        cache = open_cache(cache_path)
+        try:
+            for url in links:
+                try:
+                    yield url, parse_cached_page(url, cache, engine), None
+                except Exception as e:
+                    yield url, None, e
+        finally:
+            cache.close()
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(cache_path, engine))
+    try:
+        yield from executor.map(_parse_in_worker, links, chunksize=chunksize)
+    finally:
+        # Don't wait for queued pages if the caller stopped early
+        executor.shutdown(cancel_futures=True)
+
+class ParseManifest:
+    """
+    Parse results from the last run, keyed by URL and the content hash of the page.
+
+    Each entry holds the hash of the cached body that was parsed and the
+    rows parse_table produced for it (headers first, like parse_table
+    returns them). A page whose hash is unchanged doesn't need parsing
+    again; its rows are reused as they are. The whole manifest is thrown
+    away when PARSER_VERSION changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('parser_version') == PARSER_VERSION:
+                self.entries = manifest['pages']
+
+    def lookup(self, url, digest):
+        """Return the stored rows for a page if it was parsed at this content hash, else None"""
+        entry = self.entries.get(url)
+        if entry and digest and entry['sha256'] == digest:
+            return entry['data']
+        return None
+
+    def record(self, url, digest, data):
+        """Remember the rows parsed from a page"""
+        self.entries[url] = {'sha256': digest, 'data': data}
+
+    def clear(self):
+        """Forget every page, forcing a full re-parse"""
+        self.entries = {}
+
+    def save(self, urls=None):
+        """Write the manifest to disk, keeping only `urls` if given"""
+        entries = self.entries
+        if urls is not None:
+            entries = {url: entries[url] for url in urls if url in entries}
+        tmp_file = f"{self.path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'parser_version': PARSER_VERSION, 'pages': entries}, f)
+        os.replace(tmp_file, self.path)
+
+def page_digest(url, cache):
+    """Content hash of a cached page, hashing the body for legacy files the cache has no hash for"""
+    digest = cache.digest(url)
+    if digest is None and cache.contains(url):
+        digest = encode_page(cache.get(url))[1]
+    return digest
+
+def normalize_cell(cell):
+    """A cell as duplicates are compared: stripped, inner whitespace collapsed and case folded"""
+    return ' '.join(cell.split()).casefold()
+
+def row_fingerprint(row):
+    """
+    Hash of a parsed row's cells other than its Source URL (the last one), which identifies duplicates.
+
+    Cells are normalized first (see normalize_cell), so copies of a row
+    that differ only in spacing or case have the same fingerprint.
+    """
+    return hashlib.blake2b('\x1f'.join(map(normalize_cell, row[:-1])).encode('utf-8'), digest_size=16).hexdigest()
+
+class DuplicateFilter:
+    """
+    Drop rows already parsed from another page, keeping a record of every page they were on.
+
+    Every chart record is reached from both its film's page and its
+    developer's page, so about half the parsed rows repeat an earlier
+    one apart from their Source URL (and at times spacing or case). Only the first copy goes to the main
+    output; each (fingerprint, Source URL) pair, the first copy's
+    included, goes to a sources table, so no provenance is lost. Without
+    a sources_file the other pages are simply forgotten.
+    """
+
+    def __init__(self, sources_file=None, batch_size=10000):
+        self.seen = set()
+        self.sources = None
+        if sources_file:
+            self.sources = TableWriter(sources_file, ['Fingerprint', 'Source URL'], batch_size=batch_size)
+        self.rows_in = 0
+        self.duplicates = 0
+
+    def filter(self, rows):
+        """Return the rows not seen before, recording where every row came from"""
+        unique = []
+        pairs = {}
+        for row in rows:
+            fingerprint = row_fingerprint(row)
+            pairs[(fingerprint, row[-1])] = None
+            if fingerprint not in self.seen:
+                self.seen.add(fingerprint)
+                unique.append(row)
+        if self.sources:
+            self.sources.write_rows(list(pairs))
+        self.rows_in += len(rows)
+        self.duplicates += len(rows) - len(unique)
+        metrics.count('parse.duplicates', len(rows) - len(unique))
+        return unique
+
+    def close(self):
+        if self.sources:
+            self.sources.close()
+
+def parse_pages_incremental(links, cache_path, manifest, workers=1, engine='fast'):
+    """
+    Like parse_pages, but reuse the manifest's rows for pages whose content hash hasn't changed.
+
+    Only new or changed pages are parsed; every parsed page is recorded
+    in the manifest, so the caller should save it afterwards. Results
+    come back in link order either way.
+    """
+    cache = open_cache(cache_path)
+    try:
+        digests = [page_digest(url, cache) for url in links]
+    finally:
+        cache.close()
+    reused = [manifest.lookup(url, digest) for url, digest in zip(links, digests)]
+    stale = [url for url, data in zip(links, reused) if data is None]
+    metrics.count('parse.reused_pages', len(links) - len(stale))
+    print(f"Reusing {len(links) - len(stale)} unchanged pages, parsing {len(stale)}")
+
+    parsed = parse_pages(stale, cache_path, workers, engine=engine)
+    try:
+        for url, digest, data in zip(links, digests, reused):
+            if data is not None:
+                yield url, data, None
+                continue
+            url, data, error = next(parsed)
+            if not error and digest:
+                manifest.record(url, digest, data)
+            yield url, data, error
+    finally:
+        parsed.close()
+
+def parse_all(links, cache_path, csv_file, workers=1, engine='fast', columnar_file=None, batch_size=10000,
+              manifest=None, sources_file=None):
+    """
+    Parse every cached page and write the rows to one CSV.
+
+    Rows are buffered and written batch_size at a time through a single
+    open file; pass columnar_file (.parquet or .arrow) to write them there too.
+    With a ParseManifest only new or changed pages are parsed and the
+    output is rebuilt from the stored rows of the rest. With sources_file,
+    rows repeated from another page are dropped and every page each row
+    was found on is listed there instead (see DuplicateFilter).
+    Returns False if a fatal error stopped it before the last page
+    (the rows parsed until then are kept), True otherwise.
+    """
+    if manifest is None:
+        results = parse_pages(links, cache_path, workers, engine=engine)
+    else:
+        results = parse_pages_incremental(links, cache_path, manifest, workers, engine)
+    writer = None
+    duplicates = DuplicateFilter(sources_file, batch_size) if sources_file else None
+    keep = duplicates.filter if duplicates else list
     
     # Process first page to get headers
     try:
-        first_url = links[0]
-        first_page = read_cached_page(first_url, cache_dir)
-        first_data = parse_table(first_page, first_url)
+        first_url, first_data, error = next(results)
+        if error:
+            raise error
         
         if not first_data:
             print(f"No table found on first page: {first_url}")
-            return
+            return False
         
         
         # Write headers and first page data
-        write_to_csv(first_data, csv_file)
+        writer = TableWriter(csv_file, first_data[0], columnar_file, batch_size)
+        writer.write_rows(keep(first_data[1:]))
+        metrics.count('parse.pages')
+        metrics.count('parse.rows', len(first_data) - 1)
         print(f"Processed page 1/{len(links)}: {first_url}")
         
         # Process remaining pages
-        for i, url in enumerate(links[1:], 2):
+        for i, (url, data, error) in enumerate(results, 2):
             try:
-                html = read_cached_page(url, cache_dir)
-                data = parse_table(html, url)
+                if error:
+                    raise error
                           
                 if data and len(data) > 1:  # Skip header row, append only data rows
-                    write_to_csv(data[1:], csv_file, append=True)
+                    writer.write_rows(keep(data[1:]))
+                    metrics.count('parse.pages')
+                    metrics.count('parse.rows', len(data) - 1)
                     print(f"Processed page {i}/{len(links)}: {url}")
                 else:
                     print(f"No table found on page {i}/{len(links)}: {url}")
+                    metrics.count('parse.empty_pages')
                     
             except Exception as e:
                 print(f"Error processing {url}: {e}")
+                metrics.count('parse.errors')
         
-        print(f"All done! Results saved to {csv_file}")
+        writer.close()
+        writer = None
+        if duplicates:
+            print(f"Kept {duplicates.rows_in - duplicates.duplicates} of {duplicates.rows_in} rows, "
+                  f"dropped {duplicates.duplicates} duplicates (sources in {sources_file})")
+        print(f"All done! Results saved to {csv_file}" + (f" and {columnar_file}" if columnar_file else ""))
+        return True
         
+    except StopIteration:
+        print("Fatal error: no links to process")
     except Exception as e:
         print(f"Fatal error: {e}")
+    finally:
+        results.close()
+        if writer:
+            # Keep the rows parsed before a fatal error
+            writer.close()
+        if duplicates:
+            duplicates.close()
+        if manifest is not None:
+            manifest.save(links)
+    return False
+
+def main(cache_path='cache', workers=1, engine='fast', columnar_file=None, manifest_file='parse_manifest.json',
+         full=False, keep_duplicates=False):
+    # Get all links
+    links = read_links()
+    print(f"Found {len(links)} links to process")
+    
+    manifest = ParseManifest(manifest_file)
+    if full:
+        manifest.clear()
+    sources_file = None if keep_duplicates else 'all-film-all-developer-sources.csv'
+    with metrics.timer('parse'):
+        return parse_all(links, cache_path, 'all-film-all-developer.csv', workers, engine, columnar_file,
+                         manifest=manifest, sources_file=sources_file)
+
+def run(args):
+    """Call main() with the options from cli.add_parse_arguments, returning False if parsing stopped early"""
+    return main(cache_path=args.cache, workers=args.workers, engine=args.engine, columnar_file=args.columnar,
+                manifest_file=args.manifest, full=args.full, keep_duplicates=args.keep_duplicates)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Parse cached chart pages into a CSV")
+    cli.add_parse_arguments(parser)
+    args = parser.parse_args()
+    with metrics.run_report('parse_tables', args.metrics, args.profile):
+        run(args)
\ No newline at end of file
@@ -0,0 +1,354 @@
+"""
+Run the whole refresh (search, download, parse, clean) as one pipeline.
+
+The stages run at the same time and hand work to each other through
+bounded queues: links go to the download threads as soon as a search
+finds them, pages go to a parse process pool as soon as they are
+cached, and parsed rows are cleaned in batches as they arrive. Parsing
+and cleaning overlap with the network-bound stages instead of waiting
+for them, and a slow stage makes the ones feeding it wait rather than
+letting work pile up in memory.
+
+The page cache is filled as usual, so the separate scripts can carry on
+from it; the files they pass between them (unique_links.txt, the raw
+CSV and its sources table) are optional outputs here.
+"""
+import time
+import queue
+import asyncio
+import argparse
+import threading
+import requests
+import metrics
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import get_urls
+import clean_data
+import parse_tables
+import download_tables
+from chart_store import build_store
+from compensation import build_tables
+from changelog import update_changelog
+from page_cache import open_cache, MAX_AGE_DAYS
+from table_writer import TableWriter, rows_to_frame
+
+# Put on a queue by a stage worker when it has no more output
+DONE = None
+
+class StageClock:
+    """Record when each stage finished, relative to the start of the run"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.finished = {}
+        self.lock = threading.Lock()
+
+    def finish(self, stage):
+        with self.lock:
+            self.finished[stage] = time.perf_counter() - self.start
+
+def start_stage(target, *args, errors):
+    """Run a stage in a daemon thread, keeping any exception for the main thread to raise"""
+    def run():
+        try:
+            target(*args)
+        except Exception as e:
+            errors.append(e)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def search_stage(url_queue, consumers, clock, search_url, concurrency, rate, links_file):
+    """Search the site (see get_urls.expand_queries), queueing each new chart link for download as it is found"""
+    seen = set()
+
+    def on_result(query, links):
+        for link in links:
+            # Skip links containing "JavaScript"
+            if "javascript" in link.lower() or link in seen:
+                continue
+            seen.add(link)
+            url_queue.put(link)
+
+    try:
+        _, stats = asyncio.run(get_urls.expand_queries(search_url, max_concurrency=concurrency, rate=rate,
+                                                       on_result=on_result))
+        if stats['failed']:
+            print(f"{len(stats['failed'])} queries failed after retries: {', '.join(stats['failed'])}")
+    finally:
+        for _ in range(consumers):
+            url_queue.put(DONE)
+    if links_file:
+        with open(links_file, 'w') as f:
+            for link in sorted(seen):
+                f.write(f"{link}\n")
+    clock.finish('search')
+
+def link_stage(url_queue, consumers, clock, links):
+    """Queue a known list of links instead of searching for them"""
+    try:
+        for link in links:
+            url_queue.put(link)
+    finally:
+        for _ in range(consumers):
+            url_queue.put(DONE)
+    clock.finish('search')
+
+def download_stage(url_queue, page_queue, cache, session, limiter, counts, clock, max_age_days, max_retries=3,
+                   backoff=2.0):
+    """Download (or revalidate) each queued link into the cache and pass it on for parsing"""
+    # Pages this worker stored since it last saved the cache index
+    since_checkpoint = 0
+    try:
+        for url in iter(url_queue.get, DONE):
+            if cache.is_fresh(url, max_age_days):
+                counts.add('cached')
+                metrics.count('cache.fresh')
+                page_queue.put(url)
+                continue
+            for attempt in range(max_retries):
+                try:
+                    limiter.wait()
+                    status, _ = download_tables.refresh_page(url, cache, session)
+                except (requests.RequestException, UnicodeError) as e:
+                    print(f"Attempt {attempt+1} failed for {url}: {e}")
+                    if attempt + 1 < max_retries:
+                        metrics.count('download.retries')
+                        # Exponential backoff
+                        time.sleep(backoff * (2 ** attempt))
+                    continue
+                counts.add(status)
+                # Checkpoint the index so an interrupted run keeps its progress
+                since_checkpoint += 1
+                if since_checkpoint >= download_tables.CHECKPOINT_PAGES:
+                    cache.save()
+                    since_checkpoint = 0
+                page_queue.put(url)
+                break
+            else:
+                counts.add('failed')
+                metrics.count('download.failed')
+                # Parse the copy from an earlier run, as parse_tables.py would
+                if cache.contains(url):
+                    page_queue.put(url)
+    finally:
+        page_queue.put(DONE)
+    clock.finish('download')
+
+def parse_stage(page_queue, row_queue, producers, cache, clock, workers, engine):
+    """
+    Parse each downloaded page in a process pool, queueing (url, data, error) as pages finish.
+
+    Pages are read from the cache here and sent to the workers, so they
+    never need to see the cache index the downloads are still updating.
+    At most two pages per worker are in flight.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            url = pending.pop(future)
+            try:
+                row_queue.put((url, future.result(), None))
+            except Exception as e:
+                row_queue.put((url, None, e))
+
+    try:
+        finished = 0
+        while finished < producers:
+            url = page_queue.get()
+            if url is DONE:
+                finished += 1
+                continue
+            with metrics.timer('cache.read'):
+                html = cache.get(url)
+            pending[executor.submit(parse_tables.parse_table, html, url, engine)] = url
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(wait(pending).done)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        row_queue.put(DONE)
+    clock.finish('parse')
+
+class Counts:
+    """Thread-safe tallies of download outcomes"""
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add(self, key):
+        """Count one outcome"""
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+def run_pipeline(cache_path='cache', output_file='valid_all-film-all-developer.csv', invalid_file='invalid_data.csv',
+                 links=None, search_url=get_urls.SEARCH_URL, search_concurrency=16, search_rate=10.0,
+                 download_workers=4, rate=1.0, parse_workers=1, engine='fast', clean_batch=50000,
+                 links_file=None, raw_file=None, sources_file=None, keep_duplicates=False,
+                 max_age_days=MAX_AGE_DAYS, queue_size=1000, store_file=None, name_map=None,
+                 compensation_file=None, changes_file=None, parse_cache=None):
+    """
+    Search, download, parse and clean with every stage running at once, returning a summary.
+
+    With `links` the search is skipped and those URLs are used. Cleaning
+    happens in batches of clean_batch rows (see clean_data.CleanStream),
+    so the output matches clean_data.py on the same rows; rows come in
+    the order pages finish, not link order. links_file, raw_file and
+    sources_file write the intermediate files the separate scripts use.
+    Repeated rows are dropped as in parse_tables.py unless keep_duplicates.
+    With name_map, film and developer names are normalized as in
+    clean_data.py (see name_index.py), and with parse_cache parsed strings
+    are kept for the next run (see parse_cache.py). With store_file the cleaned rows
+    are also loaded into a chart_store, with compensation_file their
+    time/ISO/temperature curves are fitted (see compensation.py), and
+    with changes_file what changed since the last run is written there
+    (see changelog.py).
+    """
+    clock = StageClock()
+    cache = open_cache(cache_path)
+    session = download_tables.make_session(download_workers)
+    counts = Counts()
+    errors = []
+    url_queue = queue.Queue(queue_size)
+    page_queue = queue.Queue(queue_size)
+    row_queue = queue.Queue(queue_size)
+
+    if links is None:
+        start_stage(search_stage, url_queue, download_workers, clock, search_url, search_concurrency,
+                    search_rate, links_file, errors=errors)
+    else:
+        start_stage(link_stage, url_queue, download_workers, clock, links, errors=errors)
+    limiter = download_tables.RateLimiter(rate)
+    for _ in range(download_workers):
+        start_stage(download_stage, url_queue, page_queue, cache, session, limiter, counts, clock, max_age_days,
+                    errors=errors)
+    start_stage(parse_stage, page_queue, row_queue, download_workers, cache, clock, parse_workers, engine,
+                errors=errors)
+
+    # Write and clean parsed rows here as they arrive
+    cleaner = clean_data.CleanStream(invalid_file, name_map, parse_cache)
+    duplicates = None if keep_duplicates else parse_tables.DuplicateFilter(sources_file)
+    writer = None
+    headers = None
+    batch = []
+    pages = 0
+    try:
+        for url, data, error in iter(row_queue.get, DONE):
+            if error:
+                print(f"Error processing {url}: {error}")
+                metrics.count('parse.errors')
+                continue
+            if not data or len(data) < 2:
+                print(f"No table found on page: {url}")
+                metrics.count('parse.empty_pages')
+                continue
+            pages += 1
+            metrics.count('parse.pages')
+            metrics.count('parse.rows', len(data) - 1)
+            if headers is None:
+                headers = data[0]
+                writer = TableWriter(raw_file, headers) if raw_file else None
+            rows = duplicates.filter(data[1:]) if duplicates else data[1:]
+            if writer:
+                writer.write_rows(rows)
+            batch.extend(rows)
+            if len(batch) >= clean_batch:
+                cleaner.add(rows_to_frame(batch, headers, clean_data.RAW_DTYPES))
+                batch = []
+        if batch:
+            cleaner.add(rows_to_frame(batch, headers, clean_data.RAW_DTYPES))
+    finally:
+        if writer:
+            writer.close()
+        if duplicates:
+            duplicates.close()
+        session.close()
+        # The directory cache only writes its index when saved
+        cache.save()
+        cache.close()
+    if errors:
+        raise errors[0]
+    results = cleaner.finish(output_file)
+    clock.finish('clean')
+    metrics.count('clean.rows', results['original_rows'])
+    metrics.count('clean.valid_rows', results['valid_rows'])
+    if store_file:
+        build_store(output_file, store_file)
+        clock.finish('store')
+    if compensation_file:
+        build_tables(output_file, compensation_file)
+        clock.finish('compensation')
+    if changes_file:
+        results['changes'] = update_changelog(output_file, changes_file)
+        clock.finish('changes')
+    # Stages overlap, so each one's time is from the start of the run until it finished
+    for stage, seconds in clock.finished.items():
+        metrics.METRICS.add_time(stage, seconds)
+
+    results.update({
+        'pages_parsed': pages,
+        'downloads': dict(counts.counts),
+        'duplicates_dropped': duplicates.duplicates if duplicates else 0,
+        'stage_finished': clock.finished,
+        'seconds': time.perf_counter() - clock.start
+    })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search, download, parse and clean the charts in one pipelined run")
+    parser.add_argument('--cache', default='cache', help="cache directory, or a .sqlite file for a single-file archive")
+    parser.add_argument('--links', help="read chart URLs from this file instead of searching for them")
+    parser.add_argument('--search-concurrency', type=int, default=16, help="most searches in flight at once")
+    parser.add_argument('--search-rate', type=float, default=10.0, help="maximum searches started per second")
+    parser.add_argument('--workers', type=int, default=4, help="number of concurrent downloads")
+    parser.add_argument('--rate', type=float, default=1.0, help="maximum downloads per second across all workers")
+    parser.add_argument('--parse-workers', type=int, default=1, help="number of parse processes")
+    parser.add_argument('--engine', choices=['fast', 'bs4'], default='fast', help="table extractor, as in parse_tables.py")
+    parser.add_argument('--save-links', help="also write the chart URLs found to this file (like unique_links.txt)")
+    parser.add_argument('--save-raw', help="also write the parsed rows to this CSV (like all-film-all-developer.csv)")
+    parser.add_argument('--save-sources', help="also write every page each row was found on to this CSV")
+    parser.add_argument('--store', help="also build the indexed chart store (see chart_store.py) at this path")
+    parser.add_argument('--compensation', help="also fit the compensation curves (see compensation.py) into this file")
+    parser.add_argument('--changes', help="also write what changed since the last run (see changelog.py) to this file")
+    parser.add_argument('--name-map',
+                        help="normalize film/developer names, caching the mapping of name variants to canonical "
+                             "names in this file, e.g. name_map.json (see name_index.py); opt-in, off by default "
+                             "until the matching rules have been checked against the real developer list")
+    parser.add_argument('--no-normalize', action='store_true', help="keep film and developer names as scraped "
+                        "even with --name-map")
+    parser.add_argument('--parse-cache', default='parse_cache.json',
+                        help="cached parses of ISO, time and temperature strings, as in clean_data.py")
+    parser.add_argument('--no-parse-cache', action='store_true', help="parse every string again and don't save them")
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help="keep rows already found on another page (they are dropped when cleaning anyway)")
+    parser.add_argument('--metrics', default='pipeline_metrics.json',
+                        help="where to write the run's timings and counts")
+    parser.add_argument('--profile', help="profile the run with cProfile and dump the profile to this file")
+    args = parser.parse_args()
+
+    links = None
+    if args.links:
+        with open(args.links, 'r') as f:
+            links = [line.strip() for line in f if line.strip()]
+    with metrics.run_report('pipeline', args.metrics, args.profile):
+        results = run_pipeline(args.cache, links=links, search_concurrency=args.search_concurrency,
+                               search_rate=args.search_rate, download_workers=args.workers, rate=args.rate,
+                               parse_workers=args.parse_workers, engine=args.engine, links_file=args.save_links,
+                               raw_file=args.save_raw, sources_file=args.save_sources,
+                               keep_duplicates=args.keep_duplicates, store_file=args.store,
+                               name_map=None if args.no_normalize else args.name_map,
+                               compensation_file=args.compensation, changes_file=args.changes,
+                               parse_cache=None if args.no_parse_cache else args.parse_cache)
+    print(f"Parsed {results['pages_parsed']} pages, downloads: {results['downloads']}")
+    print(f"Cleaned dataset: {results['valid_rows']} rows, invalid data: {results['invalid_rows']} rows, "
+          f"{results['duplicates_dropped']} duplicates dropped while parsing, "
+          f"{results['names_normalized']} rows with names normalized")
+    if 'changes' in results:
+        changes = results['changes']
+        print(f"Changes since the last run: {changes['added']} rows added, {changes['removed']} removed, "
+              f"{changes['modified']} modified")
+    for stage, seconds in results['stage_finished'].items():
+        print(f"{stage:>10} finished after {seconds:.1f}s")
@@ -0,0 +1,286 @@
+"""
+Fast extraction of the mdctable from a chart page.
+
+parse_table's original path runs BeautifulSoup over the whole page to
+find one table. This module finds where the table starts with a regex
+and tokenizes only from there to its closing tag, building a minimal
+element tree that follows the same rules as BeautifulSoup's html.parser
+tree builder (same tokenizer, same tag nesting and whitespace handling).
+The elements answer the few calls parse_table makes (find, find_all,
+text, has_attr, [...]), so the row extraction code is shared.
+
+When something before the table could change how BeautifulSoup would
+build it (open <tr> tags, unclosed scripts or comments, numeric
+character references...), find_mdctable raises FastPathUnsupported and
+the caller falls back to BeautifulSoup.
+"""
+import re
+from html.parser import HTMLParser
+
+# Element classes as BeautifulSoup's html.parser tree builder defines them
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image',
+    'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source',
+    'spacer', 'track', 'wbr'
+])
+PRESERVE_WHITESPACE_TAGS = frozenset(['pre', 'textarea'])
+# Text inside these is not a plain string, so .text leaves it out
+STRING_CONTAINER_TAGS = frozenset(['rt', 'rp', 'style', 'script', 'template'])
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+TABLE_START = re.compile(r'<table[\t\n\r\f />]', re.IGNORECASE)
+START_TAG = re.compile(r'''<table(?:[^>"']|"[^"]*"|'[^']*')*>''', re.IGNORECASE)
+# Prefix regions html.parser doesn't turn into elements
+# (each region ends at the earliest point any html.parser version would end it)
+HIDDEN_REGIONS = re.compile(
+    r'<script[\t\n\r\f />].*?</\s*script(?:[\t\n\r\f /][^>]*)?>'
+    r'|<style[\t\n\r\f />].*?</\s*style(?:[\t\n\r\f /][^>]*)?>'
+    r'|<!--(?:-?>|.*?--!?\s*>)|<title[\t\n\r\f />][^<]*</title\s*>',
+    re.IGNORECASE | re.DOTALL
+)
+# Anything left in the prefix that could change how the table is built
+UNSAFE_PREFIX = re.compile(
+    r'</?tr[\t\n\r\f />]|<!--|<!\[|'
+    r'<(?:pre|textarea|template|rt|rp|script|style|title|xmp|iframe|noembed|noframes|plaintext)[\t\n\r\f />]',
+    re.IGNORECASE
+)
+
+class FastPathUnsupported(Exception):
+    """The fast extractor can't guarantee BeautifulSoup's result for this page"""
+
+class _TableClosed(Exception):
+    """Raised by the tree builder once the table's end tag has been seen"""
+
+class Element:
+    """Minimal stand-in for a BeautifulSoup Tag"""
+
+    __slots__ = ('name', 'attrs', 'contents')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.contents = []
+
+    def descendants(self):
+        """Yield descendant elements in document order"""
+        stack = [iter(self.contents)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, Element):
+                    yield child
+                    stack.append(iter(child.contents))
+                    break
+            else:
+                stack.pop()
+
+    def find_all(self, name):
+        """All descendant elements with a tag name"""
+        return [element for element in self.descendants() if element.name == name]
+
+    def find(self, name):
+        """The first descendant element with a tag name, or None"""
+        for element in self.descendants():
+            if element.name == name:
+                return element
+        return None
+
+    @property
+    def text(self):
+        """All the text inside this element"""
+        parts = []
+        stack = [iter(self.contents)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, Element):
+                    stack.append(iter(child.contents))
+                    break
+                parts.append(child)
+            else:
+                stack.pop()
+        return ''.join(parts)
+
+    def has_attr(self, key):
+        return key in self.attrs
+
+    def __getitem__(self, key):
+        return self.attrs[key]
+
+class TableTreeBuilder(HTMLParser):
+    """Build the tree for one table the way BeautifulSoup's html.parser builder would"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.root = Element('[document]', {})
+        self.stack = [self.root]
+        self.open_counts = {}
+        self.preserve_depth = 0
+        self.container_depth = 0
+        self.data = []
+        self.already_closed = []
+        self.table = None
+
+    def end_data(self, plain=True):
+        """Turn buffered text into a string node, dropping strings .text would skip"""
+        if not self.data:
+            return
+        data = ''.join(self.data)
+        self.data = []
+        if not self.preserve_depth and not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        if plain and not self.container_depth:
+            self.stack[-1].contents.append(data)
+
+    def push(self, element):
+        self.stack[-1].contents.append(element)
+        self.stack.append(element)
+        self.open_counts[element.name] = self.open_counts.get(element.name, 0) + 1
+        if element.name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+        if element.name in STRING_CONTAINER_TAGS:
+            self.container_depth += 1
+
+    def pop(self):
+        element = self.stack.pop()
+        self.open_counts[element.name] -= 1
+        if element.name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth -= 1
+        if element.name in STRING_CONTAINER_TAGS:
+            self.container_depth -= 1
+        if element is self.table:
+            raise _TableClosed()
+
+    def pop_to(self, name):
+        if not self.open_counts.get(name):
+            # Before the table this end tag might have matched something, so
+            # only a stray </tr> (which the <tr> fix-up creates) is known to be harmless
+            if name != 'tr' and name not in VOID_ELEMENTS:
+                raise FastPathUnsupported(f"unmatched </{name}> inside the table")
+            return
+        while True:
+            element = self.stack[-1]
+            self.pop()
+            if element.name == name:
+                return
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.end_data()
+        attr_dict = {}
+        for key, value in attrs:
+            attr_dict[key] = '' if value is None else value
+        element = Element(tag, attr_dict)
+        self.push(element)
+        if self.table is None:
+            self.table = element
+        if tag in VOID_ELEMENTS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed:
+            self.already_closed.remove(tag)
+        else:
+            self.end_data()
+            self.pop_to(tag)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_entityref(self, name):
+        # bs4's entity table, so entities decode as BeautifulSoup decodes them; importing it loads all of bs4
+        from bs4.dammit import EntitySubstitution
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_charref(self, name):
+        raise FastPathUnsupported("numeric character reference")
+
+    def handle_comment(self, data):
+        self.end_data()
+
+    def handle_decl(self, decl):
+        self.end_data()
+
+    def handle_pi(self, data):
+        self.end_data()
+
+    def unknown_decl(self, data):
+        self.end_data()
+        if data.upper().startswith('CDATA['):
+            self.data.append(data[len('CDATA['):])
+            # CDATA sections count as text wherever they are
+            container_depth, self.container_depth = self.container_depth, 0
+            self.end_data()
+            self.container_depth = container_depth
+        else:
+            self.data.append(data)
+            self.end_data(plain=False)
+
+def has_mdctable_class(start_tag):
+    """Check the class attribute of a <table ...> start tag for mdctable"""
+    found = []
+
+    class TagReader(HTMLParser):
+        def handle_starttag(self, tag, attrs):
+            found.append(attrs)
+
+        def handle_startendtag(self, tag, attrs):
+            found.append(attrs)
+
+    reader = TagReader(convert_charrefs=False)
+    reader.feed(start_tag)
+    reader.close()
+    if len(found) != 1:
+        raise FastPathUnsupported("unusual table start tag")
+    classes = ''
+    for key, value in found[0]:
+        if key == 'class':
+            classes = value or ''
+    return 'mdctable' in classes.split() or classes == 'mdctable'
+
+def find_table_start(html):
+    """Return the offset of the first <table class="mdctable"> start tag, or None"""
+    for match in TABLE_START.finditer(html):
+        tag = START_TAG.match(html, match.start())
+        if tag is None:
+            raise FastPathUnsupported("unterminated table start tag")
+        if has_mdctable_class(tag.group()):
+            return match.start()
+    return None
+
+def find_mdctable(html):
+    """
+    Find the mdctable and build its element tree, or return None if the page has none.
+
+    The page text gets the same <tr> fix-up parse_table applies (a </tr>
+    before every <tr>, minus the first </tr> in the page) before the
+    table is tokenized.
+    """
+    start = find_table_start(html)
+    if start is None:
+        return None
+
+    prefix = html[:start]
+    visible = HIDDEN_REGIONS.sub('', prefix)
+    if UNSAFE_PREFIX.search(visible):
+        raise FastPathUnsupported("markup before the table affects it")
+    if visible.rfind('<') > visible.rfind('>'):
+        raise FastPathUnsupported("table start tag may be inside another tag")
+
+    fragment = html[start:].replace('<tr>', '</tr><tr>')
+    # The page's first </tr> is removed by the fix-up: it's only in the table if the prefix has none
+    if '<tr>' not in prefix and '</tr>' not in prefix:
+        fragment = fragment.replace('</tr>', '', 1)
+
+    builder = TableTreeBuilder()
+    try:
+        builder.feed(fragment)
+        builder.close()
+    except _TableClosed:
+        pass
+    else:
+        builder.end_data()
+    return builder.table
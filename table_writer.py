@@ -0,0 +1,179 @@
+"""
+Streaming output for parsed chart rows.
+
+TableWriter keeps the CSV open for the whole run and writes rows in
+batches instead of reopening the file for every page. It can also write
+the same rows to a Parquet or Arrow IPC file (picked by extension), so
+clean_data.py can load them without parsing CSV text. Columnar output
+needs pyarrow; every column is stored as a string, exactly as it
+appears in the CSV.
+"""
+import csv
+import metrics
+
+COLUMNAR_EXTENSIONS = ('.parquet', '.arrow', '.feather')
+# Cell texts read_csv turns into NaN by default, applied to columnar files too
+NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA',
+    'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+def apply_dtypes(df, dtype):
+    """Give columnar data (all strings) the dtypes read_csv's dtype argument would, a type or {column: type}"""
+    if dtype is None:
+        return df
+    if isinstance(dtype, dict):
+        # A defaultdict's default would be str, which the columns already are
+        dtype = {column: dtype[column] for column in df.columns if column in dtype}
+    return df.astype(dtype)
+
+def normalize_strings(df, dtype=None):
+    """Turn NA_VALUES cells of an all-string frame into NaN and apply `dtype`, as read_csv would"""
+    return apply_dtypes(df.replace(NA_VALUES, float('nan')), dtype)
+
+def rows_to_frame(rows, headers, dtype=None):
+    """Build a DataFrame from parsed rows the way read_table would load them back from the written file"""
+    import pandas as pd
+    return normalize_strings(pd.DataFrame(rows, columns=headers), dtype)
+
+@metrics.timed('read.table')
+def read_table(filename, **kwargs):
+    """
+    Load a parsed-rows file into a DataFrame: CSV, Parquet or Arrow IPC by extension.
+
+    Keyword arguments go to read_csv. Columnar files hold the raw strings,
+    so empty cells (and the other NA_VALUES) are turned into NaN and a
+    `dtype` argument is applied, to match what read_csv produces.
+    """
+    import pandas as pd
+    if filename.endswith('.parquet'):
+        df = pd.read_parquet(filename)
+    elif filename.endswith(('.arrow', '.feather')):
+        df = pd.read_feather(filename)
+    else:
+        return pd.read_csv(filename, **kwargs)
+    return normalize_strings(df, kwargs.get('dtype'))
+
+def read_table_chunks(filename, chunksize, **kwargs):
+    """
+    Yield a parsed-rows file as DataFrames of about chunksize rows, like read_table would load it.
+
+    CSV is read with read_csv's chunksize; Parquet and Arrow IPC files
+    are read batch by batch, so only one chunk is in memory at a time.
+    """
+    import pandas as pd
+    if not filename.endswith(COLUMNAR_EXTENSIONS):
+        with pd.read_csv(filename, chunksize=chunksize, **kwargs) as reader:
+            yield from reader
+        return
+
+    import pyarrow as pa
+    if filename.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(filename).iter_batches(batch_size=chunksize)
+    else:
+        reader = pa.ipc.open_file(filename)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+    def to_frame(pending, start):
+        chunk = pa.Table.from_batches(pending).to_pandas()
+        # Number rows across chunks like read_csv does
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        return normalize_strings(chunk, kwargs.get('dtype'))
+
+    pending, pending_rows, start = [], 0, 0
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= chunksize:
+            yield to_frame(pending, start)
+            start += pending_rows
+            pending, pending_rows = [], 0
+    if pending:
+        yield to_frame(pending, start)
+
+class ColumnarWriter:
+    """Write batches of string rows to a Parquet or Arrow IPC file"""
+
+    def __init__(self, filename, headers):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise Exception("Writing Parquet or Arrow output requires pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.headers = list(headers)
+        self.schema = pa.schema([pa.field(name, pa.string()) for name in self.headers])
+        if filename.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(filename, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(filename, self.schema)
+
+    def write_rows(self, rows):
+        """Write one batch of rows (a Parquet row group or an Arrow record batch)"""
+        columns = [self.pa.array([row[i] for row in rows], self.pa.string()) for i in range(len(self.headers))]
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+class TableWriter:
+    """
+    Buffer parsed rows and write them out in batches.
+
+    The header row is written when the writer is opened; rows passed to
+    write_rows() are held until batch_size of them have accumulated, then
+    go to the CSV (and the columnar file, if any) in one call. close()
+    flushes whatever is left, so use it as a context manager.
+    """
+
+    def __init__(self, csv_file, headers, columnar_file=None, batch_size=10000):
+        self.batch_size = batch_size
+        self.buffer = []
+        self.rows_written = 0
+        if columnar_file and not columnar_file.endswith(COLUMNAR_EXTENSIONS):
+            raise ValueError(f"Columnar output must end in one of {', '.join(COLUMNAR_EXTENSIONS)}: {columnar_file}")
+        # The columnar writer first: it fails without pyarrow, and the CSV would be left open
+        self.columnar = ColumnarWriter(columnar_file, headers) if columnar_file else None
+        try:
+            self.file = open(csv_file, 'w', newline='', encoding='utf-8')
+        except BaseException:
+            if self.columnar:
+                self.columnar.close()
+            raise
+        self.csv_writer = csv.writer(self.file)
+        self.csv_writer.writerow(headers)
+
+    def write_rows(self, rows):
+        """Queue rows for writing, flushing once a full batch is buffered"""
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows"""
+        if not self.buffer:
+            return
+        with metrics.timer('write.csv'):
+            self.csv_writer.writerows(self.buffer)
+        if self.columnar:
+            with metrics.timer('write.columnar'):
+                self.columnar.write_rows(self.buffer)
+        metrics.count('write.rows', len(self.buffer))
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        """Flush remaining rows and close the output files"""
+        try:
+            self.flush()
+        finally:
+            self.file.close()
+            if self.columnar:
+                self.columnar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,128 @@
+"""
+Persistent state of the search queries and page downloads, so an interrupted run can resume.
+
+Each work item is a (kind, key) pair, such as ('search', 'ab') or
+('download', url), with a state (pending, done or failed), the number of
+attempts made so far, the last error and, for searches, the result. Every
+change is committed as it happens, so after a crash or a kill the next
+run knows exactly which items finished:
+
+    with WorkQueue('work_queue.sqlite') as queue:
+        queue.add('download', links)
+        for url in queue.unfinished('download', links):
+            ...
+            queue.finish('download', url)   # or queue.fail('download', url, error)
+
+get_urls.py and download_tables.py share one file. A run that finishes
+with no failures clears its items, so the next refresh starts over; one
+that was interrupted, or left failures behind, keeps them, and the next
+run skips what is done and only works on the rest.
+"""
+import json
+import time
+import sqlite3
+import threading
+
+STATES = ('pending', 'done', 'failed')
+
+class WorkQueue:
+    """Work item states in a SQLite file, safe to update from several threads"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                result TEXT,
+                updated REAL,
+                PRIMARY KEY (kind, key)
+            )""")
+        self.conn.commit()
+
+    def add(self, kind, keys):
+        """Add items as pending, leaving ones already in the queue as they are; returns how many were new"""
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO items (kind, key, updated) VALUES (?, ?, ?)",
+                                  [(kind, key, time.time()) for key in keys])
+            self.conn.commit()
+            return self.conn.total_changes - before
+
+    def states(self, kind):
+        """{key: state} of every item of a kind"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT key, state FROM items WHERE kind = ?", (kind,)))
+
+    def unfinished(self, kind, keys):
+        """The keys, in order, that aren't done yet: new, pending (interrupted) or failed"""
+        states = self.states(kind)
+        return [key for key in keys if states.get(key) != 'done']
+
+    def results(self, kind):
+        """{key: result} of every done item of a kind"""
+        with self.lock:
+            rows = self.conn.execute("SELECT key, result FROM items WHERE kind = ? AND state = 'done'", (kind,))
+            return {key: json.loads(result) if result is not None else None for key, result in rows}
+
+    def update_many(self, kind, outcomes):
+        """Record (key, state, attempts, error, result) outcomes in one commit, adding items that are new"""
+        now = time.time()
+        rows = [(kind, key, state, attempts, None if error is None else str(error),
+                 None if result is None else json.dumps(result), now)
+                for key, state, attempts, error, result in outcomes]
+        with self.lock:
+            self.conn.executemany("""
+                INSERT INTO items (kind, key, state, attempts, error, result, updated) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (kind, key) DO UPDATE SET
+                    state = excluded.state, attempts = attempts + excluded.attempts, error = excluded.error,
+                    result = excluded.result, updated = excluded.updated""", rows)
+            self.conn.commit()
+
+    def finish(self, kind, key, result=None, attempts=1):
+        """Mark an item done, keeping its result (anything JSON can store)"""
+        self.update_many(kind, [(key, 'done', attempts, None, result)])
+
+    def finish_all(self, kind, keys_attempts):
+        """Mark many (key, attempts) items done at once"""
+        self.update_many(kind, [(key, 'done', attempts, None, None) for key, attempts in keys_attempts])
+
+    def fail(self, kind, key, error=None, attempts=1):
+        """Mark an item failed after `attempts` more tries, so the next run retries it"""
+        self.update_many(kind, [(key, 'failed', attempts, error, None)])
+
+    def failures(self, kind):
+        """{key: (attempts, last error)} of every failed item of a kind"""
+        with self.lock:
+            rows = self.conn.execute("SELECT key, attempts, error FROM items WHERE kind = ? AND state = 'failed'",
+                                     (kind,))
+            return {key: (attempts, error) for key, attempts, error in rows}
+
+    def counts(self, kind):
+        """Number of items of a kind in each state"""
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM items WHERE kind = ? GROUP BY state",
+                                            (kind,)))
+        return {state: counts.get(state, 0) for state in STATES}
+
+    def clear(self, kind):
+        """Forget every item of a kind"""
+        with self.lock:
+            self.conn.execute("DELETE FROM items WHERE kind = ?", (kind,))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()